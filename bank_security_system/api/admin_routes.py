@@ -1,18 +1,51 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from bson import json_util
+import json
+from itertools import chain
 from services.rbac import role_required, admin_service
+from services.db_routing import read_only
 from services.user_service import UserService
 from services.audit import audit_log
+from services.audit_query import AuditQuery
+from services.audit_rollups import RollupQuery
+from services.user_query import UserListQuery, serialize as serialize_user
+from services.batch_files import BATCH_FORMATS
 from models.user import User
 
 admin_bp = Blueprint('admin', __name__)
 
 @admin_bp.route('/users', methods=['GET'])
 @role_required('admin')
+@read_only
 def get_all_users():
-    """获取所有用户信息（管理员专属）"""
-    users = UserService.get_all_users()
+    """分页查询用户（?role=&start=&end=&limit=，?cursor= 取下一页）"""
+    try:
+        query = UserListQuery.from_args(request.args.to_dict())
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    users = query.page()
     audit_log(action='query_users', resource='user_list')
-    return jsonify([user.to_dict() for user in users])
+    return jsonify(items=[serialize_user(user) for user in users], next_cursor=query.next_cursor)
+
+@admin_bp.route('/users/export', methods=['GET'])
+@role_required('admin')
+@read_only
+def export_users():
+    """以 NDJSON 流式导出用户及角色（人事对账）"""
+    args = request.args.to_dict()
+    args.pop('limit', None)
+    args.pop('cursor', None)
+    try:
+        query = UserListQuery.from_args(args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    audit_log(action='export_users', resource='user_list')
+
+    def generate():
+        for user in query.iter_all():
+            yield json.dumps(serialize_user(user)) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @admin_bp.route('/users', methods=['POST'])
 @role_required('admin')
@@ -31,6 +64,38 @@ def create_user():
     audit_log(action='create_user', resource=f"user:{user.id}")
     return jsonify(user.to_dict()), 201
 
+@admin_bp.route('/users/import', methods=['POST'])
+@role_required('admin')
+def import_users():
+    """批量开户（CSV 或 NDJSON，列 username,password,roles；多个角色以分号分隔）
+
+    整个批次先校验，再分组哈希口令并提交；响应以 NDJSON 流式输出每行结果，最后一行为汇总。
+    """
+    fmt = BATCH_FORMATS.get(request.mimetype)
+    if fmt is None:
+        return jsonify(error="Content-Type must be text/csv or application/x-ndjson"), 415
+
+    importer = current_app.extensions['services']['bulk_users']
+    try:
+        rows, results = importer.prepare(request.get_data(as_text=True), fmt)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    def generate():
+        summary = {'created': 0, 'rejected': 0, 'failed': 0}
+        for chunk in chain([results], importer.process(rows)):
+            created = [r['user_id'] for r in chunk if r['status'] == 'created']
+            if created:
+                # 每组一条审计记录
+                audit_log(action='bulk_create_users', resource=f"users:{min(created)}-{max(created)}",
+                          sensitive_data={'count': len(created)})
+            for result in chunk:
+                summary[result['status']] += 1
+                yield json.dumps(result) + "\n"
+        yield json.dumps({'summary': summary}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @admin_bp.route('/users/<int:user_id>', methods=['PUT'])
 @role_required('admin')
 def update_user(user_id):
@@ -58,7 +123,58 @@ def delete_user(user_id):
 @admin_bp.route('/audit-logs', methods=['GET'])
 @role_required('admin')
 def get_audit_logs():
-    """查询审计日志"""
-    params = request.args.to_dict()
-    logs = admin_service.query_audit_logs(params)
-    return jsonify(logs)
\ No newline at end of file
+    """查询审计日志（键集分页，?cursor= 取下一页）"""
+    try:
+        query = AuditQuery.from_args(request.args.to_dict())
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    audit = current_app.extensions['services']['audit']
+    page = audit.query_logs(query)
+    return current_app.response_class(
+        json_util.dumps({'items': page['items'], 'next_cursor': page['next_cursor']}),
+        mimetype='application/json'
+    )
+
+@admin_bp.route('/audit-logs/export', methods=['GET'])
+@role_required('admin')
+def export_audit_logs():
+    """以 NDJSON 流式导出审计日志（合规批量拉取）"""
+    args = request.args.to_dict()
+    args.pop('limit', None)
+    args.pop('cursor', None)
+    try:
+        query = AuditQuery.from_args(args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    audit = current_app.extensions['services']['audit']
+    audit_log(action='export_audit_logs', resource='audit_logs')
+
+    def generate():
+        for log in audit.export_logs(query):
+            yield json_util.dumps(log) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@admin_bp.route('/audit-rollups', methods=['GET'])
+@role_required('admin')
+@read_only
+def get_audit_rollups():
+    """审计计数汇总（?rollup=action_hour|user_day|resource_day&start=&end=[&action=][&subject=]）"""
+    try:
+        query = RollupQuery.from_args(request.args.to_dict())
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(current_app.extensions['services']['audit_rollups'].query(query))
+
+@admin_bp.route('/login-stats', methods=['GET'])
+@role_required('admin')
+def get_login_stats():
+    """登录评估/拒绝累计计数；监控按采样间隔做差得到每秒速率"""
+    auth = current_app.extensions['services']['auth']
+    return jsonify(auth.login_stats())
+
+@admin_bp.route('/account-cache-stats', methods=['GET'])
+@role_required('admin')
+def get_account_cache_stats():
+    """账户视图缓存命中率与省去的加载次数（本 worker）"""
+    return jsonify(current_app.extensions['services']['account_cache'].stats())
\ No newline at end of file
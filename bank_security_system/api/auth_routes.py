@@ -1,14 +1,18 @@
-from flask import Blueprint, request, jsonify
-from services.auth import authenticate_user
-from models.user import User
+from flask import Blueprint, request, jsonify, current_app
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
-    data = request.get_json()
-    user = User.query.filter_by(username=data['username']).first()
-    if user and user.check_password(data['password']):
-        token = authenticate_user(user.username)
-        return jsonify({'token': token})
-    return jsonify({'error': 'Invalid credentials'}), 401
\ No newline at end of file
+    data = request.get_json() or {}
+    if not data.get('username') or not data.get('password'):
+        return jsonify({'error': 'username and password are required'}), 400
+    auth = current_app.extensions['services']['auth']
+    result = auth.authenticate_user(data['username'], data['password'], data.get('otp'))
+    if isinstance(result, tuple):
+        body, status = result
+        headers = {'Retry-After': str(body['retry_after'])} if 'retry_after' in body else {}
+        if status == 503:
+            headers['Retry-After'] = '1'
+        return jsonify(body), status, headers
+    return jsonify(result)
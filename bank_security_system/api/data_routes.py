@@ -1,90 +1,137 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context, abort
+from flask_jwt_extended import get_jwt_identity
 from services.rbac import role_required
-from services.encryption import EncryptionService
+from services.db_routing import read_only
+from services.permission_claims import token_has_role
+from services.transaction_history import TransactionHistoryQuery, serialize
+from services.transfer import TransferError
+from services.batch_files import BATCH_FORMATS
+from services.ledger import account_balance
 from services.audit import audit_log
 from models.account import Account
 from models.transaction import Transaction
-from decimal import Decimal
 import json
+from itertools import chain
 
 data_bp = Blueprint('data', __name__)
 
-# 初始化加密服务
-encryption_service = EncryptionService()
-
 @data_bp.route('/accounts/<int:account_id>', methods=['GET'])
 @role_required('teller')  # 柜台人员可查看账户信息
 def get_account_info(account_id):
-    """获取账户详细信息"""
-    account = Account.query.get_or_404(account_id)
-    
-    # 解密敏感数据
-    decrypted_balance = encryption_service.decrypt_data(
-        account.encrypted_balance,
-        private_key=encryption_service.get_private_key()
-    )
-    
-    audit_log(action='view_account', resource=f"account:{account.id}")
-    return jsonify({
+    """获取账户详细信息（读穿缓存，转账提交后失效）
+
+    不走只读副本：缓存条目以加载前的版本号标记，若从落后的副本加载，
+    旧余额会以新版本号写入缓存，直到 TTL 过期都不会失效。
+    """
+    cache = current_app.extensions['services']['account_cache']
+    view = cache.get(account_id, _load_account_view)
+    if view is None:
+        abort(404)
+
+    audit_log(action='view_account', resource=f"account:{account_id}")
+    return jsonify(view)
+
+def _load_account_view(account_id):
+    account = Account.query.get(account_id)
+    if account is None:
+        return None
+    # 余额 = 最新快照 + 之后的分录
+    return {
         'id': account.id,
         'owner': account.owner,
-        'balance': str(Decimal(decrypted_balance.decode())),
+        'balance': str(account_balance(current_app.extensions['services']['encryption'], account.id)),
         'currency': account.currency
-    })
+    }
 
 @data_bp.route('/transactions', methods=['POST'])
 @role_required('teller')
 def create_transaction():
-    """执行转账操作"""
-    data = request.get_json()
+    """执行转账操作（行锁 + 重试；可通过 Idempotency-Key 头安全重放）"""
+    data = request.get_json() or {}
     required_fields = ['from_account', 'to_account', 'amount']
     if not all(field in data for field in required_fields):
         return jsonify(error="Missing required fields"), 400
 
-    # 验证账户有效性
-    from_account = Account.query.get(data['from_account'])
-    to_account = Account.query.get(data['to_account'])
-    if not from_account or not to_account:
-        return jsonify(error="Invalid account"), 404
-
-    # 执行转账逻辑
-    amount = Decimal(data['amount'])
-    if from_account.balance < amount:
-        return jsonify(error="Insufficient funds"), 400
-
-    # 更新账户余额（加密存储）
-    from_account.balance -= amount
-    to_account.balance += amount
-
-    # 创建交易记录
-    transaction = Transaction(
-        from_account_id=from_account.id,
-        to_account_id=to_account.id,
-        amount=encryption_service.encrypt_data(str(amount).encode()),
-        status='completed'
-    )
-    db.session.add(transaction)
-    db.session.commit()
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if idempotency_key and len(idempotency_key) > 64:
+        return jsonify(error="Idempotency key too long"), 400
+
+    engine = current_app.extensions['services']['transfer']
+    try:
+        transaction, created = engine.transfer(
+            data['from_account'], data['to_account'], data['amount'], idempotency_key
+        )
+    except TransferError as e:
+        return jsonify(error=str(e)), e.status_code
 
+    if not created:
+        return jsonify(transaction.to_dict()), 200
     audit_log(action='transfer_funds', resource=f"transaction:{transaction.id}")
     return jsonify(transaction.to_dict()), 201
 
+@data_bp.route('/transactions/batch', methods=['POST'])
+@role_required('teller')
+def create_transaction_batch():
+    """批量转账（CSV 或 NDJSON，列 from_account,to_account,amount[,idempotency_key]）
+
+    整个批次先校验，再分组提交；响应以 NDJSON 流式输出每行结果，最后一行为汇总。
+    """
+    fmt = BATCH_FORMATS.get(request.mimetype)
+    if fmt is None:
+        return jsonify(error="Content-Type must be text/csv or application/x-ndjson"), 415
+
+    processor = current_app.extensions['services']['bulk_transfer']
+    try:
+        rows, results = processor.prepare(request.get_data(as_text=True), fmt)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    def generate():
+        summary = {'completed': 0, 'replayed': 0, 'rejected': 0, 'failed': 0}
+        for chunk in chain([results], processor.process(rows)):
+            completed = [r['transaction_id'] for r in chunk if r['status'] == 'completed']
+            if completed:
+                # 每组一条审计记录
+                audit_log(action='bulk_transfer', resource=f"transactions:{min(completed)}-{max(completed)}",
+                          sensitive_data={'count': len(completed)})
+            for result in chunk:
+                summary[result['status']] += 1
+                yield json.dumps(result) + '\n'
+        yield json.dumps({'summary': summary}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @data_bp.route('/accounts/<int:account_id>/transactions', methods=['GET'])
 @role_required(['teller', 'customer'])  # 允许用户查询自己的交易记录
+@read_only
 def get_transaction_history(account_id):
-    """获取账户交易记录"""
-    # 权限验证：用户只能查看自己的账户
-    if (current_user.role == 'customer' and 
-        current_user.id != Account.query.get(account_id).user_id):
-        return jsonify(error="Forbidden"), 403
+    """获取账户交易记录（键集分页，?cursor= 取下一页，响应流式输出）"""
+    # 权限验证：客户只能查看自己的账户
+    if not token_has_role('teller'):
+        owner = Account.query.with_entities(Account.user_id).filter_by(id=account_id).first()
+        if owner is None or str(owner.user_id) != str(get_jwt_identity()):
+            return jsonify(error="Forbidden"), 403
 
-    transactions = Transaction.query.filter(
-        (Transaction.from_account_id == account_id) | 
-        (Transaction.to_account_id == account_id)
-    ).all()
+    try:
+        query = TransactionHistoryQuery.from_args(account_id, request.args.to_dict())
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
 
     audit_log(action='view_transactions', resource=f"account:{account_id}")
-    return jsonify([tx.to_dict() for tx in transactions])
+    encryption = current_app.extensions['services']['encryption']
+    session = Transaction.query.session
+
+    def generate():
+        yield '{"items":['
+        separator = ''
+        for rows in query.iter_batches(session):
+            amounts = encryption.decrypt_many([row.amount for row in rows])
+            for row, amount in zip(rows, amounts):
+                yield separator + json.dumps(serialize(row, amount))
+                separator = ','
+        yield '],"next_cursor":' + json.dumps(query.next_cursor) + '}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 @data_bp.route('/accounts', methods=['POST'])
 @role_required('admin')
@@ -93,11 +140,11 @@ def create_account():
     data = request.get_json()
     account = Account(
         owner=data['owner'],
-        currency=data.get('currency', 'CNY'),
-        encrypted_balance=encryption_service.encrypt_data(b'0.00')
+        currency=data.get('currency', 'CNY')
     )
-    db.session.add(account)
-    db.session.commit()
+    session = Account.query.session
+    session.add(account)
+    session.commit()
 
     audit_log(action='create_account', resource=f"account:{account.id}")
     return jsonify(account.to_dict()), 201
\ No newline at end of file
@@ -0,0 +1,20 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '003'
+down_revision = '002'
+
+def upgrade():
+    op.create_table('revoked_token',
+        sa.Column('jti', sa.String(length=64), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('jti')
+    )
+    op.create_index('ix_revoked_token_expires_at', 'revoked_token', ['expires_at'])
+    op.create_index('ix_revoked_token_revoked_at', 'revoked_token', ['revoked_at'])
+
+def downgrade():
+    op.drop_index('ix_revoked_token_revoked_at', table_name='revoked_token')
+    op.drop_index('ix_revoked_token_expires_at', table_name='revoked_token')
+    op.drop_table('revoked_token')
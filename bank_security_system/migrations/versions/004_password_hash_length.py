@@ -0,0 +1,20 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '004'
+down_revision = '003'
+
+def upgrade():
+    # 哈希串包含算法与成本参数，更换算法（如 scrypt、sha512）后长度会超过 128
+    op.alter_column('user', 'password_hash',
+        existing_type=sa.String(length=128),
+        type_=sa.String(length=255),
+        existing_nullable=True
+    )
+
+def downgrade():
+    op.alter_column('user', 'password_hash',
+        existing_type=sa.String(length=255),
+        type_=sa.String(length=128),
+        existing_nullable=True
+    )
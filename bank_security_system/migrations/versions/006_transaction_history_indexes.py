@@ -0,0 +1,42 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '006'
+down_revision = '005'
+
+def upgrade():
+    # 账户与交易表此前未纳入迁移，此处一并创建；余额沿用原账户路由读取的
+    # encrypted_balance（RSA-OAEP 密文），不引入明文余额列
+    op.create_table('accounts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('owner', sa.String(length=128), nullable=False),
+        sa.Column('currency', sa.String(length=3), nullable=False),
+        sa.Column('encrypted_balance', sa.LargeBinary(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_accounts_user_id', 'accounts', ['user_id'])
+
+    op.create_table('transactions',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('from_account_id', sa.Integer(), nullable=False),
+        sa.Column('to_account_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.LargeBinary(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['from_account_id'], ['accounts.id']),
+        sa.ForeignKeyConstraint(['to_account_id'], ['accounts.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # InnoDB 二级索引隐含主键，因此 (account, created_at) 即可支撑 (created_at, id) 键集分页
+    op.create_index('ix_transactions_from_created', 'transactions', ['from_account_id', 'created_at'])
+    op.create_index('ix_transactions_to_created', 'transactions', ['to_account_id', 'created_at'])
+
+def downgrade():
+    op.drop_index('ix_transactions_to_created', table_name='transactions')
+    op.drop_index('ix_transactions_from_created', table_name='transactions')
+    op.drop_table('transactions')
+    op.drop_index('ix_accounts_user_id', table_name='accounts')
+    op.drop_table('accounts')
@@ -0,0 +1,13 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '007'
+down_revision = '006'
+
+def upgrade():
+    op.add_column('transactions', sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+    op.create_unique_constraint('uq_transactions_idempotency_key', 'transactions', ['idempotency_key'])
+
+def downgrade():
+    op.drop_constraint('uq_transactions_idempotency_key', 'transactions', type_='unique')
+    op.drop_column('transactions', 'idempotency_key')
@@ -0,0 +1,129 @@
+import os
+import base64
+from datetime import datetime
+from decimal import Decimal
+from alembic import op
+import sqlalchemy as sa
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+revision = '008'
+down_revision = '007'
+
+NONCE_SIZE = 12
+
+
+def _field_cipher() -> AESGCM:
+    """与 EncryptionService.encrypt_many 相同的字段加密（nonce | 密文 | tag），密钥取自 SYMMETRIC_KEY"""
+    key = os.environ.get('SYMMETRIC_KEY')
+    if not key:
+        raise RuntimeError("SYMMETRIC_KEY must be set to migrate account balances")
+    return AESGCM(base64.urlsafe_b64decode(key))
+
+
+def _rsa_key(name: str):
+    """旧版 encrypted_balance 为 RSA-OAEP(SHA-256) 密文，密钥路径与 EncryptionService 配置相同"""
+    path = os.environ.get(name)
+    if not path:
+        raise RuntimeError(f"{name} must be set to migrate account balances")
+    with open(path, 'rb') as f:
+        data = f.read()
+    if name == 'PRIVATE_KEY_PATH':
+        return serialization.load_pem_private_key(data, password=None)
+    return serialization.load_pem_public_key(data)
+
+
+OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+
+
+# 与 services/ledger.py 中的 AAD 格式一致
+def _snapshot_aad(account_id, last_entry_id) -> bytes:
+    return f"balance-snapshot:{account_id}:{last_entry_id}".encode()
+
+
+def _entry_aad(account_id, transaction_id) -> bytes:
+    return f"ledger-entry:{account_id}:{transaction_id}".encode()
+
+
+def _seal(aead, value: Decimal, aad: bytes) -> bytes:
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + aead.encrypt(nonce, str(value).encode(), aad)
+
+
+def _open(aead, value: bytes, aad: bytes) -> Decimal:
+    return Decimal(aead.decrypt(value[:NONCE_SIZE], value[NONCE_SIZE:], aad).decode())
+
+
+def upgrade():
+    op.create_table('ledger_entries',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('transaction_id', sa.BigInteger(), nullable=False),
+        sa.Column('amount', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['account_id'], ['accounts.id']),
+        sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ledger_entries_account_id_id', 'ledger_entries', ['account_id', 'id'])
+    op.create_index('ix_ledger_entries_transaction_id', 'ledger_entries', ['transaction_id'])
+
+    snapshots = op.create_table('balance_snapshots',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('balance', sa.LargeBinary(), nullable=False),
+        sa.Column('last_entry_id', sa.BigInteger(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['account_id'], ['accounts.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('account_id', 'last_entry_id', name='uq_balance_snapshots_account_entry')
+    )
+
+    # 现有余额（RSA 密文）解密后以字段加密写入各账户的初始快照，此后余额只由分录推导
+    accounts = op.get_bind().execute(sa.text("SELECT id, encrypted_balance FROM accounts")).fetchall()
+    if accounts:
+        aead = _field_cipher()
+        private_key = _rsa_key('PRIVATE_KEY_PATH') if any(value for _, value in accounts) else None
+        now = datetime.utcnow()
+        op.bulk_insert(snapshots, [
+            {'account_id': account_id,
+             'balance': _seal(aead, Decimal(private_key.decrypt(bytes(value), OAEP).decode()) if value else Decimal('0.00'),
+                              _snapshot_aad(account_id, 0)),
+             'last_entry_id': 0, 'created_at': now}
+            for account_id, value in accounts
+        ])
+    op.drop_column('accounts', 'encrypted_balance')
+
+
+def downgrade():
+    op.add_column('accounts', sa.Column('encrypted_balance', sa.LargeBinary(), nullable=True))
+    bind = op.get_bind()
+    snapshots = bind.execute(sa.text(
+        "SELECT account_id, balance, last_entry_id FROM balance_snapshots ORDER BY account_id, last_entry_id"
+    )).fetchall()
+    entries = bind.execute(sa.text(
+        "SELECT id, account_id, transaction_id, amount FROM ledger_entries"
+    )).fetchall()
+    if snapshots or entries:
+        aead = _field_cipher()
+        latest = {account_id: (balance, last_entry_id) for account_id, balance, last_entry_id in snapshots}
+        balances = {
+            account_id: (_open(aead, balance, _snapshot_aad(account_id, last_entry_id)), last_entry_id)
+            for account_id, (balance, last_entry_id) in latest.items()
+        }
+        totals = {account_id: balance for account_id, (balance, _) in balances.items()}
+        for entry_id, account_id, transaction_id, amount in entries:
+            if entry_id > balances.get(account_id, (None, 0))[1]:
+                totals[account_id] = totals.get(account_id, Decimal('0.00')) + _open(
+                    aead, amount, _entry_aad(account_id, transaction_id))
+        public_key = _rsa_key('PUBLIC_KEY_PATH')
+        update = sa.text("UPDATE accounts SET encrypted_balance = :balance WHERE id = :id").bindparams(
+            sa.bindparam('balance', type_=sa.LargeBinary())
+        )
+        for account_id, balance in totals.items():
+            bind.execute(update, {'balance': public_key.encrypt(str(balance).encode(), OAEP), 'id': account_id})
+    op.drop_table('balance_snapshots')
+    op.drop_index('ix_ledger_entries_transaction_id', table_name='ledger_entries')
+    op.drop_index('ix_ledger_entries_account_id_id', table_name='ledger_entries')
+    op.drop_table('ledger_entries')
@@ -0,0 +1,18 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '009'
+down_revision = '008'
+
+def upgrade():
+    # 键集游标要求 created_at 非空；早期未写入创建时间的用户以迁移时间补齐
+    user = sa.table('user', sa.column('created_at', sa.DateTime))
+    op.execute(user.update().where(user.c.created_at.is_(None)).values(created_at=sa.func.now()))
+    op.create_index('ix_user_created_at_id', 'user', ['created_at', 'id'])
+    op.create_index('ix_roles_users_user_id', 'roles_users', ['user_id'])
+    op.create_index('ix_roles_users_role_id_user_id', 'roles_users', ['role_id', 'user_id'])
+
+def downgrade():
+    op.drop_index('ix_roles_users_role_id_user_id', table_name='roles_users')
+    op.drop_index('ix_roles_users_user_id', table_name='roles_users')
+    op.drop_index('ix_user_created_at_id', table_name='user')
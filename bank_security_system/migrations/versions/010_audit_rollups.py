@@ -0,0 +1,22 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '010'
+down_revision = '009'
+
+def upgrade():
+    op.create_table('audit_rollups',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('rollup', sa.String(32), nullable=False),
+        sa.Column('subject', sa.String(255), nullable=False),
+        sa.Column('action', sa.String(64), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('rollup', 'subject', 'action', 'bucket', name='uq_audit_rollups_key')
+    )
+    op.create_index('ix_audit_rollups_rollup_action_bucket', 'audit_rollups', ['rollup', 'action', 'bucket'])
+
+def downgrade():
+    op.drop_index('ix_audit_rollups_rollup_action_bucket', table_name='audit_rollups')
+    op.drop_table('audit_rollups')
@@ -12,8 +12,14 @@ from config import Config
 from .base_model import db, BaseModel
 from .role import Role
 from .user import User  # Add other models as needed
-
-__all__ = ['db', 'BaseModel', 'Role', 'User']
+from .revoked_token import RevokedToken
+from .data_key import DataKey
+from .account import Account
+from .transaction import Transaction
+from .ledger import LedgerEntry, BalanceSnapshot
+from .audit_rollup import AuditRollup
+
+__all__ = ['db', 'BaseModel', 'Role', 'User', 'RevokedToken', 'DataKey', 'Account', 'Transaction', 'LedgerEntry', 'BalanceSnapshot', 'AuditRollup']
 
 
 
@@ -0,0 +1,19 @@
+from . import db
+from datetime import datetime
+
+class Account(db.Model):
+    """银行账户（余额由复式记账分录推导，见 services/ledger.py）"""
+    __tablename__ = 'accounts'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    owner = db.Column(db.String(128), nullable=False)
+    currency = db.Column(db.String(3), nullable=False, default='CNY')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'owner': self.owner,
+            'currency': self.currency,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,17 @@
+from . import db
+
+class AuditRollup(db.Model):
+    """审计计数汇总：每个 (汇总类型, 主体, 操作, 时间桶) 一行，写入审计日志时累加"""
+    __tablename__ = 'audit_rollups'
+    __table_args__ = (
+        # 唯一约束同时是按主体查询的索引：(rollup, subject, action, bucket)
+        db.UniqueConstraint('rollup', 'subject', 'action', 'bucket', name='uq_audit_rollups_key'),
+        # 不指定主体时按操作与时间范围查询（如"今天登录失败最多的用户"）
+        db.Index('ix_audit_rollups_rollup_action_bucket', 'rollup', 'action', 'bucket'),
+    )
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    rollup = db.Column(db.String(32), nullable=False)
+    subject = db.Column(db.String(255), nullable=False, default='')
+    action = db.Column(db.String(64), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
@@ -1,8 +1,49 @@
 # models/base_model.py
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
 
-db = SQLAlchemy()
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """读写分离会话：标记为只读的会话把查询发往副本库（SQLALCHEMY_BINDS['replica']）
+
+    会话一旦写入（flush 或执行非 SELECT 语句）即固定到主库，之后的读取也走主库，
+    保证读到自己的写入。未配置副本库时与默认会话相同。
+    """
+    def use_replica(self):
+        self.info['use_replica'] = True
+
+    def pin_primary(self):
+        self.info['pinned_primary'] = True
+
+    @property
+    def routes_to_replica(self) -> bool:
+        return bool(self.info.get('use_replica')) and not self.info.get('pinned_primary')
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.routes_to_replica:
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _pin_on_flush(session, flush_context, instances):
+    session.pin_primary()
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _pin_on_write(orm_execute_state):
+    # 事件在取连接之前触发，写语句本身即发往主库
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.pin_primary()
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class BaseModel(db.Model):
     __abstract__ = True
-    # Add your base model fields here
\ No newline at end of file
+    # Add your base model fields here
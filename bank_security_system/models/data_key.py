@@ -0,0 +1,9 @@
+from . import db
+from datetime import datetime
+
+class DataKey(db.Model):
+    """信封加密的数据密钥（DEK），仅保存经 RSA 公钥包装后的密文"""
+    __tablename__ = 'data_key'
+    id = db.Column(db.String(32), primary_key=True)  # 16 字节随机 ID 的十六进制
+    wrapped_key = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,33 @@
+from . import db
+from datetime import datetime
+
+class LedgerEntry(db.Model):
+    """复式记账分录（只追加）：每笔交易一借一贷，借方为负、贷方为正
+
+    金额以字段加密格式（nonce | 密文 | tag）保存，AAD 绑定 (account_id, transaction_id)。
+    """
+    __tablename__ = 'ledger_entries'
+    __table_args__ = (
+        # 余额 = 最新快照 + 该账户在快照之后的分录
+        db.Index('ix_ledger_entries_account_id_id', 'account_id', 'id'),
+    )
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
+    transaction_id = db.Column(db.BigInteger, db.ForeignKey('transactions.id'), nullable=False, index=True)
+    amount = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class BalanceSnapshot(db.Model):
+    """账户余额快照：包含 id <= last_entry_id 的全部分录
+
+    余额以字段加密格式保存，AAD 绑定 (account_id, last_entry_id)。
+    """
+    __tablename__ = 'balance_snapshots'
+    __table_args__ = (
+        db.UniqueConstraint('account_id', 'last_entry_id', name='uq_balance_snapshots_account_entry'),
+    )
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
+    balance = db.Column(db.LargeBinary, nullable=False)
+    last_entry_id = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
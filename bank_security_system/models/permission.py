@@ -16,6 +16,20 @@ class Action(Enum):
     DELETE = 'delete'
     APPROVE = 'approve'
 
+    @property
+    def bit(self) -> int:
+        """操作在 allowed_actions 位掩码中对应的位"""
+        return ACTION_BITS[self]
+
+# 操作位定义（顺序固定，已持久化到 allowed_actions，不可调整）
+ACTION_BITS = {
+    Action.CREATE: 1 << 0,
+    Action.READ: 1 << 1,
+    Action.UPDATE: 1 << 2,
+    Action.DELETE: 1 << 3,
+    Action.APPROVE: 1 << 4,
+}
+
 class Permission(db.Model):
     __tablename__ = 'permissions'
     id = db.Column(db.Integer, primary_key=True)
@@ -38,13 +52,13 @@ class Permission(db.Model):
     role = db.relationship('Role', back_populates='permissions')
 
     def add_action(self, action: Action):
-        self.allowed_actions |= action.value
+        self.allowed_actions = (self.allowed_actions or 0) | action.bit
 
     def remove_action(self, action: Action):
-        self.allowed_actions &= ~action.value
+        self.allowed_actions = (self.allowed_actions or 0) & ~action.bit
 
     def has_action(self, action: Action) -> bool:
-        return (self.allowed_actions & action.value) == action.value
+        return ((self.allowed_actions or 0) & action.bit) == action.bit
 
     def set_constraint(self, key: str, value: any):
         if not self.constraints:
@@ -52,4 +66,10 @@ class Permission(db.Model):
         self.constraints[key] = value
 
     def get_constraint(self, key: str) -> any:
-        return self.constraints.get(key) if self.constraints else None
\ No newline at end of file
+        return self.constraints.get(key) if self.constraints else None
+
+class PermissionVersion(db.Model):
+    """全局权限版本号（单行），角色/权限/用户角色变更时在同一事务内递增"""
+    __tablename__ = 'permission_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
\ No newline at end of file
@@ -0,0 +1,9 @@
+from . import db
+from datetime import datetime
+
+class RevokedToken(db.Model):
+    """已撤销的 JWT（按 jti），令牌到期后即可清理"""
+    __tablename__ = 'revoked_token'
+    jti = db.Column(db.String(64), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
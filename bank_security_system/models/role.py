@@ -36,14 +36,14 @@ class Role(BaseModel):
     def get_permissions(self, include_inherited=True):
         """获取所有权限（包含继承的）"""
         perms = list(self.permissions)
-        if include_inherited and self.parent:
-            perms += self.parent.get_permissions(include_inherited=True)
+        parent, seen = self.parent, {self.id}
+        while include_inherited and parent and parent.id not in seen:
+            seen.add(parent.id)
+            perms += parent.permissions
+            parent = parent.parent
         return perms
 
     def has_permission(self, resource_type, action):
-        """检查权限（含继承）"""
-        for perm in self.get_permissions():
-            if (perm.resource_type == resource_type and 
-                perm.has_action(action)):
-                return True
-        return False
\ No newline at end of file
+        """检查权限（含继承），使用编译后的权限表：一次字典查询加一次按位与"""
+        from services.permission_matrix import permission_matrix
+        return permission_matrix.allows((self.id,), resource_type, action)
\ No newline at end of file
@@ -0,0 +1,27 @@
+from . import db
+from datetime import datetime
+
+class Transaction(db.Model):
+    """转账记录；金额以字段加密格式（nonce | 密文 | tag）保存"""
+    __tablename__ = 'transactions'
+    __table_args__ = (
+        # 交易历史按方向分别走索引扫描，再按 (created_at, id) 归并
+        db.Index('ix_transactions_from_created', 'from_account_id', 'created_at'),
+        db.Index('ix_transactions_to_created', 'to_account_id', 'created_at'),
+    )
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    from_account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
+    to_account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
+    amount = db.Column(db.LargeBinary, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    idempotency_key = db.Column(db.String(64), unique=True)  # 客户端幂等键（可选）
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'from_account_id': self.from_account_id,
+            'to_account_id': self.to_account_id,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -1,23 +1,41 @@
 from . import db
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
 roles_users = db.Table('roles_users',
     db.Column('user_id', db.Integer(), db.ForeignKey('user.id')),
-    db.Column('role_id', db.Integer(), db.ForeignKey('role.id'))
+    db.Column('role_id', db.Integer(), db.ForeignKey('roles.id')),
+    # selectinload 按 user_id IN (...) 取角色；按角色筛选用户走 (role_id, user_id)
+    db.Index('ix_roles_users_user_id', 'user_id'),
+    db.Index('ix_roles_users_role_id_user_id', 'role_id', 'user_id')
 )
 
 class User(db.Model):
+    __table_args__ = (
+        # 管理端用户列表按 (created_at, id) 键集分页
+        db.Index('ix_user_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(255))  # 含算法与成本参数，如 pbkdf2:sha256:600000$salt$hash
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     roles = db.relationship('Role', secondary=roles_users,
                             backref=db.backref('users', lazy='dynamic'))
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        # 延迟导入，避免 models 与 services 循环依赖
+        from services.password_hashing import password_hasher
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
\ No newline at end of file
+        """校验口令（在哈希进程池中执行，池满时抛出 PasswordHashingBusy）"""
+        from services.password_hashing import password_hasher
+        return password_hasher.verify(self.password_hash, password)
+
+    def rehash_password_if_needed(self, password) -> bool:
+        """登录成功后调用：哈希参数与当前配置不一致时用明文口令重算（由调用方提交）"""
+        from services.password_hashing import password_hasher
+        if not password_hasher.needs_rehash(self.password_hash):
+            return False
+        self.password_hash = password_hasher.hash(password)
+        return True
\ No newline at end of file
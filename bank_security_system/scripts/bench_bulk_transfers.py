@@ -0,0 +1,93 @@
+"""批量转账基准：同一份代发工资批次分别逐笔调用转账引擎与批量处理，比较吞吐量
+
+用法：python scripts/bench_bulk_transfers.py [--url mysql+pymysql://...] [--rows 10000] [--chunk-size 500]
+逐笔路径只计转账引擎本身（每笔一次加密、一次提交），不含 HTTP 与审计写入，实际差距更大。
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import tempfile
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_transfers import create_app  # noqa: E402
+from models.transaction import db  # noqa: E402
+from models.account import Account  # noqa: E402
+from services.encryption import EncryptionService  # noqa: E402
+from services.transfer import TransferEngine  # noqa: E402
+from services.bulk_transfer import BulkTransferProcessor  # noqa: E402
+from services.ledger import account_balances, open_balance  # noqa: E402
+
+
+def setup_accounts(encryption, payees: int, initial: Decimal) -> tuple:
+    """一个付款账户 + payees 个收款账户"""
+    accounts = [Account(owner=f'bench-{uuid.uuid4().hex[:8]}', currency='CNY') for _ in range(payees + 1)]
+    db.session.add_all(accounts)
+    db.session.flush()
+    open_balance(db.session, encryption, accounts[0].id, initial)
+    db.session.commit()
+    return accounts[0].id, [a.id for a in accounts[1:]]
+
+
+def make_batch(payer: int, payees: list, rows: int) -> str:
+    rng = random.Random(0)
+    lines = ["from_account,to_account,amount,idempotency_key"]
+    for _ in range(rows):
+        amount = Decimal(rng.randint(100, 100000)) / 100
+        lines.append(f"{payer},{rng.choice(payees)},{amount},{uuid.uuid4().hex}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-transfer vs bulk transfer throughput")
+    parser.add_argument('--url', help="database URL (default: temporary SQLite file)")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--payees', type=int, default=1000)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    tmp = None
+    url = args.url
+    if not url:
+        tmp = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+    app = create_app(url)
+    encryption = EncryptionService()
+    encryption.symmetric_key = os.urandom(32)
+    engine = TransferEngine(encryption)
+    processor = BulkTransferProcessor(engine, chunk_size=args.chunk_size, max_rows=args.rows)
+    initial = Decimal(args.rows * 1000)
+
+    timings = {}
+    with app.app_context():
+        for name in ('per-transfer', 'bulk'):
+            payer, payees = setup_accounts(encryption, args.payees, initial)
+            batch = make_batch(payer, payees, args.rows)
+            started = time.perf_counter()
+            rows, results = processor.prepare(batch, 'csv')
+            if name == 'bulk':
+                for chunk in processor.process(rows):
+                    results.extend(chunk)
+            else:
+                for row in rows:
+                    engine.transfer(row.from_account_id, row.to_account_id, row.amount, row.idempotency_key)
+            timings[name] = time.perf_counter() - started
+            failed = sum(r['status'] != 'completed' for r in results)
+            expected = initial - sum(row.amount for row in rows)
+            ok = not failed and account_balances(encryption, [payer])[payer] == expected
+            print(f"  {name:<13}{args.rows / timings[name]:>10,.0f} transfers/s  "
+                  f"({timings[name]:.2f}s, {'OK' if ok else 'FAIL'})")
+        db.session.remove()
+
+    print(f"  speedup      {timings['per-transfer'] / timings['bulk']:>10.1f}x  (chunk size {args.chunk_size})")
+    if tmp:
+        tmp.cleanup()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""转账引擎并发基准：N 个线程对少量热点账户并发转账，报告吞吐量并校验余额守恒
+
+用法：python scripts/bench_transfers.py [--url mysql+pymysql://...] [--threads 16] [--accounts 4]
+默认使用临时 SQLite 文件；SQLite 没有行锁，这里以 BEGIN IMMEDIATE 取得库级写锁代替 FOR UPDATE。
+指定 --url 时只会新建本次基准用的账户，不会删除已有数据。
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import event, func  # noqa: E402
+from models.transaction import db, Transaction  # noqa: E402
+from models.account import Account  # noqa: E402
+from models.ledger import LedgerEntry, BalanceSnapshot  # noqa: E402
+from services.encryption import EncryptionService  # noqa: E402
+from services.transfer import TransferEngine, TransferError, InsufficientFunds  # noqa: E402
+from services.ledger import LedgerCompactor, account_balances, entry_aad, open_balance  # noqa: E402
+
+
+def _sqlite_immediate_transactions(engine):
+    """pysqlite 默认在 SELECT 之前不开启事务；改为显式 BEGIN IMMEDIATE"""
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def create_app(url: str) -> Flask:
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    if url.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30, 'check_same_thread': False}}
+    db.init_app(app)
+    with app.app_context():
+        if url.startswith('sqlite'):
+            _sqlite_immediate_transactions(db.engine)
+        db.metadata.create_all(db.engine, tables=[
+            db.metadata.tables['user'], Account.__table__, Transaction.__table__,
+            LedgerEntry.__table__, BalanceSnapshot.__table__
+        ])
+    return app
+
+
+def worker(app, engine, account_ids, transfers, stats, lock):
+    rng = random.Random()
+    local = {'ok': 0, 'insufficient': 0, 'replayed': 0, 'errors': 0}
+    with app.app_context():
+        for _ in range(transfers):
+            from_id, to_id = rng.sample(account_ids, 2)
+            amount = Decimal(rng.randint(1, 500)) / 100
+            key = uuid.uuid4().hex
+            try:
+                _, created = engine.transfer(from_id, to_id, amount, key)
+                local['ok'] += created
+                # 约 10% 的请求重放，验证幂等键不会重复扣款
+                if rng.random() < 0.1:
+                    _, created = engine.transfer(from_id, to_id, amount, key)
+                    local['replayed'] += not created
+            except InsufficientFunds:
+                local['insufficient'] += 1
+            except TransferError:
+                local['errors'] += 1
+            except Exception as e:
+                local['errors'] += 1
+                print(f"transfer failed: {e}", file=sys.stderr)
+        db.session.remove()
+    with lock:
+        for k, v in local.items():
+            stats[k] += v
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent transfer benchmark on hot accounts")
+    parser.add_argument('--url', help="database URL (default: temporary SQLite file)")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--accounts', type=int, default=4, help="number of hot accounts")
+    parser.add_argument('--transfers', type=int, default=200, help="transfers per thread")
+    parser.add_argument('--initial', default='1000.00', help="initial balance per account")
+    args = parser.parse_args(argv)
+
+    tmp = None
+    url = args.url
+    if not url:
+        tmp = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+    app = create_app(url)
+    encryption = EncryptionService()
+    encryption.symmetric_key = os.urandom(32)
+    engine = TransferEngine(encryption, max_retries=50)
+    initial = Decimal(args.initial)
+
+    with app.app_context():
+        accounts = [Account(owner=f'bench-{uuid.uuid4().hex[:8]}', currency='CNY')
+                    for _ in range(args.accounts)]
+        db.session.add_all(accounts)
+        db.session.flush()
+        for account in accounts:
+            open_balance(db.session, encryption, account.id, initial)
+        db.session.commit()
+        account_ids = [a.id for a in accounts]
+        db.session.remove()
+
+    stats = {'ok': 0, 'insufficient': 0, 'replayed': 0, 'errors': 0}
+    lock = threading.Lock()
+    threads = [threading.Thread(target=worker, args=(app, engine, account_ids, args.transfers, stats, lock))
+               for _ in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        balances = account_balances(encryption, account_ids)
+        entries = db.session.query(LedgerEntry.account_id, LedgerEntry.transaction_id, LedgerEntry.amount).filter(
+            LedgerEntry.account_id.in_(account_ids)).all()
+        entry_total = sum((Decimal(amount.decode()) for amount in encryption.decrypt_many(
+            [amount for _, _, amount in entries],
+            associated_data=[entry_aad(account_id, transaction_id) for account_id, transaction_id, _ in entries]
+        )), Decimal(0))
+        # 压缩为快照后余额不变
+        LedgerCompactor(encryption, lag=0, min_entries=1).compact(now=datetime.utcnow() + timedelta(seconds=1))
+        compacted = account_balances(encryption, account_ids)
+        rows = Transaction.query.with_entities(
+            Transaction.from_account_id, Transaction.to_account_id, Transaction.amount
+        ).filter(Transaction.from_account_id.in_(account_ids)).all()
+        tx_count = Transaction.query.with_entities(func.count()).filter(
+            Transaction.from_account_id.in_(account_ids)).scalar()
+
+    # 按交易流水重放余额：初始余额 - 转出 + 转入 必须等于最终余额
+    replayed = {account_id: initial for account_id in account_ids}
+    amounts = encryption.decrypt_many([amount for _, _, amount in rows])
+    for (from_id, to_id, _), amount in zip(rows, amounts):
+        replayed[from_id] -= Decimal(amount.decode())
+        replayed[to_id] += Decimal(amount.decode())
+
+    total = sum(balances.values())
+    print(f"{args.threads} threads x {args.transfers} transfers on {args.accounts} hot accounts ({url.split(':')[0]})")
+    print(f"  completed   {stats['ok']:>8}  ({stats['ok'] / elapsed:,.0f} transfers/s over {elapsed:.2f}s)")
+    print(f"  insufficient{stats['insufficient']:>8}")
+    print(f"  replayed    {stats['replayed']:>8}  (idempotent, no second debit)")
+    print(f"  errors      {stats['errors']:>8}")
+    print(f"  retries     {engine.retries:>8}")
+    checks = {
+        'total balance conserved': total == initial * args.accounts,
+        'no negative balance': all(b >= 0 for b in balances.values()),
+        'one row per completed transfer': tx_count == stats['ok'],
+        'balances match ledger replay': replayed == balances,
+        'debits and credits net to zero': entry_total == 0,
+        'balances unchanged after compaction': compacted == balances,
+    }
+    for name, ok in checks.items():
+        print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    if tmp:
+        tmp.cleanup()
+    return 0 if all(checks.values()) and not stats['errors'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
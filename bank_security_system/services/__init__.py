@@ -4,14 +4,26 @@ from .encryption import EncryptionService
 from .rbac import RBACService
 from .auth import AuthService
 from .audit import audit_service
+from .audit_archive import AuditArchiver
+from .audit_rollups import AuditRollups
 from .backup import BackupScheduler
+from .transfer import TransferEngine
+from .bulk_transfer import BulkTransferProcessor
+from .ledger import LedgerCompactor
+from .account_cache import create_account_cache
+from .bulk_users import bulk_user_importer
 
 # 服务实例化（增加后端配置传递）
 encryption = EncryptionService()  # 注入后端backend=default_backend()
 rbac = RBACService()
 auth = AuthService()
 audit = audit_service()
+audit_archiver = AuditArchiver()
+audit_rollups = AuditRollups()
 backup_scheduler = BackupScheduler()
+transfer_engine = TransferEngine()
+bulk_transfer = BulkTransferProcessor(transfer_engine)
+ledger_compactor = LedgerCompactor()
 
 def init_services(app: Flask):
     """初始化所有服务（适配 cryptography 43.x 的依赖注入）"""
@@ -33,13 +45,17 @@ def init_services(app: Flask):
     if not hasattr(rbac, 'check_permission'):
         raise AttributeError("AuthService 需要 RBACService 实现权限检查方法")
     auth.rbac_service = rbac
+    auth.audit_service = audit
     auth.init_app(app)
     
     # 审计服务初始化（加密上下文传递）
     audit.encryption_service = encryption.with_context(
         backend=default_backend()  # 确保审计使用独立上下文
     )
+    audit_rollups.init_app(app)
+    audit.rollups = audit_rollups
     audit.init_app(app)
+    audit_archiver.init_app(app, audit)  # 配置 AUDIT_ARCHIVE_PATH 时后台归档旧记录
     
     # 备份服务初始化（异步兼容处理）
     backup_scheduler.audit_service = audit
@@ -48,12 +64,35 @@ def init_services(app: Flask):
         encryption_context=encryption.get_backend_context()  # 获取加密上下文
     )
     
+    # 批量开户（口令哈希参数随认证服务初始化）
+    bulk_user_importer.init_app(app)
+    
+    # 账户视图缓存（版本号经共享内存跨 worker 失效）
+    account_cache = create_account_cache(app.config)
+    
+    # 转账引擎（金额字段加密）
+    transfer_engine.encryption_service = encryption
+    transfer_engine.account_cache = account_cache
+    transfer_engine.init_app(app)
+    bulk_transfer.init_app(app)
+    
+    # 余额快照后台压缩（分录与快照金额加密）
+    ledger_compactor.encryption_service = encryption
+    ledger_compactor.init_app(app)
+    
     # 注册服务到应用上下文（增加版本元数据）
     app.extensions['services'] = {
         'encryption': encryption,
         'rbac': rbac,
         'auth': auth,
         'audit': audit,
+        'audit_archiver': audit_archiver,
+        'audit_rollups': audit_rollups,
         'backup': backup_scheduler,
+        'transfer': transfer_engine,
+        'bulk_transfer': bulk_transfer,
+        'ledger_compactor': ledger_compactor,
+        'account_cache': account_cache,
+        'bulk_users': bulk_user_importer,
         'cryptography_version': '43.0.3'  # 版本标识
     }
\ No newline at end of file
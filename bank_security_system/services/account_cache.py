@@ -0,0 +1,121 @@
+import os
+import mmap
+import time
+import struct
+import threading
+from collections import OrderedDict
+from .login_throttle import _SharedLock
+
+# 账户视图缓存默认参数
+DEFAULT_TTL = 5                 # 秒；条目最长存活时间
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_VERSION_SLOTS = 1 << 20
+
+VERSION = struct.Struct('<Q')
+STATS_FIELDS = ('hits', 'misses', 'stale', 'expired', 'invalidations')
+
+
+class AccountVersions:
+    """账户版本号表（共享内存，同一主机上所有 worker 共用）
+
+    每个账户按 id 取模映射到一个 64 位计数器，转账提交后递增；槽位冲突只会导致
+    多余的失效，不会漏掉。path 为 None 时使用匿名映射，仅在 fork 出的子进程间共享。
+    """
+    def __init__(self, path: str = None, slots: int = DEFAULT_VERSION_SLOTS):
+        self.path = path
+        self.slots = slots
+        size = VERSION.size * slots
+        self._file = None
+        if path:
+            self._file = open(path, 'a+b')
+            if os.fstat(self._file.fileno()).st_size < size:
+                self._file.truncate(size)
+            self.buffer = mmap.mmap(self._file.fileno(), size)
+        else:
+            self.buffer = mmap.mmap(-1, size)
+        self._lock = threading.Lock()
+
+    def _offset(self, account_id: int) -> int:
+        return (account_id % self.slots) * VERSION.size
+
+    def get(self, account_id: int) -> int:
+        return VERSION.unpack_from(self.buffer, self._offset(account_id))[0]
+
+    def bump(self, account_ids):
+        """递增版本号；读改写需跨进程互斥，否则并发递增可能互相覆盖而不改变版本"""
+        with _SharedLock(self._lock, self._file):
+            for offset in {self._offset(account_id) for account_id in account_ids}:
+                value, = VERSION.unpack_from(self.buffer, offset)
+                VERSION.pack_into(self.buffer, offset, value + 1)
+
+
+class AccountViewCache:
+    """账户视图读穿缓存（进程内 LRU + TTL，按版本号校验）
+
+    条目记录填充前读到的版本号；读取时与共享版本表比较，不一致即视为过期，
+    因此其他 worker 提交的转账也能立即使本进程的缓存失效。TTL 兜底处理
+    未经转账引擎的修改。命中统计为本进程计数。
+    """
+    def __init__(self, versions: AccountVersions = None, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.versions = versions or AccountVersions()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # account_id -> (视图, 版本号, 过期时间)
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(STATS_FIELDS, 0)
+
+    def get(self, account_id: int, loader):
+        """返回账户视图；未命中时调用 loader(account_id) 加载，loader 返回 None 时不缓存"""
+        version = self.versions.get(account_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(account_id)
+            if entry is not None:
+                view, entry_version, expires_at = entry
+                if entry_version == version and expires_at > now:
+                    self._entries.move_to_end(account_id)
+                    self._stats['hits'] += 1
+                    return view
+                self._stats['stale' if entry_version != version else 'expired'] += 1
+                del self._entries[account_id]
+            self._stats['misses'] += 1
+
+        # 先读版本号再加载：加载期间提交的转账会使这里写入的条目在下次读取时过期
+        view = loader(account_id)
+        if view is None:
+            return None
+        with self._lock:
+            self._entries[account_id] = (view, version, now + self.ttl)
+            self._entries.move_to_end(account_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return view
+
+    def invalidate(self, account_ids):
+        """转账提交后调用：递增共享版本号，所有 worker 的对应条目随之失效"""
+        account_ids = list(account_ids)
+        self.versions.bump(account_ids)
+        with self._lock:
+            self._stats['invalidations'] += len(account_ids)
+            for account_id in account_ids:
+                self._entries.pop(account_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        # 每次命中省去一次账户查询与一次余额计算（快照 + 分录累加）
+        stats['loads_saved'] = stats['hits']
+        return stats
+
+
+def create_account_cache(config) -> AccountViewCache:
+    return AccountViewCache(
+        versions=AccountVersions(
+            path=config.get('ACCOUNT_VERSIONS_PATH', '/dev/shm/bank_account_versions'),
+            slots=config.get('ACCOUNT_VERSION_SLOTS', DEFAULT_VERSION_SLOTS)
+        ),
+        ttl=config.get('ACCOUNT_CACHE_TTL', DEFAULT_TTL),
+        max_entries=config.get('ACCOUNT_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+    )
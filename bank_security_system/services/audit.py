@@ -1,31 +1,94 @@
 from flask import current_app, g
-from flask_pymongo import PyMongo
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
 from datetime import datetime
 from .encryption import EncryptionService
 import hmac
+import atexit
 import hashlib
 import json
 from bson import ObjectId  # 用于 MongoDB ObjectId 转换
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from .audit_writer import (
+    AuditBatchWriter,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_FLUSH_INTERVAL,
+    DEFAULT_WRITE_RETRIES,
+)
+from .audit_chain import AuditChain, ChainVerifier, DEFAULT_CHECKPOINT_INTERVAL
+from .audit_query import AuditQuery, encode_cursor
+from .audit_store import create_audit_store
+from .audit_archive import ArchiveIntegrityError
 
 class audit_service:#————————————
     def __init__(self):
-        self.mongo = None          # MongoDB 客户端
+        self.store = None          # 存储后端（MongoDB / 本地分段文件 / 本地预写转发）
         self.encryption_service = None
-        self.audit_collection = "audit_logs"  # MongoDB 集合名
         self.signing_key = None
+        self.writer = None         # 异步批量写入器（可选）
+        self.chain = None          # 分区哈希链
+        self.rollups = None        # 计数汇总（可选）
 
     def init_app(self, app):
         """初始化服务"""
-        self.mongo = PyMongo(app)  # 初始化 MongoDB 连接
+        self.store = create_audit_store(app)  # AUDIT_BACKEND 选择后端，默认 MongoDB
         self.signing_key = app.config['AUDIT_SIGNING_KEY']
-        self.encryption_service = EncryptionService()
+        self._init_encryption(app)
+        self.chain = AuditChain(
+            self._generate_signature,
+            checkpoint_interval=app.config.get('AUDIT_CHECKPOINT_INTERVAL', DEFAULT_CHECKPOINT_INTERVAL)
+        )
         self.create_audit_collection()  # 创建集合（可选）
+        atexit.register(self.flush)
+
+        # 可选：异步批量写入，避免审计延迟叠加到请求耗时上
+        if app.config.get('AUDIT_ASYNC'):
+            self.writer = AuditBatchWriter(
+                self.store,
+                queue_size=app.config.get('AUDIT_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+                batch_size=app.config.get('AUDIT_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+                flush_interval=app.config.get('AUDIT_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+                backpressure=app.config.get('AUDIT_BACKPRESSURE', 'block'),
+                spill_path=app.config.get('AUDIT_SPILL_PATH'),
+                write_retries=app.config.get('AUDIT_WRITE_RETRIES', DEFAULT_WRITE_RETRIES)
+            )
+            self.writer.start()
+
+    def flush(self):
+        """关闭异步写入器并写出所有排队的记录（进程退出时也会自动调用），并写入最终检查点"""
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        if self.chain:
+            self._store_checkpoint(self.chain.checkpoint())
+        if self.rollups:
+            self.rollups.close()
+        if self.store:
+            self.store.close()
+
+    def _init_encryption(self, app):
+        """敏感数据加密：沿用注入的加密服务；其未配置对称密钥时，使用本服务自己的实例，
+        仍无 SYMMETRIC_KEY 则由审计签名密钥经 HKDF 派生独立的数据密钥"""
+        service = self.encryption_service
+        if service is None or not getattr(service, 'symmetric_key', None):
+            service = EncryptionService()
+            service.init_app(app)
+            if not service.symmetric_key:
+                service.symmetric_key = HKDF(
+                    algorithm=hashes.SHA256(), length=32, salt=None, info=b"audit-encrypted-data"
+                ).derive(self.signing_key.encode())
+        self.encryption_service = service
+
+    def decrypt_sensitive_data(self, log: dict):
+        """解密记录中的敏感数据，没有时返回 None"""
+        if not log.get("encrypted_data"):
+            return None
+        return json.loads(self.encryption_service.decrypt_many([bytes(log["encrypted_data"])])[0])
 
     def create_audit_collection(self):
-        """创建 MongoDB 集合并添加索引（可选）"""
-        # 创建时间戳索引
-        self.mongo.db[self.audit_collection].create_index("timestamp")
-        # 可选：其他验证规则或索引
+        """创建集合与索引（MongoDB 后端；本地后端的时间索引随段文件写入）"""
+        self.store.create_indexes()
 
     def log_activity(
         self,
@@ -36,8 +99,8 @@ class audit_service:#————————————
     ) -> str:
         """记录带签名和加密的审计日志"""
         log = {
-            "timestamp": datetime.utcnow(),
-            "user_id": user_id,
+            "timestamp": None,  # 由哈希链在加锁后分配
+            "user_id": str(user_id) if user_id is not None else None,  # JWT 身份为字符串，统一保存为字符串
             "action": action,
             "resource": resource,
             "signature": None,
@@ -46,37 +109,56 @@ class audit_service:#————————————
 
         # 处理敏感数据
         if sensitive_data:
-            encrypted_data = self.encryption_service.encrypt(
-                json.dumps(sensitive_data).encode()
-            )
-            log["encrypted_data"] = encrypted_data
+            # nonce | 密文 | tag 的连续字节，以 BSON 二进制保存并纳入签名
+            log["encrypted_data"] = self.encryption_service.encrypt_many(
+                [json.dumps(sensitive_data, default=str).encode()]
+            )[0]
 
-        # 生成签名（排除 signature 字段）
-        data_without_sig = {
-            k: v for k, v in log.items() if k != "signature"
-        }
-        log["signature"] = self._generate_signature(data_without_sig)
+        # 接入哈希链并生成签名（签名覆盖 partition/seq/prev_signature，排除 signature 与 _id）
+        checkpoint = self.chain.link(log)
+        if self.rollups:
+            self.rollups.record(log)  # 仪表盘计数只在内存累加，后台批量写入汇总表
+
+        # 客户端生成 ObjectID，异步写入时也能立即返回
+        log["_id"] = ObjectId()
 
-        # 写入 MongoDB
-        result = self.mongo.db[self.audit_collection].insert_one(log)
-        return str(result.inserted_id)  # 返回 MongoDB 的 ObjectID
+        # 写入存储后端
+        if self.writer:
+            self.writer.submit(log)
+        else:
+            self.store.insert(log)
+        self._store_checkpoint(checkpoint)
+        return str(log["_id"])  # 返回 MongoDB 的 ObjectID
+
+    def _store_checkpoint(self, checkpoint: dict):
+        """保存签名检查点；异步写入时随记录入队，保证写在其对应记录之后"""
+        if not checkpoint:
+            return
+        if self.writer:
+            self.writer.submit_checkpoint(checkpoint)
+        else:
+            self.store.insert_checkpoint(checkpoint)
 
     def verify_log_integrity(self, log_id: str) -> bool:
         """验证日志条目签名是否被篡改"""
-        log = self.mongo.db[self.audit_collection].find_one(
-            {"_id": ObjectId(log_id)}
-        )
+        log = self.store.get(log_id)
         if not log:
             return False  # 日志不存在
 
-        # 移除 signature 字段重新计算
-        stored_sig = log.pop("signature")
-        calculated_sig = self._generate_signature(log)
-        return hmac.compare_digest(stored_sig, calculated_sig)
+        return self._verify_record(log)
+
+    def _verify_record(self, log: dict) -> bool:
+        """校验已读取记录的签名（不再查询数据库）"""
+        stored_sig = log.get("signature")
+        if not stored_sig:
+            return False
+        data = {k: v for k, v in log.items() if k not in ("_id", "signature")}
+        return hmac.compare_digest(stored_sig, self._generate_signature(data))
 
     def _generate_signature(self, data: dict) -> str:
         """生成 HMAC-SHA256 签名"""
-        msg = json.dumps(data, sort_keys=True).encode()
+        # datetime / ObjectId 按字符串序列化
+        msg = json.dumps(data, sort_keys=True, default=str).encode()
         return hmac.new(
             self.signing_key.encode(),  # 确保签名密钥为 bytes
             msg,
@@ -84,14 +166,60 @@ class audit_service:#————————————
         ).hexdigest()
 
     def search_logs(self, query: dict, verify_signature: bool = True) -> list:
-        """查询日志并验证签名（可选）"""
-        results = list(
-            self.mongo.db[self.audit_collection].find(query)
-        )
+        """查询日志并验证签名（可选）；配置冷归档时同时检索与条件时间范围相交的归档段"""
+        results = self.store.find(query)
         if verify_signature:
             for log in results:
-                if not self.verify_log_integrity(str(log["_id"])):
+                if not self._verify_record(log):
                     current_app.logger.error(
                         f"Tampered log detected: {log['_id']}"
                     )
-        return results
\ No newline at end of file
+        return results
+
+    def verify_range(self, start: datetime, end: datetime) -> dict:
+        """单遍流式校验 [start, end) 内的整条哈希链
+
+        一次游标扫描完成签名、序号连续性、前驱链接与检查点校验，
+        可发现篡改、删除、插入与重排的记录。
+        """
+        verifier = ChainVerifier(
+            self._verify_record,
+            self._generate_signature,
+            predecessor=self.store.signature_at,
+            checkpoints=self.store.checkpoints(start, end)
+        )
+        try:
+            for log in self.store.scan(start, end):
+                verifier.feed(log)
+        except ArchiveIntegrityError as e:
+            # 归档段页脚或正文被改动：之后的记录无法可信地读取，直接报告
+            report = verifier.report()
+            report["archive_failures"] = [str(e)]
+            report["ok"] = False
+            return report
+        return verifier.report()
+
+    def query_logs(self, query: AuditQuery, verify_signature: bool = False) -> dict:
+        """键集分页查询：返回一页记录及下一页游标（没有更多数据时为 None）"""
+        projection = None if verify_signature else query.projection()
+        logs = self.store.page(query, projection)
+        next_cursor = None
+        if len(logs) > query.limit:
+            logs = logs[:query.limit]
+            next_cursor = encode_cursor(logs[-1])
+        if verify_signature:
+            for log in logs:
+                log["verified"] = self._verify_record(log)
+        return {"items": logs, "next_cursor": next_cursor}
+
+    def export_logs(self, query: AuditQuery):
+        """流式导出所有匹配记录（生成器），内存占用与结果集大小无关；忽略 limit"""
+        yield from self.store.export(query)
+
+
+def audit_log(action: str, resource: str, sensitive_data: dict = None) -> str:
+    """路由中记录审计日志的快捷方式：操作人取自当前请求的 JWT"""
+    verify_jwt_in_request(optional=True)
+    return current_app.extensions['services']['audit'].log_activity(
+        get_jwt_identity(), action, resource, sensitive_data
+    )
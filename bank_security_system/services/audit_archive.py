@@ -0,0 +1,528 @@
+import os
+import hmac
+import json
+import zlib
+import fcntl
+import heapq
+import struct
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from bson import ObjectId, json_util
+from bson.json_util import JSONOptions, JSONMode
+from apscheduler.schedulers.background import BackgroundScheduler
+from .audit_segments import _sort_key
+from .audit_query import decode_cursor
+
+logger = logging.getLogger(__name__)
+
+# 冷归档默认参数
+DEFAULT_ARCHIVE_AGE = 90                  # 天；早于该天数的记录移入归档
+DEFAULT_ARCHIVE_INTERVAL = 3600           # 秒；后台归档任务的执行间隔
+DEFAULT_SEGMENT_RECORDS = 250000          # 每个归档段的记录数上限（同时限制归档时暂存的 _id 数）
+DELETE_BATCH_SIZE = 1000
+READ_SIZE = 1024 * 1024
+COMPRESS_LEVEL = 6
+LOOKUP_SLACK = timedelta(seconds=1)       # 按 _id 查找时，生成时间与 timestamp 的最大偏差
+
+# 段文件：gzip 压缩的 NDJSON 正文 + JSON 页脚 + 尾部（页脚长度、魔数）
+ARCHIVE_VERSION = 1
+SEGMENT_SUFFIX = '.ndjson.gz'
+PENDING_DELETE = '.pending-delete.json'   # 已封存、尚未从热存储删除的段及其 _id
+TRAILER = struct.Struct('>I8s')
+MAGIC = b'AUDARCH1'
+# 扩展 JSON：datetime / ObjectId / bytes 读回后类型不变，签名可原样校验
+JSON_OPTIONS = JSONOptions(json_mode=JSONMode.RELAXED, tz_aware=False)
+
+_EPOCH = datetime(1970, 1, 1)
+_DAY = timedelta(days=1)
+
+
+class ArchiveIntegrityError(Exception):
+    """归档段的页脚签名、正文摘要或链摘要不匹配"""
+
+
+def _page_key(record: dict) -> tuple:
+    return record["timestamp"], record["_id"]
+
+
+def _day(timestamp: datetime) -> datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class ArchiveSegment:
+    """已封存归档段的页脚信息（只读，按路径缓存）"""
+    __slots__ = ('path', 'footer', 'min_timestamp', 'max_timestamp')
+
+    def __init__(self, path: str, footer: dict):
+        self.path = path
+        self.footer = footer
+        self.min_timestamp = datetime.fromisoformat(footer["min_timestamp"])
+        self.max_timestamp = datetime.fromisoformat(footer["max_timestamp"])
+
+    def overlaps(self, start: datetime = None, end: datetime = None) -> bool:
+        """与 [start, end) 是否相交"""
+        return (start is None or self.max_timestamp >= start) and (end is None or self.min_timestamp < end)
+
+
+class _SegmentWriter:
+    """写出一个归档段：先写临时文件，封存时追加签名页脚，fsync 后原子改名"""
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.tmp_path = os.path.join(directory, f".{os.getpid()}.tmp")
+        self.file = open(self.tmp_path, 'wb')
+        self.compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)   # gzip 封装
+        self.body_digest = hashlib.sha256()
+        self.chain_digest = hashlib.sha256()
+        self.body_length = 0
+        self.ids = []
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.partitions = {}
+
+    def _emit(self, data: bytes):
+        if data:
+            self.file.write(data)
+            self.body_digest.update(data)
+            self.body_length += len(data)
+
+    def write(self, record: dict):
+        self._emit(self.compressor.compress(json_util.dumps(record, json_options=JSON_OPTIONS).encode() + b'\n'))
+        self.ids.append(record["_id"])
+        timestamp = record["timestamp"]
+        if self.min_timestamp is None or timestamp < self.min_timestamp:
+            self.min_timestamp = timestamp
+        if self.max_timestamp is None or timestamp > self.max_timestamp:
+            self.max_timestamp = timestamp
+        _chain_update(self.chain_digest, self.partitions, record)
+
+    def seal(self, sign, before_publish=None) -> ArchiveSegment:
+        self._emit(self.compressor.flush())
+        footer = {
+            "version": ARCHIVE_VERSION,
+            "count": len(self.ids),
+            "min_timestamp": self.min_timestamp.isoformat(),
+            "max_timestamp": self.max_timestamp.isoformat(),
+            "partitions": self.partitions,
+            "chain_digest": self.chain_digest.hexdigest(),
+            "body_length": self.body_length,
+            "body_sha256": self.body_digest.hexdigest(),
+        }
+        footer["signature"] = sign(footer)
+        data = json.dumps(footer, sort_keys=True).encode()
+        self.file.write(data + TRAILER.pack(len(data), MAGIC))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        name = f"{(self.min_timestamp - _EPOCH) // timedelta(milliseconds=1)}-{footer['chain_digest'][:16]}"
+        path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+        if before_publish is not None:
+            before_publish(path, self.ids)
+        os.replace(self.tmp_path, path)
+        _fsync_dir(self.directory)
+        return ArchiveSegment(path, footer)
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.unlink(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def _chain_update(digest, partitions: dict, record: dict):
+    """链摘要 = 段内记录签名按文件顺序的 SHA-256；各分区记录首尾序号与链头签名"""
+    digest.update((record.get("signature") or "").encode())
+    partition = record.get("partition")
+    if partition is None:
+        return
+    state = partitions.get(partition)
+    if state is None:
+        partitions[partition] = {
+            "first_seq": record["seq"], "last_seq": record["seq"], "count": 1,
+            "prev_signature": record.get("prev_signature"), "head": record["signature"],
+        }
+    else:
+        state["first_seq"] = min(state["first_seq"], record["seq"])
+        state["last_seq"] = max(state["last_seq"], record["seq"])
+        state["count"] += 1
+        state["head"] = record["signature"]
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _dict_matcher(query: dict):
+    """search_logs 的 MongoDB 风格条件：字段相等，以及 $eq/$in/$gt/$gte/$lt/$lte"""
+    operators = {
+        "$eq": lambda v, x: v == x,
+        "$in": lambda v, x: v in x,
+        "$gt": lambda v, x: v is not None and v > x,
+        "$gte": lambda v, x: v is not None and v >= x,
+        "$lt": lambda v, x: v is not None and v < x,
+        "$lte": lambda v, x: v is not None and v <= x,
+    }
+    conditions = []
+    for key, value in query.items():
+        if key.startswith('$'):
+            raise ValueError(f"Archived audit search does not support {key}")
+        if isinstance(value, dict):
+            for op, operand in value.items():
+                if op not in operators:
+                    raise ValueError(f"Archived audit search does not support {op}")
+                conditions.append((key, operators[op], operand))
+        else:
+            conditions.append((key, operators["$eq"], value))
+    return lambda record: all(test(record.get(key), operand) for key, test, operand in conditions)
+
+
+def _time_bounds(query: dict) -> tuple:
+    """从 timestamp 条件推出 [start, end)，用于跳过不相交的段"""
+    condition = query.get("timestamp")
+    if not isinstance(condition, dict):
+        if isinstance(condition, datetime):
+            return condition, condition + timedelta(milliseconds=1)
+        return None, None
+    start = condition.get("$gte", condition.get("$gt"))
+    end = condition.get("$lt")
+    if "$lte" in condition:
+        end = condition["$lte"] + timedelta(milliseconds=1)
+    return start, end
+
+
+class AuditArchive:
+    """冷归档：按天分目录的压缩 NDJSON 段
+
+    每段页脚记录条数、时间范围、各分区序号范围与链头、正文与链摘要，并以审计签名
+    密钥签名。查询先按日期目录、再按页脚的最小/最大时间跳过不相交的段；页脚只读，
+    按路径缓存。读取段时校验页脚签名，读完后校验正文与链摘要。
+    """
+    def __init__(self, root: str, signing_key: str):
+        self.root = root
+        self.signing_key = signing_key.encode()
+        os.makedirs(root, exist_ok=True)
+        self._footers = {}
+
+    def _sign(self, footer: dict) -> str:
+        body = {k: v for k, v in footer.items() if k != "signature"}
+        msg = json.dumps(body, sort_keys=True, default=str).encode()
+        return hmac.new(self.signing_key, msg, hashlib.sha256).hexdigest()
+
+    # ---- 写入 ----
+
+    def writer(self, day: datetime) -> _SegmentWriter:
+        return _SegmentWriter(os.path.join(self.root, day.strftime('%Y-%m-%d')))
+
+    def seal(self, writer: _SegmentWriter) -> ArchiveSegment:
+        """封存段；改名发布前先写待删除清单，崩溃后由 pending() 找回未删完的 _id"""
+        segment = writer.seal(self._sign, before_publish=self._write_pending)
+        self._footers[segment.path] = segment
+        return segment
+
+    def _write_pending(self, path: str, ids: list):
+        manifest = os.path.join(self.root, PENDING_DELETE)
+        tmp = manifest + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(json_util.dumps({"segment": path, "ids": ids}, json_options=JSON_OPTIONS))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, manifest)
+        _fsync_dir(self.root)
+
+    def pending(self):
+        """上次中断的待删除清单：(段路径, _id 列表)；没有时返回 None"""
+        try:
+            with open(os.path.join(self.root, PENDING_DELETE)) as f:
+                manifest = json_util.loads(f.read(), json_options=JSON_OPTIONS)
+        except FileNotFoundError:
+            return None
+        return manifest["segment"], manifest["ids"]
+
+    def clear_pending(self):
+        try:
+            os.unlink(os.path.join(self.root, PENDING_DELETE))
+        except FileNotFoundError:
+            return
+        _fsync_dir(self.root)
+
+    def lock(self):
+        """归档任务的进程间互斥（非阻塞）；已被占用时返回 None"""
+        lock = open(os.path.join(self.root, '.archive.lock'), 'a+b')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+    # ---- 段索引 ----
+
+    def _load(self, path: str) -> ArchiveSegment:
+        segment = self._footers.get(path)
+        if segment is None:
+            with open(path, 'rb') as f:
+                f.seek(-TRAILER.size, os.SEEK_END)
+                length, magic = TRAILER.unpack(f.read(TRAILER.size))
+                if magic != MAGIC:
+                    raise ArchiveIntegrityError(f"{path}: missing archive footer")
+                f.seek(-TRAILER.size - length, os.SEEK_END)
+                footer = json.loads(f.read(length))
+            if not hmac.compare_digest(footer.get("signature", ""), self._sign(footer)):
+                raise ArchiveIntegrityError(f"{path}: invalid footer signature")
+            segment = self._footers[path] = ArchiveSegment(path, footer)
+        return segment
+
+    def segments(self, start: datetime = None, end: datetime = None) -> list:
+        """与 [start, end) 相交的段，按最小时间升序"""
+        try:
+            days = sorted(os.listdir(self.root))
+        except FileNotFoundError:
+            return []
+        segments = []
+        for name in days:
+            try:
+                day = datetime.strptime(name, '%Y-%m-%d')
+            except ValueError:
+                continue
+            # 日期目录即第一层时间索引，不相交的日期不读取页脚
+            if (start and day + _DAY <= start) or (end and day >= end):
+                continue
+            directory = os.path.join(self.root, name)
+            for filename in os.listdir(directory):
+                if filename.endswith(SEGMENT_SUFFIX):
+                    segment = self._load(os.path.join(directory, filename))
+                    if segment.overlaps(start, end):
+                        segments.append(segment)
+        segments.sort(key=lambda s: (s.min_timestamp, s.max_timestamp))
+        return segments
+
+    @staticmethod
+    def _clusters(segments: list) -> list:
+        """把时间范围相互重叠的段分为一组，组与组之间时间不相交"""
+        clusters = []
+        for segment in segments:
+            if clusters and segment.min_timestamp <= clusters[-1][1]:
+                group, upper = clusters[-1]
+                group.append(segment)
+                clusters[-1] = (group, max(upper, segment.max_timestamp))
+            else:
+                clusters.append(([segment], segment.max_timestamp))
+        return [group for group, _ in clusters]
+
+    # ---- 读取 ----
+
+    def records(self, segment: ArchiveSegment):
+        """按文件顺序产出段内记录；读完后正文或链摘要不符时抛出 ArchiveIntegrityError"""
+        footer = segment.footer
+        decompressor = zlib.decompressobj(31)
+        body_digest = hashlib.sha256()
+        chain_digest = hashlib.sha256()
+        partitions = {}
+        pending = b''
+        count = 0
+        with open(segment.path, 'rb') as f:
+            remaining = footer["body_length"]
+            while remaining:
+                chunk = f.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                body_digest.update(chunk)
+                try:
+                    lines = (pending + decompressor.decompress(chunk)).split(b'\n')
+                except zlib.error:
+                    raise ArchiveIntegrityError(f"{segment.path}: corrupt body")
+                pending = lines.pop()
+                for line in lines:
+                    record = json_util.loads(line, json_options=JSON_OPTIONS)
+                    _chain_update(chain_digest, partitions, record)
+                    count += 1
+                    yield record
+        if (remaining or pending or count != footer["count"]
+                or body_digest.hexdigest() != footer["body_sha256"]
+                or chain_digest.hexdigest() != footer["chain_digest"]):
+            raise ArchiveIntegrityError(f"{segment.path}: body does not match footer")
+
+    def _merged(self, segments: list):
+        return heapq.merge(*(self.records(segment) for segment in segments), key=_sort_key)
+
+    def scan(self, start: datetime, end: datetime):
+        """[start, end) 内的归档记录，按 (timestamp, seq) 升序"""
+        for group in self._clusters(self.segments(start, end)):
+            for record in self._merged(group):
+                if start <= record["timestamp"] < end:
+                    yield record
+
+    def signature_at(self, partition: str, seq: int):
+        for segment in self.segments():
+            state = segment.footer["partitions"].get(partition)
+            if state is None or not state["first_seq"] <= seq <= state["last_seq"]:
+                continue
+            if seq == state["last_seq"]:
+                return state["head"]     # 页脚已记录链头，无需解压
+            for record in self.records(segment):
+                if record.get("partition") == partition and record.get("seq") == seq:
+                    return record["signature"]
+        return None
+
+    def get(self, log_id: str):
+        oid = ObjectId(log_id)
+        generated = oid.generation_time.replace(tzinfo=None)
+        for record in self.scan(generated - LOOKUP_SLACK, generated + 2 * LOOKUP_SLACK):
+            if record["_id"] == oid:
+                return record
+        return None
+
+    def find(self, query: dict) -> list:
+        matches = _dict_matcher(query)
+        start, end = _time_bounds(query)
+        return [record for segment in self.segments(start, end)
+                for record in self.records(segment) if matches(record)]
+
+    def _query_groups(self, query, floor: datetime = None):
+        """按时间降序产出与查询相交的段组内的匹配记录（每组一个列表）"""
+        start = max(filter(None, (query.start, floor)), default=None)
+        end = query.end
+        if query.cursor:
+            # 游标位置之后（更旧）的记录才需要；游标时间本身仍可能有同毫秒记录
+            cursor_end = decode_cursor(query.cursor)[0] + timedelta(milliseconds=1)
+            end = min(end, cursor_end) if end else cursor_end
+        for group in reversed(self._clusters(self.segments(start, end))):
+            yield [record for record in self._merged(group)
+                   if query.matches(record) and (floor is None or record["timestamp"] >= floor)]
+
+    def page(self, query, projection=None, floor: datetime = None) -> list:
+        """按 (timestamp, _id) 降序取 limit + 1 条；只读取不早于 floor 的段
+
+        段组之间时间不相交，从最新的组开始，凑够 limit + 1 条后不再读取更旧的组。
+        """
+        records = []
+        for matches in self._query_groups(query, floor):
+            records.extend(matches)
+            if len(records) > query.limit:
+                break
+        records = heapq.nlargest(query.limit + 1, records, key=_page_key)
+        return [query.project(record) for record in records] if projection is not None else records
+
+    def export(self, query):
+        """降序导出；内存占用为单个段组内的匹配记录"""
+        for matches in self._query_groups(query):
+            matches.sort(key=_page_key, reverse=True)
+            for record in matches:
+                yield query.project(record)
+
+
+class AuditArchiver:
+    """后台把早于 AUDIT_ARCHIVE_AGE_DAYS 天的热记录移入冷归档
+
+    按天逐段写出，段封存（fsync + 改名）后才按 _id 从热存储删除。改名前先把段路径
+    与 _id 写入待删除清单，删除完成后清除；删除中途崩溃时，下次归档先按清单删完
+    剩余记录，不会把已归档的记录再写进新段。多个 worker 同时运行时由归档目录下的
+    文件锁互斥。
+    检查点集合很小，保留在热存储中供 verify_range 使用。
+    """
+    def __init__(
+        self,
+        age_days: int = DEFAULT_ARCHIVE_AGE,
+        interval: int = DEFAULT_ARCHIVE_INTERVAL,
+        segment_records: int = DEFAULT_SEGMENT_RECORDS
+    ):
+        self.age_days = age_days
+        self.interval = interval
+        self.segment_records = segment_records
+        self.store = None
+        self.scheduler = None
+
+    def init_app(self, app, audit):
+        self.age_days = app.config.get('AUDIT_ARCHIVE_AGE_DAYS', DEFAULT_ARCHIVE_AGE)
+        self.interval = app.config.get('AUDIT_ARCHIVE_INTERVAL', DEFAULT_ARCHIVE_INTERVAL)
+        self.segment_records = app.config.get('AUDIT_ARCHIVE_SEGMENT_RECORDS', DEFAULT_SEGMENT_RECORDS)
+        self.store = audit.store
+        if getattr(self.store, 'archive', None) is None:
+            return   # 未配置 AUDIT_ARCHIVE_PATH
+        if app.config.get('AUDIT_ARCHIVER_ENABLED', True):
+            self.scheduler = BackgroundScheduler()
+            self.scheduler.add_job(self._run, 'interval', seconds=self.interval, max_instances=1)
+            self.scheduler.start()
+
+    def _run(self):
+        try:
+            self.archive()
+        except Exception:
+            logger.exception("Audit archival failed")
+
+    def archive(self, now: datetime = None) -> int:
+        """归档截止日（整天）之前的热记录，返回归档条数；其他进程正在归档时返回 0"""
+        hot, archive = self.store.hot, self.store.archive
+        cutoff = _day((now or datetime.utcnow()) - timedelta(days=self.age_days))
+        lock = archive.lock()
+        if lock is None:
+            return 0
+        archived = 0
+        try:
+            self._resume(hot, archive)
+            day = self._next_day(hot, _EPOCH, cutoff)
+            while day is not None:
+                archived += self._archive_day(hot, archive, day)
+                day = self._next_day(hot, day + _DAY, cutoff)
+        finally:
+            lock.close()
+        return archived
+
+    @staticmethod
+    def _next_day(hot, start: datetime, cutoff: datetime):
+        """[start, cutoff) 内最早一条热记录所在的日期，没有时返回 None"""
+        if start >= cutoff:
+            return None
+        for record in hot.scan(start, cutoff):
+            return _day(record["timestamp"])
+        return None
+
+    def _archive_day(self, hot, archive, day: datetime) -> int:
+        archived = 0
+        writer = None
+        try:
+            for record in hot.scan(day, day + _DAY):
+                if writer is None:
+                    writer = archive.writer(day)
+                writer.write(record)
+                if len(writer.ids) >= self.segment_records:
+                    archived += self._seal(hot, archive, writer)
+                    writer = None
+            if writer is not None:
+                archived += self._seal(hot, archive, writer)
+                writer = None
+        finally:
+            if writer is not None:
+                writer.abort()
+        return archived
+
+    @staticmethod
+    def _delete(hot, ids: list):
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            hot.delete(ids[start:start + DELETE_BATCH_SIZE])
+
+    def _resume(self, hot, archive):
+        """完成上次中断的删除；清单中的段未发布（改名前崩溃）时热记录原样保留，重新归档"""
+        pending = archive.pending()
+        if pending is None:
+            return
+        path, ids = pending
+        if os.path.exists(path):
+            self._delete(hot, ids)
+            logger.info("Finished deleting %d archived audit records for %s", len(ids), path)
+        archive.clear_pending()
+
+    @classmethod
+    def _seal(cls, hot, archive, writer: _SegmentWriter) -> int:
+        segment = archive.seal(writer)
+        cls._delete(hot, writer.ids)
+        archive.clear_pending()
+        logger.info("Archived %d audit records to %s", segment.footer["count"], segment.path)
+        return segment.footer["count"]
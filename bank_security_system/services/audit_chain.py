@@ -0,0 +1,171 @@
+import os
+import socket
+import threading
+from datetime import datetime
+from bson import ObjectId
+
+DEFAULT_CHECKPOINT_INTERVAL = 1000
+
+
+def utc_now_ms() -> datetime:
+    """MongoDB 只保存毫秒精度，签名前先截断，避免读回后签名不一致"""
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+class AuditChain:
+    """按分区维护的审计哈希链
+
+    每个进程一个分区，分区内记录依次编号（seq），并携带前一条记录的签名
+    （prev_signature）。删除、插入或重排记录都会导致序号断档或链接不匹配。
+    每隔 checkpoint_interval 条记录生成一个签名检查点，用于发现尾部截断。
+    """
+    def __init__(self, signer, checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL):
+        self.signer = signer
+        self.checkpoint_interval = checkpoint_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # fork 后子进程必须使用新分区，否则多个进程会写出相同序号
+        self.pid = os.getpid()
+        self.partition = f"{socket.gethostname()}:{self.pid}:{ObjectId()}"
+        self.seq = -1
+        self.last_signature = self.genesis(self.partition)
+        self.last_timestamp = None
+
+    def genesis(self, partition: str) -> str:
+        """分区链的起点"""
+        return self.signer({"genesis": partition})
+
+    def link(self, record: dict):
+        """为记录分配时间戳、序号和前驱签名并签名；到达间隔时返回检查点"""
+        with self._lock:
+            if os.getpid() != self.pid:
+                self._reset()
+            # 时间戳在锁内分配且单调不减，保证按时间排序即按序号排序
+            timestamp = utc_now_ms()
+            if self.last_timestamp and timestamp < self.last_timestamp:
+                timestamp = self.last_timestamp
+            self.seq += 1
+            record["timestamp"] = timestamp
+            record["partition"] = self.partition
+            record["seq"] = self.seq
+            record["prev_signature"] = self.last_signature
+            record["signature"] = self.signer(
+                {k: v for k, v in record.items() if k not in ("_id", "signature")}
+            )
+            self.last_signature = record["signature"]
+            self.last_timestamp = timestamp
+            if (self.seq + 1) % self.checkpoint_interval == 0:
+                return self._checkpoint()
+            return None
+
+    def checkpoint(self):
+        """为当前分区的最后一条记录生成检查点（无记录时返回 None）"""
+        with self._lock:
+            if self.seq < 0 or os.getpid() != self.pid:
+                return None
+            return self._checkpoint()
+
+    def _checkpoint(self) -> dict:
+        checkpoint = {
+            "type": "checkpoint",
+            "partition": self.partition,
+            "seq": self.seq,
+            "record_signature": self.last_signature,
+            "timestamp": self.last_timestamp,
+        }
+        checkpoint["signature"] = self.signer(checkpoint)
+        return checkpoint
+
+
+class ChainVerifier:
+    """单遍流式校验审计链
+
+    记录需按 (timestamp, seq) 顺序输入；只为每个分区保存最后一条记录的状态，
+    内存占用与记录数无关。
+    """
+    def __init__(self, verify_record, signer, predecessor=None, checkpoints=()):
+        self.verify_record = verify_record
+        self.signer = signer
+        self.predecessor = predecessor  # (partition, seq) -> 前驱签名或 None
+        self.partitions = {}
+        self.checkpoints = {}
+        self.result = {
+            "verified": 0,
+            "unchained": 0,
+            "tampered": [],
+            "broken_links": [],
+            "gaps": [],
+            "checkpoint_failures": [],
+        }
+        for checkpoint in checkpoints:
+            self._add_checkpoint(checkpoint)
+
+    def _add_checkpoint(self, checkpoint: dict):
+        """检查点数量约为记录数的 1/interval，预先载入后在扫描中逐条比对"""
+        body = {k: v for k, v in checkpoint.items() if k not in ("_id", "signature")}
+        if self.signer(body) != checkpoint.get("signature"):
+            self._checkpoint_failure(checkpoint, "invalid checkpoint signature")
+            return
+        key = (checkpoint["partition"], checkpoint["seq"])
+        self.checkpoints[key] = checkpoint["record_signature"]
+
+    def _checkpoint_failure(self, checkpoint: dict, reason: str):
+        self.result["checkpoint_failures"].append({
+            "partition": checkpoint.get("partition"),
+            "seq": checkpoint.get("seq"),
+            "reason": reason,
+        })
+
+    def feed(self, record: dict):
+        result = self.result
+        valid = self.verify_record(record)
+        if not valid:
+            result["tampered"].append(str(record.get("_id")))
+        if "partition" not in record:
+            # 启用哈希链之前的旧记录只能校验单条签名
+            if valid:
+                result["unchained"] += 1
+            return
+
+        partition, seq = record["partition"], record["seq"]
+        state = self.partitions.get(partition)
+        if state is None:
+            expected_prev = self._expected_first_prev(partition, seq)
+        else:
+            last_seq, expected_prev = state
+            if seq != last_seq + 1:
+                result["gaps"].append({"partition": partition, "from": last_seq + 1, "to": seq - 1})
+                expected_prev = None
+        if expected_prev is not None and record["prev_signature"] != expected_prev:
+            result["broken_links"].append(str(record.get("_id")))
+        expected = self.checkpoints.pop((partition, seq), None)
+        if expected is not None and expected != record["signature"]:
+            self._checkpoint_failure(record, "checkpoint does not match record")
+        self.partitions[partition] = (seq, record["signature"])
+        if valid:
+            result["verified"] += 1
+
+    def _expected_first_prev(self, partition: str, seq: int):
+        """区间内分区的第一条记录：序号 0 对应链起点，否则查询前驱记录"""
+        if seq == 0:
+            return self.signer({"genesis": partition})
+        if not self.predecessor:
+            return None
+        previous = self.predecessor(partition, seq - 1)
+        if previous is None:
+            self.result["gaps"].append({"partition": partition, "from": seq - 1, "to": seq - 1})
+        return previous
+
+    def report(self) -> dict:
+        # 未被匹配的检查点说明其对应记录已被删除（包括尾部截断）
+        for (partition, seq) in self.checkpoints:
+            self._checkpoint_failure({"partition": partition, "seq": seq}, "checkpointed record missing")
+        self.checkpoints = {}
+        result = dict(self.result)
+        result["ok"] = not any(
+            result[k] for k in ("tampered", "broken_links", "gaps", "checkpoint_failures")
+        )
+        return result
@@ -0,0 +1,177 @@
+import re
+import base64
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# 分页默认值与上限
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+# 允许投影的字段（防止任意字段名透传到 MongoDB）
+PROJECTABLE_FIELDS = (
+    "timestamp", "user_id", "action", "resource", "signature",
+    "encrypted_data", "partition", "seq", "prev_signature",
+)
+
+# 与查询形状对应的复合索引，排序键统一为 (timestamp, _id) 降序
+AUDIT_INDEXES = (
+    [("timestamp", -1), ("_id", -1)],
+    [("user_id", 1), ("timestamp", -1), ("_id", -1)],
+    [("action", 1), ("timestamp", -1), ("_id", -1)],
+    [("resource", 1), ("timestamp", -1), ("_id", -1)],
+)
+
+
+_EPOCH = datetime(1970, 1, 1)  # MongoDB 返回的时间为不带时区的 UTC
+
+
+def _parse_time(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value}")
+
+
+def encode_cursor(log: dict) -> str:
+    """游标 = 最后一条记录的 (timestamp, _id)，对客户端不透明"""
+    ms = (log["timestamp"] - _EPOCH) // timedelta(milliseconds=1)
+    return base64.urlsafe_b64encode(f"{ms}:{log['_id']}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        ms, oid = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        return _EPOCH + timedelta(milliseconds=int(ms)), ObjectId(oid)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+class AuditQuery:
+    """审计日志查询条件（类型化、已校验）
+
+    按 (timestamp, _id) 降序做键集分页，每个过滤条件都有对应的复合索引。
+    """
+    def __init__(
+        self,
+        user_id=None,
+        action: str = None,
+        resource: str = None,
+        resource_prefix: str = None,
+        start: datetime = None,
+        end: datetime = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: str = None,
+        fields: list = None
+    ):
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        unknown = set(fields or ()) - set(PROJECTABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        if cursor:
+            decode_cursor(cursor)  # 提前校验游标格式
+        self.user_id = str(user_id) if user_id is not None else None  # 与 log_activity 一致统一为字符串
+        self.action = action
+        self.resource = resource
+        self.resource_prefix = resource_prefix
+        self.start = start
+        self.end = end
+        self.limit = limit
+        self.cursor = cursor
+        self.fields = fields
+
+    @classmethod
+    def from_args(cls, args) -> "AuditQuery":
+        """从请求参数（request.args）构造，非法参数抛出 ValueError"""
+        allowed = {
+            "user_id", "action", "resource", "resource_prefix",
+            "start", "end", "limit", "cursor", "fields",
+        }
+        unknown = set(args) - allowed
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        try:
+            limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        return cls(
+            user_id=args.get("user_id"),
+            action=args.get("action"),
+            resource=args.get("resource"),
+            resource_prefix=args.get("resource_prefix"),
+            start=_parse_time(args["start"]) if args.get("start") else None,
+            end=_parse_time(args["end"]) if args.get("end") else None,
+            limit=limit,
+            cursor=args.get("cursor"),
+            fields=args["fields"].split(",") if args.get("fields") else None,
+        )
+
+    def filter(self) -> dict:
+        """生成 MongoDB 过滤条件（含游标位置）"""
+        query = {}
+        if self.user_id is not None:
+            if self.user_id.isdigit():
+                # 历史记录中的数字 ID 可能以整数保存
+                query["user_id"] = {"$in": [self.user_id, int(self.user_id)]}
+            else:
+                query["user_id"] = self.user_id
+        if self.action:
+            query["action"] = self.action
+        if self.resource:
+            query["resource"] = self.resource
+        elif self.resource_prefix:
+            # 锚定前缀的正则可以使用 resource 索引
+            query["resource"] = {"$regex": "^" + re.escape(self.resource_prefix)}
+        if self.start or self.end:
+            query["timestamp"] = {}
+            if self.start:
+                query["timestamp"]["$gte"] = self.start
+            if self.end:
+                query["timestamp"]["$lt"] = self.end
+        if self.cursor:
+            timestamp, oid = decode_cursor(self.cursor)
+            query = {"$and": [query, {"$or": [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": oid}},
+            ]}]}
+        return query
+
+    def matches(self, log: dict) -> bool:
+        """与 filter() 等价的内存判定（本地存储后端逐条扫描时使用）"""
+        if self.user_id is not None and (log.get("user_id") is None or str(log["user_id"]) != self.user_id):
+            return False
+        if self.action and log.get("action") != self.action:
+            return False
+        if self.resource:
+            if log.get("resource") != self.resource:
+                return False
+        elif self.resource_prefix and not str(log.get("resource") or "").startswith(self.resource_prefix):
+            return False
+        timestamp = log.get("timestamp")
+        if self.start and (timestamp is None or timestamp < self.start):
+            return False
+        if self.end and (timestamp is None or timestamp >= self.end):
+            return False
+        if self.cursor:
+            cursor_time, oid = decode_cursor(self.cursor)
+            if not (timestamp < cursor_time or (timestamp == cursor_time and log["_id"] < oid)):
+                return False
+        return True
+
+    def project(self, log: dict) -> dict:
+        """按 projection() 裁剪记录（_id 始终保留，与 MongoDB 一致）"""
+        projection = self.projection()
+        if projection is None:
+            return log
+        return {k: v for k, v in log.items() if k == "_id" or k in projection}
+
+    def projection(self):
+        if not self.fields:
+            return None
+        return {field: 1 for field in self.fields} | {"timestamp": 1}
+
+    @staticmethod
+    def sort() -> list:
+        return [("timestamp", -1), ("_id", -1)]
@@ -0,0 +1,230 @@
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from apscheduler.schedulers.background import BackgroundScheduler
+from models.audit_rollup import AuditRollup
+from .audit_query import _parse_time
+
+logger = logging.getLogger(__name__)
+
+# 审计汇总默认参数
+DEFAULT_FLUSH_INTERVAL = 5      # 秒；各 worker 把内存中的增量写入汇总表的间隔
+MAX_ROWS = 10000                # 单次查询返回的汇总行数上限
+MAX_RANGE = timedelta(days=366)
+SUBJECT_MAX_LENGTH = 255
+
+
+def _hour(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _day(timestamp: datetime) -> datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _actor(log: dict) -> str:
+    """操作人；匿名记录（如登录失败）以目标用户 resource（user:<用户名>）计，便于统计每个用户的失败登录"""
+    if log.get("user_id") is not None:
+        return str(log["user_id"])
+    resource = log.get("resource") or ""
+    return resource if resource.startswith("user:") else ""
+
+
+def _resource_prefix(log: dict) -> str:
+    """resource 的类型前缀：transaction:42 -> transaction"""
+    return (log.get("resource") or "").split(":", 1)[0]
+
+
+# 汇总类型：名称 -> (时间桶粒度, 主体)；每条审计记录在每种汇总中各累加一次
+ROLLUPS = {
+    "action_hour": (_hour, lambda log: ""),
+    "user_day": (_day, _actor),
+    "resource_day": (_day, _resource_prefix),
+}
+
+
+def _increment(session, rows: list):
+    """按唯一键累加计数（各数据库的 upsert 语法不同）"""
+    table = AuditRollup.__table__
+    dialect = session.get_bind(AuditRollup).dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update(count=table.c['count'] + stmt.inserted['count'])
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['rollup', 'subject', 'action', 'bucket'],
+            set_={'count': table.c['count'] + stmt.excluded['count']}
+        )
+    else:
+        raise RuntimeError(f"Audit rollups do not support the {dialect} dialect")
+    session.execute(stmt, rows)
+
+
+def _rows(counts: Counter) -> list:
+    # 按唯一键排序写入，多个 worker 并发 upsert 时加锁顺序一致，避免死锁
+    return [
+        {'rollup': rollup, 'subject': subject, 'action': action, 'bucket': bucket, 'count': count}
+        for (rollup, subject, action, bucket), count in sorted(counts.items())
+    ]
+
+
+class RollupQuery:
+    """汇总查询条件：按 (rollup, [subject], [action], bucket 区间) 走索引范围读取"""
+    def __init__(
+        self,
+        rollup: str,
+        start: datetime,
+        end: datetime,
+        action: str = None,
+        subject: str = None,
+        limit: int = MAX_ROWS
+    ):
+        if rollup not in ROLLUPS:
+            raise ValueError(f"rollup must be one of {', '.join(ROLLUPS)}")
+        if not start < end <= start + MAX_RANGE:
+            raise ValueError(f"end must be after start and within {MAX_RANGE.days} days")
+        if not 1 <= limit <= MAX_ROWS:
+            raise ValueError(f"limit must be between 1 and {MAX_ROWS}")
+        self.rollup = rollup
+        self.start = start
+        self.end = end
+        self.action = action
+        self.subject = subject
+        self.limit = limit
+
+    @classmethod
+    def from_args(cls, args) -> "RollupQuery":
+        """从请求参数构造，非法参数抛出 ValueError"""
+        unknown = set(args) - {"rollup", "start", "end", "action", "subject", "limit"}
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        if not args.get("rollup") or not args.get("start") or not args.get("end"):
+            raise ValueError("rollup, start and end are required")
+        try:
+            limit = int(args.get("limit", MAX_ROWS))
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        return cls(
+            rollup=args["rollup"],
+            start=_parse_time(args["start"]),
+            end=_parse_time(args["end"]),
+            action=args.get("action") or None,
+            subject=args.get("subject"),
+            limit=limit,
+        )
+
+
+class AuditRollups:
+    """增量维护的审计计数汇总（action_hour / user_day / resource_day）
+
+    log_activity 签名后调用 record()，只在内存中累加；后台任务每隔 flush_interval
+    秒把增量按唯一键 upsert 到 audit_rollups 表（计数相加，多 worker 互不覆盖）。
+    仪表盘读取汇总表的索引范围，代价与时间桶数量相关而与审计记录数无关。
+    计数在记录入队时累加，进程崩溃会丢失最多一个刷新间隔的增量；需要精确值时
+    可用 rebuild() 从审计存储重算已结束的时间段。
+    """
+    def __init__(self, flush_interval: int = DEFAULT_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.app = None
+        self.scheduler = None
+        self._pending = Counter()   # (rollup, subject, action, bucket) -> 增量
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = app.config.get('AUDIT_ROLLUP_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        if app.config.get('AUDIT_ROLLUP_FLUSHER_ENABLED', True):
+            self.scheduler = BackgroundScheduler()
+            self.scheduler.add_job(self._run, 'interval', seconds=self.flush_interval, max_instances=1)
+            self.scheduler.start()
+
+    @staticmethod
+    def _keys(log: dict):
+        action = log.get("action") or ""
+        for name, (bucket, subject) in ROLLUPS.items():
+            yield name, subject(log)[:SUBJECT_MAX_LENGTH], action, bucket(log["timestamp"])
+
+    def record(self, log: dict):
+        keys = list(self._keys(log))
+        with self._lock:
+            self._pending.update(keys)
+
+    def _run(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Audit rollup flush failed")
+
+    def flush(self) -> int:
+        """把内存中的增量写入汇总表，返回写入的行数；失败时增量留待下次写入"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending or self.app is None:
+            return 0
+        rows = _rows(pending)
+        with self.app.app_context():
+            session = AuditRollup.query.session
+            try:
+                _increment(session, rows)
+                session.commit()
+            except Exception:
+                session.rollback()
+                with self._lock:
+                    self._pending.update(pending)
+                raise
+        return len(rows)
+
+    def close(self):
+        """停止后台任务并写出剩余增量（进程退出时由审计服务调用）"""
+        if self.scheduler:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+        self._run()
+
+    def query(self, query: RollupQuery) -> dict:
+        rows = AuditRollup.query.with_entities(
+            AuditRollup.subject, AuditRollup.action, AuditRollup.bucket, AuditRollup.count
+        ).filter(
+            AuditRollup.rollup == query.rollup,
+            AuditRollup.bucket >= query.start,
+            AuditRollup.bucket < query.end
+        )
+        if query.subject is not None:
+            rows = rows.filter(AuditRollup.subject == query.subject)
+        if query.action:
+            rows = rows.filter(AuditRollup.action == query.action)
+        rows = rows.order_by(AuditRollup.bucket, AuditRollup.subject, AuditRollup.action).limit(query.limit + 1).all()
+        return {
+            "rollup": query.rollup,
+            "items": [
+                {"subject": subject, "action": action, "bucket": bucket.isoformat(), "count": count}
+                for subject, action, bucket, count in rows[:query.limit]
+            ],
+            "truncated": len(rows) > query.limit,
+        }
+
+    def rebuild(self, store, start: datetime, end: datetime) -> int:
+        """从审计存储重算 [start, end) 内整天的汇总（用于启用前的历史数据或崩溃后校正）
+
+        只应对已结束的时间段调用：重算期间写入该区间的增量会被覆盖。返回扫描的记录数。
+        """
+        start, end = _day(start), _day(end)
+        counts = Counter()
+        scanned = 0
+        for log in store.scan(start, end):
+            counts.update(self._keys(log))
+            scanned += 1
+        session = AuditRollup.query.session
+        session.execute(delete(AuditRollup).where(AuditRollup.bucket >= start, AuditRollup.bucket < end))
+        if counts:
+            _increment(session, _rows(counts))
+        session.commit()
+        return scanned
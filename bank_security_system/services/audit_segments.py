@@ -0,0 +1,414 @@
+import os
+import re
+import mmap
+import zlib
+import fcntl
+import heapq
+import socket
+import struct
+import logging
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import bson
+from bson import ObjectId
+from .audit_writer import _only_duplicates
+
+logger = logging.getLogger(__name__)
+
+# 分段存储默认参数
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024   # 字节；超过后切换到新段
+DEFAULT_FSYNC_INTERVAL = 0.05             # 秒；批量 fsync 的最长间隔
+INDEX_INTERVAL = 256                      # 每隔多少条记录写一个稀疏索引项
+REORDER_WINDOW = 4096                     # 扫描时的重排缓冲（条）
+REORDER_SLACK = timedelta(seconds=1)      # 越过 end 多久后停止扫描一个流
+FORWARD_BATCH_SIZE = 1000
+
+# 记录格式：头部（正文长度、CRC32、类型）+ BSON 正文
+RECORD_HEADER = struct.Struct('>IIB')
+KIND_LOG = 0
+KIND_CHECKPOINT = 1
+# 稀疏索引项：该偏移之前本段记录的最大时间戳（毫秒）与最大序号，以及偏移
+INDEX_ENTRY = struct.Struct('>qqQ')
+POSITION = struct.Struct('>QQ')           # 转发位置：段号、偏移
+
+_EPOCH = datetime(1970, 1, 1)
+_FAR_FUTURE = datetime(9999, 1, 1)
+
+
+def _ms(timestamp: datetime) -> int:
+    return (timestamp - _EPOCH) // timedelta(milliseconds=1)
+
+
+def _stream_name(partition) -> str:
+    """分区名映射为目录名；无分区的记录按进程写入各自的流"""
+    name = partition or f"{socket.gethostname()}:{os.getpid()}"
+    return re.sub(r'[^A-Za-z0-9._-]', '_', name)
+
+
+def _sort_key(record: dict) -> tuple:
+    return record["timestamp"], record.get("seq", -1)
+
+
+class _StreamWriter:
+    """单个流的追加写入器（段文件 + 稀疏索引文件），由 SegmentedAuditStore 加锁调用"""
+    def __init__(self, path: str, segment_size: int):
+        self.path = path
+        self.segment_size = segment_size
+        os.makedirs(path, exist_ok=True)
+        segments = _segments(path)
+        # 已有的流（进程重启后的默认流）从新段开始，不续写可能残缺的尾部
+        self.number = segments[-1] + 1 if segments else 0
+        self.dirty = False
+        self._open()
+
+    def _open(self):
+        base = os.path.join(self.path, f"{self.number:08d}")
+        self.segment = open(base + '.seg', 'ab', buffering=1 << 20)
+        self.index = open(base + '.idx', 'ab')
+        self.size = 0
+        self.count = 0
+        self.max_ms = 0
+        self.max_seq = -1
+
+    def append(self, kind: int, record: dict):
+        if self.count % INDEX_INTERVAL == 0:
+            self.index.write(INDEX_ENTRY.pack(self.max_ms, self.max_seq, self.size))
+        body = bson.encode(record)
+        self.segment.write(RECORD_HEADER.pack(len(body), zlib.crc32(body), kind))
+        self.segment.write(body)
+        self.size += RECORD_HEADER.size + len(body)
+        self.count += 1
+        self.max_ms = max(self.max_ms, _ms(record["timestamp"]))
+        self.max_seq = max(self.max_seq, record.get("seq", -1))
+        self.dirty = True
+        if self.size >= self.segment_size:
+            self.close()
+            self.number += 1
+            self._open()
+
+    def flush(self):
+        """写入页缓存：进程崩溃不丢，主机掉电需等到 fsync"""
+        self.segment.flush()
+        self.index.flush()
+
+    def sync(self):
+        self.flush()
+        if self.dirty:
+            os.fsync(self.segment.fileno())
+            os.fsync(self.index.fileno())
+            self.dirty = False
+
+    def close(self):
+        self.sync()
+        self.segment.close()
+        self.index.close()
+
+
+def _segments(path: str) -> list:
+    return sorted(int(name[:-4]) for name in os.listdir(path) if name.endswith('.seg'))
+
+
+def _read_index(path: str) -> list:
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    return [INDEX_ENTRY.unpack_from(data, i) for i in range(0, len(data) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size)]
+
+
+def _start_offset(index: list, field: int, value: int) -> int:
+    """最后一个"之前最大值 < value"的索引项偏移：该偏移之前的记录都小于 value"""
+    keys = [entry[field] for entry in index]
+    position = bisect_left(keys, value) - 1
+    return index[position][2] if position >= 0 else 0
+
+
+def _iter_segment(path: str, offset: int = 0):
+    """内存映射读取段文件，逐条产出 (偏移, 类型, 正文)；遇到未写完或损坏的尾部即停止"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= offset:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            position = offset
+            while position + RECORD_HEADER.size <= size:
+                length, crc, kind = RECORD_HEADER.unpack_from(buffer, position)
+                end = position + RECORD_HEADER.size + length
+                if end > size:
+                    break
+                body = buffer[position + RECORD_HEADER.size:end]
+                if zlib.crc32(body) != crc:
+                    logger.warning("Corrupt audit record in %s at offset %d", path, position)
+                    break
+                yield position, kind, body
+                position = end
+
+
+class SegmentedAuditStore:
+    """本地分段追加审计存储
+
+    每个哈希链分区（即每个进程）写自己的流目录，流内按段文件滚动，互不加锁。
+    记录为"长度 + CRC32 + 类型"头加 BSON 正文（保留 datetime / ObjectId 类型）；
+    每次写入后刷到页缓存，fsync 按 fsync_interval 批量执行。每段附带稀疏索引，
+    记录该位置之前的最大时间戳与序号，扫描时据此跳过早于区间的部分。
+    读取通过内存映射进行；同一流内并发写入可能使记录略微乱序，扫描时用重排
+    缓冲恢复 (timestamp, seq) 顺序，再在各流之间归并。
+    """
+    def __init__(
+        self,
+        root: str,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        fsync_interval: float = DEFAULT_FSYNC_INTERVAL
+    ):
+        self.root = root
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        os.makedirs(root, exist_ok=True)
+        self._writers = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._syncer = None
+        self._closed = threading.Event()
+
+    def create_indexes(self):
+        """稀疏时间索引随段文件写入，无需单独创建"""
+
+    # ---- 写入 ----
+
+    def _writer(self, partition) -> _StreamWriter:
+        if self._pid != os.getpid():
+            # fork 后不能复用父进程的文件对象（其缓冲区会被重复写出）
+            self._writers, self._pid, self._syncer = {}, os.getpid(), None
+        name = _stream_name(partition)
+        writer = self._writers.get(name)
+        if writer is None:
+            writer = self._writers[name] = _StreamWriter(os.path.join(self.root, name), self.segment_size)
+        if self._syncer is None:
+            self._syncer = threading.Thread(target=self._sync_loop, name="audit-fsync", daemon=True)
+            self._syncer.start()
+        return writer
+
+    def _append(self, kind: int, records):
+        with self._lock:
+            writers = set()
+            for record in records:
+                writer = self._writer(record.get("partition"))
+                writer.append(kind, record)
+                writers.add(writer)
+            for writer in writers:
+                writer.flush()
+
+    def insert(self, record: dict):
+        self._append(KIND_LOG, (record,))
+
+    def insert_many(self, records: list, ordered: bool = False):
+        self._append(KIND_LOG, records)
+
+    def insert_checkpoint(self, checkpoint: dict):
+        # 预先分配 _id，转发到 MongoDB 时重复写入可被去重
+        checkpoint.setdefault("_id", ObjectId())
+        self._append(KIND_CHECKPOINT, (checkpoint,))
+
+    def sync(self):
+        """fsync 所有有新写入的流；fsync 在锁外对复制的文件描述符执行，不阻塞写入"""
+        descriptors = []
+        with self._lock:
+            for writer in self._writers.values():
+                if writer.dirty:
+                    writer.flush()
+                    descriptors += [os.dup(writer.segment.fileno()), os.dup(writer.index.fileno())]
+                    writer.dirty = False
+        for fd in descriptors:
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _sync_loop(self):
+        while not self._closed.wait(self.fsync_interval):
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Failed to fsync audit segments")
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            if self._pid == os.getpid():
+                for writer in self._writers.values():
+                    writer.close()
+            self._writers = {}
+
+    # ---- 读取 ----
+
+    def _streams(self) -> list:
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def _iter_stream(self, stream: str, kind: int, start: datetime, end: datetime):
+        """按文件顺序产出流内 [start, end) 的记录，越过 end + REORDER_SLACK 后停止"""
+        path = os.path.join(self.root, stream)
+        start_ms = _ms(start)
+        stop_at = end + REORDER_SLACK if end < _FAR_FUTURE - REORDER_SLACK else _FAR_FUTURE
+        for number in _segments(path):
+            base = os.path.join(path, f"{number:08d}")
+            offset = _start_offset(_read_index(base + '.idx'), 0, start_ms)
+            for _, record_kind, body in _iter_segment(base + '.seg', offset):
+                record = bson.decode(body)
+                timestamp = record["timestamp"]
+                if timestamp >= stop_at:
+                    return
+                if record_kind == kind and start <= timestamp < end:
+                    yield record
+
+    def _sorted_stream(self, records):
+        """重排缓冲：流内乱序距离不超过 REORDER_WINDOW 条时输出严格有序"""
+        heap = []
+        for counter, record in enumerate(records):
+            heapq.heappush(heap, (_sort_key(record), counter, record))
+            if len(heap) > REORDER_WINDOW:
+                yield heapq.heappop(heap)[2]
+        while heap:
+            yield heapq.heappop(heap)[2]
+
+    def _scan(self, kind: int, start: datetime = None, end: datetime = None):
+        start, end = start or _EPOCH, end or _FAR_FUTURE
+        streams = [self._sorted_stream(self._iter_stream(stream, kind, start, end)) for stream in self._streams()]
+        return heapq.merge(*streams, key=_sort_key)
+
+    def scan(self, start: datetime, end: datetime):
+        """[start, end) 内的记录，按 (timestamp, seq) 升序"""
+        return self._scan(KIND_LOG, start, end)
+
+    def checkpoints(self, start: datetime, end: datetime):
+        return self._scan(KIND_CHECKPOINT, start, end)
+
+    def signature_at(self, partition: str, seq: int):
+        path = os.path.join(self.root, _stream_name(partition))
+        if not os.path.isdir(path):
+            return None
+        for number in _segments(path):
+            base = os.path.join(path, f"{number:08d}")
+            offset = _start_offset(_read_index(base + '.idx'), 1, seq)
+            for _, kind, body in _iter_segment(base + '.seg', offset):
+                if kind != KIND_LOG:
+                    continue
+                record = bson.decode(body)
+                if record.get("seq") == seq:
+                    return record["signature"]
+                if record.get("seq", -1) > seq + REORDER_WINDOW:
+                    # 序号在流内基本递增，之后的段不会再出现该序号
+                    return None
+        return None
+
+    def get(self, log_id: str):
+        """_id 在记录签名后立即生成，只需扫描其生成时间附近的记录"""
+        oid = ObjectId(log_id)
+        generated = oid.generation_time.replace(tzinfo=None)
+        for record in self.scan(generated - REORDER_SLACK, generated + 2 * REORDER_SLACK):
+            if record.get("_id") == oid:
+                return record
+        return None
+
+    def find(self, query: dict) -> list:
+        """仅支持字段相等条件的全量扫描"""
+        if any(key.startswith('$') or isinstance(value, dict) for key, value in query.items()):
+            raise ValueError("Local audit store only supports equality filters")
+        return [record for record in self._scan(KIND_LOG)
+                if all(record.get(key) == value for key, value in query.items())]
+
+    def page(self, query, projection=None) -> list:
+        """按 (timestamp, _id) 降序取 limit + 1 条；本地后端需扫描查询时间范围内的全部记录"""
+        matches = (record for record in self._scan(KIND_LOG, query.start, query.end) if query.matches(record))
+        records = heapq.nlargest(query.limit + 1, matches, key=lambda r: (r["timestamp"], r["_id"]))
+        return [query.project(record) for record in records] if projection is not None else records
+
+    def export(self, query):
+        """导出按降序排序，本地后端在内存中完成排序"""
+        matches = [record for record in self._scan(KIND_LOG, query.start, query.end) if query.matches(record)]
+        matches.sort(key=lambda r: (r["timestamp"], r["_id"]), reverse=True)
+        for record in matches:
+            yield query.project(record)
+
+    # ---- 预写缓冲转发 ----
+
+    def _position_path(self, stream: str) -> str:
+        return os.path.join(self.root, stream, 'forwarded')
+
+    def _load_position(self, stream: str) -> tuple:
+        try:
+            with open(self._position_path(stream), 'rb') as f:
+                return POSITION.unpack(f.read(POSITION.size))
+        except (FileNotFoundError, struct.error):
+            return 0, 0
+
+    def _save_position(self, stream: str, number: int, offset: int):
+        path = self._position_path(stream)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(POSITION.pack(number, offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def forward(self, target, batch_size: int = FORWARD_BATCH_SIZE) -> int:
+        """把各流中尚未转发的记录按文件顺序写入 target，返回转发条数
+
+        转发位置在目标写入成功后才推进，崩溃后重放产生的重复 _id 被忽略。
+        多进程同时转发时由文件锁保证只有一个进程在转发。
+        """
+        with open(os.path.join(self.root, '.forward.lock'), 'a+b') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            forwarded = 0
+            for stream in self._streams():
+                forwarded += self._forward_stream(stream, target, batch_size)
+            return forwarded
+
+    def _forward_stream(self, stream: str, target, batch_size: int) -> int:
+        path = os.path.join(self.root, stream)
+        number, offset = self._load_position(stream)
+        forwarded = 0
+        for segment in _segments(path):
+            if segment < number:
+                continue
+            end = offset if segment == number else 0
+            batch = []
+            for position, kind, body in _iter_segment(os.path.join(path, f"{segment:08d}.seg"), end):
+                record = bson.decode(body)
+                if kind == KIND_CHECKPOINT and batch:
+                    # 检查点覆盖其之前的记录：先写入缓冲的记录，再写检查点
+                    forwarded += self._forward_batch(target, batch)
+                    self._save_position(stream, segment, position)
+                    batch = []
+                end = position + RECORD_HEADER.size + len(body)
+                if kind == KIND_CHECKPOINT:
+                    _ignore_duplicate(target.insert_checkpoint, record)
+                    continue
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    forwarded += self._forward_batch(target, batch)
+                    self._save_position(stream, segment, end)
+                    batch = []
+            if batch:
+                forwarded += self._forward_batch(target, batch)
+            if (segment, end) != (number, offset):
+                self._save_position(stream, segment, end)
+            number, offset = segment, end
+        return forwarded
+
+    @staticmethod
+    def _forward_batch(target, batch: list) -> int:
+        _ignore_duplicate(target.insert_many, batch, ordered=False)
+        return len(batch)
+
+
+def _ignore_duplicate(insert, *args, **kwargs):
+    try:
+        insert(*args, **kwargs)
+    except Exception as e:
+        # 重放时 _id 已存在的记录跳过
+        if getattr(e, 'code', None) != 11000 and not _only_duplicates(e):
+            raise
@@ -0,0 +1,226 @@
+import heapq
+import logging
+import threading
+from bson import ObjectId
+from .audit_query import AUDIT_INDEXES, EXPORT_BATCH_SIZE
+from .audit_segments import _sort_key
+
+logger = logging.getLogger(__name__)
+
+AUDIT_BACKENDS = ('mongo', 'local', 'spool')
+DEFAULT_FORWARD_INTERVAL = 1.0   # 秒；spool 模式下转发到 MongoDB 的间隔
+
+
+class MongoAuditStore:
+    """MongoDB 审计存储后端
+
+    审计服务通过以下方法访问存储，本地分段存储（audit_segments.SegmentedAuditStore）
+    实现同一组方法：insert / insert_many / insert_checkpoint / get / find / scan /
+    checkpoints / signature_at / page / export / close。
+    """
+    def __init__(self, db, collection: str = "audit_logs", checkpoint_collection: str = "audit_checkpoints"):
+        self.collection = db[collection]
+        self.checkpoint_collection = db[checkpoint_collection]
+
+    def create_indexes(self):
+        # 创建时间戳索引
+        self.collection.create_index("timestamp")
+        # 哈希链：分区内序号唯一（旧记录没有链字段，不参与唯一约束）
+        self.collection.create_index(
+            [("partition", 1), ("seq", 1)],
+            unique=True,
+            partialFilterExpression={"seq": {"$exists": True}}
+        )
+        self.checkpoint_collection.create_index("timestamp")
+        # 键集分页用的复合索引：(过滤字段, timestamp, _id)
+        for keys in AUDIT_INDEXES:
+            self.collection.create_index(keys)
+
+    def insert(self, record: dict):
+        self.collection.insert_one(record)
+
+    def insert_many(self, records: list, ordered: bool = False):
+        self.collection.insert_many(records, ordered=ordered)
+
+    def insert_checkpoint(self, checkpoint: dict):
+        self.checkpoint_collection.insert_one(checkpoint)
+
+    def get(self, log_id: str):
+        return self.collection.find_one({"_id": ObjectId(log_id)})
+
+    def find(self, query: dict) -> list:
+        return list(self.collection.find(query))
+
+    def delete(self, ids: list):
+        """删除已归档的记录"""
+        self.collection.delete_many({"_id": {"$in": ids}})
+
+    def scan(self, start, end):
+        """[start, end) 内的记录，按 (timestamp, seq) 升序"""
+        return self.collection.find({"timestamp": {"$gte": start, "$lt": end}}).sort(
+            [("timestamp", 1), ("seq", 1)]
+        ).batch_size(1000)
+
+    def checkpoints(self, start, end):
+        return self.checkpoint_collection.find({"timestamp": {"$gte": start, "$lt": end}})
+
+    def signature_at(self, partition: str, seq: int):
+        record = self.collection.find_one({"partition": partition, "seq": seq}, projection={"signature": 1})
+        return record["signature"] if record else None
+
+    def page(self, query, projection=None) -> list:
+        """按查询排序取 limit + 1 条（多取一条判断是否有下一页）"""
+        return list(self.collection.find(query.filter(), projection=projection).sort(
+            query.sort()).limit(query.limit + 1))
+
+    def export(self, query):
+        cursor = self.collection.find(query.filter(), projection=query.projection()).sort(
+            query.sort()).batch_size(EXPORT_BATCH_SIZE)
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+    def close(self):
+        pass
+
+
+class SpooledAuditStore:
+    """本地分段存储作为 MongoDB 前的预写缓冲
+
+    写入只追加到本地段文件（本机磁盘，无网络往返），后台线程按间隔把新记录
+    批量转发到 MongoDB，转发位置持久化在本地；读取与校验走 MongoDB，
+    因此可能落后本地写入一个转发间隔。MongoDB 不可用时记录留在本地，恢复后继续转发。
+    """
+    def __init__(self, spool, target: MongoAuditStore, interval: float = DEFAULT_FORWARD_INTERVAL):
+        self.spool = spool
+        self.target = target
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __getattr__(self, name):
+        # 读取类方法委托给 MongoDB
+        return getattr(self.target, name)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="audit-forwarder", daemon=True)
+            self._thread.start()
+
+    def insert(self, record: dict):
+        self.spool.insert(record)
+
+    def insert_many(self, records: list, ordered: bool = False):
+        self.spool.insert_many(records)
+
+    def insert_checkpoint(self, checkpoint: dict):
+        self.spool.insert_checkpoint(checkpoint)
+
+    def forward(self) -> int:
+        """把未转发的记录写入 MongoDB，返回转发条数"""
+        return self.spool.forward(self.target)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.forward()
+            except Exception:
+                logger.exception("Failed to forward spooled audit records")
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.spool.close()
+        try:
+            self.forward()
+        except Exception:
+            logger.exception("Failed to forward spooled audit records on close")
+
+
+def _page_key(record: dict) -> tuple:
+    return record["timestamp"], record["_id"]
+
+
+class TieredAuditStore:
+    """热存储 + 冷归档（audit_archive.AuditArchive）
+
+    写入与检查点只进热存储；读取同时查询两层并按各自的排序键归并，
+    归档段按时间范围剪枝，查询区间不涉及归档时不读取任何段文件。
+    """
+    def __init__(self, hot, archive):
+        self.hot = hot
+        self.archive = archive
+
+    def __getattr__(self, name):
+        # 写入、检查点、索引与删除只涉及热存储
+        return getattr(self.hot, name)
+
+    def get(self, log_id: str):
+        return self.hot.get(log_id) or self.archive.get(log_id)
+
+    def find(self, query: dict) -> list:
+        return self.hot.find(query) + self.archive.find(query)
+
+    def scan(self, start, end):
+        return heapq.merge(self.hot.scan(start, end), self.archive.scan(start, end), key=_sort_key)
+
+    def signature_at(self, partition: str, seq: int):
+        signature = self.hot.signature_at(partition, seq)
+        return signature if signature is not None else self.archive.signature_at(partition, seq)
+
+    def page(self, query, projection=None) -> list:
+        hot = self.hot.page(query, projection)
+        # 热数据已满一页时，只有不早于其最后一条的归档记录可能进入本页
+        floor = hot[-1]["timestamp"] if len(hot) > query.limit else None
+        cold = self.archive.page(query, projection, floor=floor)
+        return heapq.nlargest(query.limit + 1, hot + cold, key=_page_key)
+
+    def export(self, query):
+        return heapq.merge(self.hot.export(query), self.archive.export(query), key=_page_key, reverse=True)
+
+    def close(self):
+        self.hot.close()
+
+
+def create_audit_store(app):
+    """按 AUDIT_BACKEND 创建存储后端：mongo（默认）、local（本地分段文件）、spool（本地预写 + 转发 MongoDB）
+
+    配置 AUDIT_ARCHIVE_PATH 时，在后端之外叠加冷归档（仅 mongo / spool）。
+    """
+    store = _create_backend(app)
+    archive_path = app.config.get('AUDIT_ARCHIVE_PATH')
+    if not archive_path:
+        return store
+    if app.config.get('AUDIT_BACKEND', 'mongo') == 'local':
+        raise ValueError("AUDIT_ARCHIVE_PATH requires the mongo or spool audit backend")
+    from .audit_archive import AuditArchive
+    return TieredAuditStore(store, AuditArchive(archive_path, app.config['AUDIT_SIGNING_KEY']))
+
+
+def _create_backend(app):
+    from .audit_segments import SegmentedAuditStore, DEFAULT_SEGMENT_SIZE, DEFAULT_FSYNC_INTERVAL
+    backend = app.config.get('AUDIT_BACKEND', 'mongo')
+    if backend not in AUDIT_BACKENDS:
+        raise ValueError(f"AUDIT_BACKEND must be one of {AUDIT_BACKENDS}")
+
+    def local():
+        return SegmentedAuditStore(
+            app.config['AUDIT_STORE_PATH'],
+            segment_size=app.config.get('AUDIT_SEGMENT_SIZE', DEFAULT_SEGMENT_SIZE),
+            fsync_interval=app.config.get('AUDIT_FSYNC_INTERVAL', DEFAULT_FSYNC_INTERVAL)
+        )
+
+    def mongo():
+        from flask_pymongo import PyMongo
+        return MongoAuditStore(PyMongo(app).db)
+
+    if backend == 'local':
+        return local()
+    if backend == 'mongo':
+        return mongo()
+    store = SpooledAuditStore(local(), mongo(), app.config.get('AUDIT_FORWARD_INTERVAL', DEFAULT_FORWARD_INTERVAL))
+    store.start()
+    return store
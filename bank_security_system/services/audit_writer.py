@@ -0,0 +1,313 @@
+import os
+import time
+import fcntl
+import queue
+import shutil
+import atexit
+import logging
+import threading
+from bson import json_util
+
+logger = logging.getLogger(__name__)
+
+# 批量写入默认参数
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 0.5   # 秒
+DEFAULT_WRITE_RETRIES = 3      # 写入失败后的重试次数，耗尽后溢出到文件（未配置溢出文件时丢弃）
+DEFAULT_RETRY_DELAY = 0.5      # 秒；指数退避的起点
+MAX_RETRY_DELAY = 5.0          # 秒；单次等待上限
+BACKPRESSURE_MODES = ('block', 'drop', 'spill')
+
+CHECKPOINT_KEY = '_checkpoint'   # 溢出文件中检查点行的标记
+
+_STOP = object()
+
+
+class _Checkpoint:
+    """队列中的检查点：排在其对应记录之后，随同一批写入"""
+    __slots__ = ('checkpoint',)
+
+    def __init__(self, checkpoint: dict):
+        self.checkpoint = checkpoint
+
+
+class AuditBatchWriter:
+    """审计日志异步批量写入器
+
+    log_activity 只负责入队，由后台线程按批量大小或时间间隔调用 insert_many 写入；
+    检查点与记录共用队列，写完同批记录后再调用 insert_checkpoint，不会先于记录落盘。
+    队列写满时按 backpressure 策略处理：
+      block - 阻塞调用方直到有空位
+      drop  - 丢弃并计数
+      spill - 追加写入本地文件，下次启动时回放
+    写入失败时按指数退避重试，仍失败则写入溢出文件（若配置）。多个 worker 进程共用
+    同一溢出文件，追加与回放通过文件锁互斥。进程退出时保证刷盘。
+    """
+    def __init__(
+        self,
+        collection,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        backpressure: str = 'block',
+        spill_path: str = None,
+        write_retries: int = DEFAULT_WRITE_RETRIES,
+        retry_delay: float = DEFAULT_RETRY_DELAY
+    ):
+        if backpressure not in BACKPRESSURE_MODES:
+            raise ValueError(f"backpressure must be one of {BACKPRESSURE_MODES}")
+        if backpressure == 'spill' and not spill_path:
+            raise ValueError("spill_path is required for spill backpressure")
+        self.collection = collection
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backpressure = backpressure
+        self.spill_path = spill_path
+        self.write_retries = write_retries
+        self.retry_delay = retry_delay
+        self.counters = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'spilled': 0,
+            'failed_batches': 0,
+        }
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        """启动后台线程；线程先回放上次遗留的溢出文件，回放失败不影响启动"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, record: dict) -> bool:
+        """入队一条审计记录，返回是否已进入队列（溢出到文件也视为成功）"""
+        return self._put(record)
+
+    def submit_checkpoint(self, checkpoint: dict) -> bool:
+        """入队一个签名检查点，与记录相同的背压策略"""
+        return self._put(_Checkpoint(checkpoint))
+
+    def _put(self, item) -> bool:
+        if self._closed:
+            raise RuntimeError("Audit writer is closed")
+        if self.backpressure == 'block':
+            self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                if self.backpressure == 'drop':
+                    self._count('dropped')
+                    return False
+                self._spill([item])
+                return True
+        self._count('enqueued')
+        return True
+
+    def close(self, timeout: float = 30.0):
+        """停止接收新记录并把队列中的记录全部写出，最多等待 timeout 秒"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread:
+            deadline = time.monotonic() + timeout
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                # 队列满时后台线程在下一次取空队列时根据 _closed 退出
+                logger.warning("Audit writer queue is full while closing")
+            self._thread.join(max(0, deadline - time.monotonic()))
+            if self._thread.is_alive():
+                logger.warning("Audit writer did not finish within %.1fs, %d records queued",
+                               timeout, self.queue.qsize())
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters, queued=self.queue.qsize())
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def _run(self):
+        try:
+            self.replay_spill()
+        except Exception:
+            logger.exception("Failed to replay audit spill file, remaining records kept for next start")
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                stopping = self._closed
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._flush(batch)
+        # 停止后把剩余记录写完
+        batch = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch: list):
+        records = [item for item in batch if not isinstance(item, _Checkpoint)]
+        checkpoints = [item for item in batch if isinstance(item, _Checkpoint)]
+        if records:
+            try:
+                self._write(self.collection.insert_many, records, ordered=False)
+                self._count('written', len(records))
+            except Exception:
+                self._count('failed_batches')
+                logger.exception("Failed to write %d audit records", len(records))
+                if self.spill_path:
+                    self._spill(batch)
+                return
+        for n, item in enumerate(checkpoints):
+            try:
+                self._write(self.collection.insert_checkpoint, item.checkpoint)
+            except Exception:
+                self._count('failed_batches')
+                logger.exception("Failed to write %d audit checkpoints", len(checkpoints) - n)
+                if self.spill_path:
+                    self._spill(checkpoints[n:])
+                return
+
+    def _write(self, insert, *args, **kwargs):
+        """写入失败时按带上限的指数退避重试，重试耗尽后抛出最后一次的异常
+
+        只有重复 _id 的错误视为已写入（上一次尝试已部分写入）。
+        """
+        for attempt in range(self.write_retries + 1):
+            try:
+                return insert(*args, **kwargs)
+            except Exception as e:
+                if getattr(e, 'code', None) == 11000 or _only_duplicates(e):
+                    return None
+                if attempt >= self.write_retries:
+                    raise
+                logger.warning("Audit write failed (%s), retrying (attempt %d)", e, attempt + 1)
+                time.sleep(min(MAX_RETRY_DELAY, self.retry_delay * 2 ** attempt))
+
+    def _locked(self, suffix: str, mode: int):
+        """在溢出文件旁的锁文件上加 flock（同一进程内不同线程的打开也互斥）"""
+        lock = open(f"{self.spill_path}{suffix}", "a")
+        try:
+            fcntl.flock(lock, mode)
+        except BaseException:
+            lock.close()
+            raise
+        return lock
+
+    def _spill(self, items: list):
+        """以扩展 JSON（保留 ObjectId / datetime 类型）逐行追加到溢出文件"""
+        with self._locked('.lock', fcntl.LOCK_EX):
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for item in items:
+                    if isinstance(item, _Checkpoint):
+                        item = {CHECKPOINT_KEY: item.checkpoint}
+                    f.write(json_util.dumps(item) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self._count('spilled', len(items))
+
+    def replay_spill(self):
+        """把溢出文件中的记录写回 MongoDB（_id 已存在的记录会被跳过）
+
+        上次回放中途退出留下的 .replay 文件一并回放：新的溢出记录追加在其后，不覆盖。
+        同一时间只有一个进程回放，其他进程直接返回 0。
+        """
+        if not self.spill_path:
+            return 0
+        try:
+            replay_lock = self._locked('.replay.lock', fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+        with replay_lock:
+            return self._replay(f"{self.spill_path}.replay")
+
+    def _replay(self, replay_path: str) -> int:
+        with self._locked('.lock', fcntl.LOCK_EX):
+            if os.path.exists(self.spill_path):
+                if os.path.exists(replay_path):
+                    with open(self.spill_path, 'rb') as src, open(replay_path, 'ab') as dst:
+                        shutil.copyfileobj(src, dst)
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    _remove(self.spill_path)
+                else:
+                    os.replace(self.spill_path, replay_path)
+            elif not os.path.exists(replay_path):
+                return 0
+        records, checkpoints = [], []
+        with open(replay_path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    item = json_util.loads(line)
+                    if CHECKPOINT_KEY in item:
+                        checkpoints.append(_Checkpoint(item[CHECKPOINT_KEY]))
+                    else:
+                        records.append(item)
+        for start in range(0, len(records), self.batch_size):
+            try:
+                self._write(self.collection.insert_many, records[start:start + self.batch_size], ordered=False)
+            except Exception:
+                # 重试后仍失败的记录保留到溢出文件
+                self._spill(records[start:] + checkpoints)
+                _remove(replay_path)
+                raise
+        for n, item in enumerate(checkpoints):
+            try:
+                self._write(self.collection.insert_checkpoint, item.checkpoint)
+            except Exception:
+                self._spill(checkpoints[n:])
+                _remove(replay_path)
+                raise
+        _remove(replay_path)
+        self._count('written', len(records))
+        return len(records)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _only_duplicates(error) -> bool:
+    details = getattr(error, 'details', None) or {}
+    write_errors = details.get('writeErrors', [])
+    return bool(write_errors) and all(e.get('code') == 11000 for e in write_errors)
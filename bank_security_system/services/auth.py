@@ -1,17 +1,21 @@
-from flask import current_app, g
+from flask import current_app, g, request, has_request_context
 from flask_jwt_extended import (
     JWTManager,
     create_access_token,
     create_refresh_token,
     verify_jwt_in_request,
     get_jwt_identity,
+    get_jwt,
 )
 from flask_jwt_extended.exceptions import JWTDecodeError
 from flask_jwt_extended.utils import decode_token
 from urllib.parse import unquote  # 保留
 from .encryption import EncryptionService
 from .rbac import RBACService
-from .audit import audit_service
+from .permission_claims import build_claims, token_allows
+from .token_revocation import create_revocation_list
+from .password_hashing import password_hasher, PasswordHashingBusy
+from .login_throttle import create_login_throttle
 from models.user import User
 import pyotp
 import datetime
@@ -22,32 +26,56 @@ encryption_service = EncryptionService()
 class AuthService:
     def __init__(self):
         self.rbac_service = None
-        self.token_blacklist = set()  # 记录被撤销的 Token
+        self.revocation_list = None  # 被撤销的 Token（跨进程共享，到期自动失效）
+        self.login_throttle = None   # 登录失败计数（共享内存）
+        self.audit_service = None    # 由 init_services 注入
 
     def init_app(self, app):
         """初始化 JWT 和 RBAC 服务"""
         jwt.init_app(app)
         self.rbac_service = RBACService()  # 初始化 RBAC
+        self.revocation_list = create_revocation_list(app.config)
+        password_hasher.init_app(app)
+        self.login_throttle = create_login_throttle(app.config)
 
-        # 自定义 JWT 负载（添加角色和 MFA 状态）
+        # 令牌 sub 只保存用户 ID
+        @jwt.user_identity_loader
+        def user_identity_lookup(user):
+            return str(user.id) if isinstance(user, User) else user
+
+        # 自定义 JWT 负载（角色、MFA 状态、有效权限位图与权限版本号）
         @jwt.additional_claims_loader
         def add_claims_to_access_token(user):
-            return {
-                "roles": [role.name for role in user.roles],
-                "mfa_enabled": user.mfa_enabled
-            }
+            claims = build_claims(user)
+            claims["mfa_enabled"] = user.mfa_enabled
+            return claims
 
         # 检查 Token 是否在黑名单中
         @jwt.token_in_blocklist_loader
         def check_token_revoked(jwt_header, jwt_payload):
             jti = jwt_payload.get("jti")
-            return jti in self.token_blacklist
+            return self.revocation_list.is_revoked(jti)
+
+    def authenticate_user(self, username: str, password: str, otp: str = None, client_ip: str = None) -> dict:
+        """用户认证（含 MFA）
+
+        失败次数超限的用户名或 IP 在查询数据库、计算口令哈希之前即被拒绝；
+        每次登录只签发一对令牌、写一条审计记录。
+        """
+        if client_ip is None and has_request_context():
+            client_ip = request.remote_addr
+        retry_after = self.login_throttle.check(username, client_ip)
+        if retry_after:
+            return {"error": "Too many failed login attempts", "retry_after": retry_after}, 429
 
-    def authenticate_user(self, username: str, password: str, otp: str = None) -> dict:
-        """用户认证（含 MFA）"""
         user = User.query.filter_by(username=username).first()
-        if not user or not user.check_password(password):
-            audit_service.log_activity(
+        try:
+            password_ok = user is not None and user.check_password(password)
+        except PasswordHashingBusy:
+            return {"error": "Too many login attempts, retry later"}, 503
+        if not password_ok:
+            self.login_throttle.record_failure(username, client_ip)
+            self.audit_service.log_activity(
                 None,  # 匿名用户
                 "login_failed",
                 f"user:{username}"
@@ -58,35 +86,50 @@ class AuthService:
             if not otp:
                 return {"mfa_required": True}, 401
             if not pyotp.TOTP(user.mfa_secret).verify(otp):
-                audit_service.log_activity(
+                self.login_throttle.record_failure(username, client_ip)
+                self.audit_service.log_activity(
                     user.id,
                     "mfa_failed",
                     f"user:{username}"
                 )
                 return {"error": "Invalid OTP"}, 401
 
+        self.login_throttle.record_success(username)
+
+        # 哈希参数已变更时透明重算（失败不影响本次登录）
+        try:
+            if user.rehash_password_if_needed(password):
+                User.query.session.commit()
+        except PasswordHashingBusy:
+            pass
+
         # 记录成功登录
-        audit_service.log_activity(
+        self.audit_service.log_activity(
             user.id,
             "login_success",
             f"user:{username}"
         )
-        return {
-            "access_token": self._create_tokens(user)["access_token"],
-            "refresh_token": self._create_tokens(user)["refresh_token"],
-            "expires_in": current_app.config["JWT_ACCESS_TOKEN_EXPIRES"].seconds
-        }
+        return self._create_tokens(user)
 
     def _create_tokens(self, user):
-        """生成带编码的 Token"""
+        """生成 Access / Refresh Token（每次登录各签发一个）"""
         access_token = create_access_token(identity=user)
         refresh_token = create_refresh_token(identity=user)
         return {
             "access_token": access_token,
             "refresh_token": refresh_token,
-            "expires_in": current_app.config["JWT_ACCESS_TOKEN_EXPIRES"].seconds
+            "expires_in": self._access_expires_in()
         }
 
+    @staticmethod
+    def _access_expires_in() -> int:
+        expires = current_app.config["JWT_ACCESS_TOKEN_EXPIRES"]
+        return int(expires.total_seconds()) if isinstance(expires, datetime.timedelta) else int(expires)
+
+    def login_stats(self) -> dict:
+        """登录评估/拒绝累计计数（所有 worker 合计）"""
+        return self.login_throttle.stats()
+
     def refresh_access_token(self, refresh_token: str) -> dict:
         """刷新 Access Token"""
         try:
@@ -96,7 +139,7 @@ class AuthService:
             user_id = payload["sub"]
             user = User.query.get(user_id)
             if not user:
-                audit_service.log_activity(
+                self.audit_service.log_activity(
                     None,
                     "refresh_failed",
                     "Invalid user"
@@ -104,7 +147,7 @@ class AuthService:
                 return {"error": "Invalid user"}, 401
 
             # 记录刷新操作
-            audit_service.log_activity(
+            self.audit_service.log_activity(
                 user.id,
                 "token_refreshed",
                 f"user:{user.id}"
@@ -112,7 +155,7 @@ class AuthService:
             new_access_token = create_access_token(identity=user)
             return {"access_token": new_access_token}
         except JWTDecodeError as e:
-            audit_service.log_activity(
+            self.audit_service.log_activity(
                 None,
                 "refresh_failed",
                 str(e)
@@ -127,14 +170,14 @@ class AuthService:
             payload = get_jwt()
             jti = payload.get("jti")
             if jti:
-                self.token_blacklist.add(jti)
-                audit_service.log_activity(
+                self.revocation_list.revoke(jti, payload["exp"])
+                self.audit_service.log_activity(
                     None,
                     "token_revoked",
                     f"jti:{jti}"
                 )
         except Exception as e:
-            audit_service.log_activity(
+            self.audit_service.log_activity(
                 None,
                 "revoke_failed",
                 str(e)
@@ -147,6 +190,8 @@ class AuthService:
         return User.query.get(user_id)
 
     def check_permission(self, resource: str, action: str) -> bool:
-        """检查用户权限（RBAC）"""
-        user = self.get_current_user()
-        return self.rbac_service.has_permission(user, resource, action)
\ No newline at end of file
+        """检查用户权限（RBAC）
+
+        直接根据令牌中的权限位图判断；仅当全局权限版本号超过令牌版本时才查询数据库。
+        """
+        return token_allows(resource, action)
\ No newline at end of file
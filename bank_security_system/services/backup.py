@@ -1,13 +1,32 @@
 import os
-import subprocess
-import shutil
 import logging
 import boto3
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from flask import current_app
 from .encryption import EncryptionService
-from .audit import audit_service
+from .backup_pipeline import (
+    BackupPipeline,
+    BackupSource,
+    DEFAULT_WORKERS,
+    DEFAULT_QUEUE_DEPTH,
+    DEFAULT_PART_SIZE,
+    DEFAULT_UPLOAD_CONCURRENCY,
+    DEFAULT_COMPRESS_LEVEL,
+)
+from .backup_chunks import (
+    ChunkStore,
+    ContentChunker,
+    IncrementalBackup,
+    MANIFEST_NAME,
+    CHUNK_PREFIX,
+    collect_garbage,
+    DEFAULT_MIN_CHUNK,
+    DEFAULT_AVG_CHUNK,
+    DEFAULT_MAX_CHUNK,
+    DEFAULT_CHUNK_UPLOADS,
+)
+from .backup_restore import BackupRestorer, DEFAULT_RESTORE_WORKERS
 
 class BackupScheduler:
     def __init__(self):
@@ -15,7 +34,11 @@ class BackupScheduler:
         self.encryption_service = EncryptionService()
         self.backup_dir = None
         self.s3_client = None
+        self.audit_service = None
         self.retention_days = 30
+        self.pipeline_options = {}
+        self.backup_mode = 'full'  # full | incremental
+        self.chunk_options = {}
 
     def init_app(self, app):
         """初始化备份服务"""
@@ -24,8 +47,23 @@ class BackupScheduler:
         self.s3_client = boto3.client(
             's3',
             aws_access_key_id=app.config['AWS_ACCESS_KEY'],
-            aws_secret_access_key=app.config['AWS_SECRET_KEY']
+            aws_secret_access_key=app.config['AWS_SECRET_KEY'],
+            endpoint_url=app.config.get('BACKUP_S3_ENDPOINT_URL')  # 本地 S3 替身（如 MinIO）
         )
+        self.pipeline_options = {
+            'workers': app.config.get('BACKUP_WORKERS', DEFAULT_WORKERS),
+            'queue_depth': app.config.get('BACKUP_QUEUE_DEPTH', DEFAULT_QUEUE_DEPTH),
+            'part_size': app.config.get('BACKUP_PART_SIZE', DEFAULT_PART_SIZE),
+            'upload_concurrency': app.config.get('BACKUP_UPLOAD_CONCURRENCY', DEFAULT_UPLOAD_CONCURRENCY),
+            'compress_level': app.config.get('BACKUP_COMPRESS_LEVEL', DEFAULT_COMPRESS_LEVEL),
+        }
+        # 增量模式：内容定义分块 + 去重
+        self.backup_mode = app.config.get('BACKUP_MODE', 'full')
+        self.chunk_options = {
+            'min_size': app.config.get('BACKUP_CHUNK_MIN', DEFAULT_MIN_CHUNK),
+            'avg_size': app.config.get('BACKUP_CHUNK_AVG', DEFAULT_AVG_CHUNK),
+            'max_size': app.config.get('BACKUP_CHUNK_MAX', DEFAULT_MAX_CHUNK),
+        }
         os.makedirs(self.backup_dir, exist_ok=True)
         
         # 启动调度器
@@ -36,119 +74,223 @@ class BackupScheduler:
                 hour=2,
                 minute=0
             )
+            # 定期恢复演练：仅下载、解密、校验最近一次备份
+            if app.config.get('BACKUP_VERIFY_DRILL'):
+                self.scheduler.add_job(
+                    self.restore_backup,
+                    'cron',
+                    day_of_week='sun',
+                    hour=6,
+                    minute=0
+                )
             self.scheduler.start()
 
     def perform_backup(self):
-        """执行完整备份流程"""
+        """执行完整备份流程（单次流式：导出 -> 压缩 -> 加密 -> 校验 -> 上传）"""
+        if self.backup_mode == 'incremental':
+            return self.perform_incremental_backup()
+
         backup_id = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-        temp_dir = os.path.join(self.backup_dir, f"temp_{backup_id}")
-        os.makedirs(temp_dir)
+        prefix = f"backups/{datetime.utcnow().date()}"
         
         try:
-            # 数据库备份
-            self._backup_database(temp_dir)
-            
-            # 文件系统备份
-            self._backup_filesystem(temp_dir)
-            
-            # 加密处理
-            encrypted_dir = os.path.join(self.backup_dir, f"encrypted_{backup_id}")
-            os.makedirs(encrypted_dir)
-            self._encrypt_backup(temp_dir, encrypted_dir)
+            pipeline = self._create_pipeline()
+            results = pipeline.run(self._backup_sources(".gz.enc"), prefix)
+            checksum = pipeline.upload_checksums(results, prefix)
             
-            # 校验和生成
-            checksum = self._generate_checksum(encrypted_dir)
-            
-            # 上传到S3
-            self._upload_to_s3(encrypted_dir, checksum)
+            # 记录审计日志（含各阶段耗时）
+            self.audit_service.log_activity(
+                user_id=None,
+                action='backup_success',
+                resource='system',
+                sensitive_data={
+                    'backup_id': backup_id,
+                    'checksum': checksum,
+                    'objects': {
+                        name: {
+                            'sha256': stats['sha256'],
+                            'raw_bytes': stats['raw_bytes'],
+                            'encrypted_bytes': stats['encrypted_bytes'],
+                            'timings': stats['timings'],
+                        }
+                        for name, stats in results.items()
+                    }
+                }
+            )
+            return results
             
-            # 清理临时文件
-            shutil.rmtree(temp_dir)
-            shutil.rmtree(encrypted_dir)
+        except Exception as e:
+            self.audit_service.log_activity(
+                user_id=None,
+                action='backup_failed',
+                resource='system',
+                sensitive_data={'error': str(e)}
+            )
+            raise
+
+    def perform_incremental_backup(self):
+        """执行去重增量备份：只上传块存储中缺失的块，并写入签名清单"""
+        backup_id = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+        prefix = f"backups/{datetime.utcnow().date()}"
+        
+        try:
+            backup = IncrementalBackup(
+                self._create_chunk_store(),
+                ContentChunker(**self.chunk_options),
+                workers=self.pipeline_options.get('workers', DEFAULT_WORKERS),
+                upload_concurrency=current_app.config.get('BACKUP_CHUNK_UPLOADS', DEFAULT_CHUNK_UPLOADS)
+            )
+            manifest = backup.run(self._backup_sources(), prefix, backup_id)
             
-            # 记录审计日志
-            audit_service.log_activity(
+            self.audit_service.log_activity(
+                user_id=None,
                 action='backup_success',
                 resource='system',
-                sensitive_data={'backup_id': backup_id, 'checksum': checksum}
+                sensitive_data={
+                    'backup_id': backup_id,
+                    'mode': 'incremental',
+                    'manifest': f"{prefix}/{MANIFEST_NAME}",
+                    'objects': {
+                        name: {
+                            'sha256': obj['sha256'],
+                            'size': obj['size'],
+                            'chunks': len(obj['chunks']),
+                            'new_chunks': obj['new_chunks'],
+                            'uploaded_bytes': obj['uploaded_bytes'],
+                            'elapsed': obj['elapsed'],
+                        }
+                        for name, obj in manifest['objects'].items()
+                    }
+                }
             )
+            return manifest
             
         except Exception as e:
-            audit_service.log_activity(
+            self.audit_service.log_activity(
+                user_id=None,
                 action='backup_failed',
                 resource='system',
-                sensitive_data={'error': str(e)}
+                sensitive_data={'mode': 'incremental', 'error': str(e)}
             )
             raise
 
-    def _backup_database(self, temp_dir):
-        """执行数据库备份"""
-        databases = current_app.config['DATABASES']
-        for db in databases:
-            dump_file = os.path.join(temp_dir, f"{db}.sql.gz")
-            cmd = f"mysqldump -u {current_app.config['DB_USER']} " \
-                  f"-p{current_app.config['DB_PASSWORD']} {db} | gzip -9 > {dump_file}"
-            subprocess.run(cmd, shell=True, check=True)
+    def restore_backup(self, date: str = None, verify_only: bool = True, sink_factory=None) -> dict:
+        """恢复或校验指定日期的备份（默认当天、仅校验），吞吐量记入审计日志
 
-    def _backup_filesystem(self, temp_dir):
-        """备份配置文件等"""
-        config_backup = os.path.join(temp_dir, "config.tar.gz")
-        shutil.make_archive(
-            config_backup[:-7],
-            'gztar',
-            root_dir='/opt/bank_security_system',
-            base_dir='config',
-            verbose=False
+        verify_only=False 时必须提供 sink_factory，否则抛出 ValueError（不会退化为仅校验）。
+        """
+        if not verify_only and sink_factory is None:
+            raise ValueError("sink_factory is required when verify_only is False")
+        date = date or str(datetime.utcnow().date())
+        action = 'backup_verify' if verify_only else 'backup_restore'
+        restorer = BackupRestorer(
+            self.encryption_service,
+            self.s3_client,
+            current_app.config['S3_BUCKET'],
+            workers=self.pipeline_options.get('workers', DEFAULT_RESTORE_WORKERS)
+        )
+        
+        try:
+            report = restorer.restore(date, sink_factory=None if verify_only else sink_factory)
+        except Exception as e:
+            self.audit_service.log_activity(
+                user_id=None,
+                action=f'{action}_failed',
+                resource=f"backups/{date}",
+                sensitive_data={'error': str(e)}
+            )
+            raise
+        
+        self.audit_service.log_activity(
+            user_id=None,
+            action=action,
+            resource=report['prefix'],
+            sensitive_data={
+                'downloaded_bytes': report['downloaded_bytes'],
+                'elapsed': report['elapsed'],
+                'throughput_mbps': report['throughput_mbps'],
+                'objects': sorted(report['objects'])
+            }
         )
+        return report
 
-    def _encrypt_backup(self, source_dir, target_dir):
-        """加密备份文件"""
-        for filename in os.listdir(source_dir):
-            plain_path = os.path.join(source_dir, filename)
-            encrypted_path = os.path.join(target_dir, f"{filename}.enc")
-            self.encryption_service.encrypt_file(plain_path, encrypted_path)
+    def _create_chunk_store(self) -> ChunkStore:
+        """创建去重块存储"""
+        return ChunkStore(
+            self.s3_client,
+            current_app.config['S3_BUCKET'],
+            self.encryption_service.symmetric_key,
+            upload_args={
+                'ServerSideEncryption': 'aws:kms',
+                'SSEKMSKeyId': current_app.config['KMS_KEY_ID']
+            }
+        )
 
-    def _generate_checksum(self, directory):
-        """生成校验和文件"""
-        checksum_file = os.path.join(directory, 'checksum.sha256')
-        sha256_cmd = f"sha256sum {directory}/* > {checksum_file}"
-        subprocess.run(sha256_cmd, shell=True, check=True)
-        return checksum_file
+    def _create_pipeline(self) -> BackupPipeline:
+        """根据配置创建备份流水线"""
+        return BackupPipeline(
+            self.encryption_service,
+            self.s3_client,
+            current_app.config['S3_BUCKET'],
+            upload_args={
+                'ServerSideEncryption': 'aws:kms',
+                'SSEKMSKeyId': current_app.config['KMS_KEY_ID']
+            },
+            **self.pipeline_options
+        )
 
-    def _upload_to_s3(self, directory, checksum_file):
-        """上传到S3并验证"""
-        s3_bucket = current_app.config['S3_BUCKET']
-        for filename in os.listdir(directory):
-            file_path = os.path.join(directory, filename)
-            s3_key = f"backups/{datetime.utcnow().date()}/{filename}"
-            self.s3_client.upload_file(
-                file_path,
-                s3_bucket,
-                s3_key,
-                ExtraArgs={
-                    'ServerSideEncryption': 'aws:kms',
-                    'SSEKMSKeyId': current_app.config['KMS_KEY_ID']
-                }
-            )
-        
-        # 验证上传
-        with open(checksum_file, 'rb') as f:
-            self.s3_client.put_object(
-                Bucket=s3_bucket,
-                Key=f"backups/{datetime.utcnow().date()}/checksum.sha256",
-                Body=f.read()
+    def _backup_sources(self, suffix: str = "") -> list:
+        """构造备份数据源：每个数据库一个 mysqldump，外加配置目录的 tar 包"""
+        # 密码通过环境变量传递，避免出现在进程列表中
+        env = dict(os.environ, MYSQL_PWD=current_app.config['DB_PASSWORD'])
+        sources = [
+            BackupSource(
+                f"{db}.sql{suffix}",
+                ['mysqldump', '--single-transaction', '--quick',
+                 '-u', current_app.config['DB_USER'], db],
+                env=env
             )
+            for db in current_app.config['DATABASES']
+        ]
+        sources.append(BackupSource(
+            f"config.tar{suffix}",
+            ['tar', '-cf', '-', '-C', '/opt/bank_security_system', 'config']
+        ))
+        return sources
 
     def cleanup_old_backups(self):
-        """清理过期备份"""
+        """清理过期备份；增量模式下对不再被引用的块做引用计数回收"""
         cutoff_date = datetime.utcnow() - timedelta(days=self.retention_days)
         s3_bucket = current_app.config['S3_BUCKET']
-        response = self.s3_client.list_objects_v2(Bucket=s3_bucket)
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        manifests = []
         
-        for obj in response.get('Contents', []):
-            if obj['LastModified'].replace(tzinfo=None) < cutoff_date:
-                self.s3_client.delete_object(Bucket=s3_bucket, Key=obj['Key'])
-                audit_service.log_activity(
-                    action='backup_cleanup',
-                    resource=obj['Key']
-                )
\ No newline at end of file
+        for page in paginator.paginate(Bucket=s3_bucket):
+            for obj in page.get('Contents', []):
+                # 块的生命周期由引用计数决定，不按时间删除
+                if obj['Key'].startswith(f"{CHUNK_PREFIX}/"):
+                    continue
+                if obj['LastModified'].replace(tzinfo=None) < cutoff_date:
+                    self.s3_client.delete_object(Bucket=s3_bucket, Key=obj['Key'])
+                    self.audit_service.log_activity(
+                        user_id=None,
+                        action='backup_cleanup',
+                        resource=obj['Key']
+                    )
+                elif obj['Key'].endswith(f"/{MANIFEST_NAME}"):
+                    manifests.append(obj['Key'])
+        
+        if self.backup_mode == 'incremental':
+            # 清单签名校验失败时直接抛出，宁可不回收也不误删
+            store = self._create_chunk_store()
+            result = collect_garbage(store, [store.get_manifest(key) for key in manifests])
+            self.audit_service.log_activity(
+                user_id=None,
+                action='backup_chunk_gc',
+                resource='system',
+                sensitive_data={
+                    'manifests': len(manifests),
+                    'referenced_chunks': result['referenced'],
+                    'deleted_chunks': len(result['deleted'])
+                }
+            )
@@ -0,0 +1,315 @@
+import os
+import re
+import hmac
+import json
+import time
+import zlib
+import hashlib
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from .backup_pipeline import BackupSource, DEFAULT_READ_SIZE, finish
+
+# 内容定义分块默认参数
+DEFAULT_MIN_CHUNK = 256 * 1024
+DEFAULT_AVG_CHUNK = 1024 * 1024
+DEFAULT_MAX_CHUNK = 4 * 1024 * 1024
+DEFAULT_CHUNK_UPLOADS = 8
+CHUNK_PREFIX = "chunks"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+GC_GRACE = timedelta(days=7)  # 未被引用的块需超过该时间（按 LastModified）才回收
+MAX_BACKUP_DURATION = timedelta(days=1)  # 单次增量备份的最长耗时，超时不写清单
+# 复用块的安全条件：块的 LastModified 晚于 备份开始 - (GC_GRACE - MAX_BACKUP_DURATION)。
+# 这样在 GC 能删除该块之前（开始后至少 MAX_BACKUP_DURATION），引用它的清单已写入；
+# 更旧的块在服务端原地复制（copy_object）以刷新 LastModified，无需重新上传
+REUSE_WINDOW = GC_GRACE - MAX_BACKUP_DURATION
+
+# 候选边界：锚点字节之后的位置（SQL 行结束符、换行、tar/二进制中常见的 NUL）。
+# 锚点由正则在 C 层查找，仅在候选处对前 WINDOW 字节计算 crc32 判定边界，
+# 判定只依赖内容本身而与偏移无关，因此插入/删除数据后边界能重新对齐
+_ANCHORS = re.compile(rb"[\x00\n)]")
+WINDOW = 48
+ANCHOR_SPACING = 64  # 估计的平均候选间距，用于由平均块长推算掩码位数
+
+
+class ContentChunker:
+    """内容定义分块
+
+    数据局部变化只影响附近的块边界，未变化区域切出的块与上次相同，从而可去重。
+    """
+    def __init__(
+        self,
+        min_size: int = DEFAULT_MIN_CHUNK,
+        avg_size: int = DEFAULT_AVG_CHUNK,
+        max_size: int = DEFAULT_MAX_CHUNK
+    ):
+        if not WINDOW <= min_size <= avg_size <= max_size:
+            raise ValueError(f"Chunk sizes must satisfy {WINDOW} <= min <= avg <= max")
+        bits = max((avg_size // ANCHOR_SPACING).bit_length() - 1, 1)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.mask = (1 << bits) - 1
+
+    def _cut_point(self, data) -> int:
+        """返回 data 中第一个块的长度"""
+        end = min(len(data), self.max_size)
+        if end <= self.min_size:
+            return end
+        # 跳过最小块长度内的字节，不参与边界判定
+        for match in _ANCHORS.finditer(data, self.min_size, end):
+            i = match.end()
+            if not zlib.crc32(data[i - WINDOW:i]) & self.mask:
+                return i
+        return end
+
+    def split(self, stream, read_size: int = DEFAULT_READ_SIZE):
+        """从二进制流中逐块产出数据（生成器，内存占用不超过 max_size + read_size）"""
+        buffer = bytearray()
+        eof = False
+        while True:
+            while not eof and len(buffer) < self.max_size:
+                data = stream.read(read_size)
+                if not data:
+                    eof = True
+                else:
+                    buffer += data
+            if not buffer:
+                return
+            cut = self._cut_point(buffer)
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
+
+
+class ChunkStore:
+    """S3 上的去重块存储
+
+    块以 HMAC-SHA256(明文) 作为 ID（不泄露明文哈希），先压缩再以 AES-GCM 单独加密，
+    块 ID 作为 AAD，防止块被替换到其他名字下。
+    """
+    def __init__(self, s3_client, bucket: str, symmetric_key: bytes, upload_args: dict = None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.upload_args = upload_args or {}
+        self.id_key = _derive_key(symmetric_key, b"backup-chunk-id")
+        self.manifest_key = _derive_key(symmetric_key, b"backup-manifest")
+        self.aead = AESGCM(symmetric_key)
+        self.known = {}
+        self.reuse_after = datetime.utcnow() - REUSE_WINDOW
+        self._lock = threading.Lock()
+
+    def chunk_id(self, data: bytes) -> str:
+        return hmac.new(self.id_key, data, hashlib.sha256).hexdigest()
+
+    def key_for(self, chunk_id: str) -> str:
+        return f"{CHUNK_PREFIX}/{chunk_id[:2]}/{chunk_id}"
+
+    def list_chunks(self) -> dict:
+        """列出已存储的块 {chunk_id: LastModified}"""
+        chunks = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{CHUNK_PREFIX}/"):
+            for obj in page.get('Contents', []):
+                chunks[obj['Key'].rsplit('/', 1)[-1]] = obj['LastModified']
+        return chunks
+
+    def load_index(self, now: datetime = None):
+        """加载已有块 {chunk_id: LastModified}（每次备份开始时列举一次）"""
+        now = now or datetime.utcnow()
+        self.known = {
+            chunk_id: modified.replace(tzinfo=None)
+            for chunk_id, modified in self.list_chunks().items()
+        }
+        self.reuse_after = now - REUSE_WINDOW
+
+    def claim(self, chunk_id: str) -> bool:
+        """若块不存在则登记并返回 True（调用方负责上传）"""
+        with self._lock:
+            if chunk_id in self.known:
+                return False
+            self.known[chunk_id] = datetime.utcnow()
+            return True
+
+    def claim_refresh(self, chunk_id: str) -> bool:
+        """若已存在的块 LastModified 早于复用窗口（可能在本次备份期间被 GC 回收）则登记并返回 True
+
+        调用方负责 refresh；每个块只会被登记一次。
+        """
+        with self._lock:
+            modified = self.known.get(chunk_id)
+            if modified is None or modified >= self.reuse_after:
+                return False
+            self.known[chunk_id] = datetime.utcnow()
+            return True
+
+    def seal(self, chunk_id: str, data: bytes) -> bytes:
+        nonce = os.urandom(12)
+        return nonce + self.aead.encrypt(nonce, zlib.compress(data, 6), chunk_id.encode())
+
+    def open(self, chunk_id: str, blob: bytes) -> bytes:
+        plain = zlib.decompress(self.aead.decrypt(blob[:12], blob[12:], chunk_id.encode()))
+        if not hmac.compare_digest(self.chunk_id(plain), chunk_id):
+            raise ValueError(f"Chunk content does not match id: {chunk_id}")
+        return plain
+
+    def put(self, chunk_id: str, data: bytes) -> int:
+        body = self.seal(chunk_id, data)
+        self.s3_client.put_object(
+            Bucket=self.bucket, Key=self.key_for(chunk_id), Body=body, **self.upload_args
+        )
+        return len(body)
+
+    def refresh(self, chunk_id: str) -> int:
+        """服务端原地复制块以刷新 LastModified（不传输块内容）
+
+        原地复制必须使用 MetadataDirective='REPLACE'，否则 S3 拒绝请求。
+        """
+        key = self.key_for(chunk_id)
+        self.s3_client.copy_object(
+            Bucket=self.bucket, Key=key, CopySource={'Bucket': self.bucket, 'Key': key},
+            MetadataDirective='REPLACE', **self.upload_args
+        )
+        return 0
+
+    def get(self, chunk_id: str) -> bytes:
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key_for(chunk_id))
+        return self.open(chunk_id, response['Body'].read())
+
+    def sign_manifest(self, manifest: dict) -> dict:
+        body = {k: v for k, v in manifest.items() if k != "signature"}
+        msg = json.dumps(body, sort_keys=True).encode()
+        return dict(body, signature=hmac.new(self.manifest_key, msg, hashlib.sha256).hexdigest())
+
+    def verify_manifest(self, manifest: dict) -> bool:
+        expected = self.sign_manifest(manifest)["signature"]
+        return hmac.compare_digest(manifest.get("signature", ""), expected)
+
+    def put_manifest(self, key: str, manifest: dict):
+        body = json.dumps(self.sign_manifest(manifest), sort_keys=True).encode()
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=body, **self.upload_args)
+
+    def get_manifest(self, key: str) -> dict:
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        manifest = json.loads(response['Body'].read())
+        if not self.verify_manifest(manifest):
+            raise ValueError(f"Invalid manifest signature: {key}")
+        return manifest
+
+
+def _derive_key(master: bytes, info: bytes) -> bytes:
+    """从主密钥派生用途隔离的子密钥"""
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(master)
+
+
+class IncrementalBackup:
+    """去重增量备份：数据流分块后只上传存储中缺失的块，并写入签名清单"""
+    def __init__(
+        self,
+        store: ChunkStore,
+        chunker: ContentChunker = None,
+        workers: int = 2,
+        upload_concurrency: int = DEFAULT_CHUNK_UPLOADS
+    ):
+        self.store = store
+        self.chunker = chunker or ContentChunker()
+        self.workers = workers
+        self.upload_concurrency = upload_concurrency
+
+    def run(self, sources: list, prefix: str, backup_id: str) -> dict:
+        """备份所有数据源并上传清单，返回清单内容
+
+        耗时超过 MAX_BACKUP_DURATION 时不写清单并抛出异常：复用的块此时可能已被 GC 回收。
+        """
+        started = datetime.utcnow()
+        self.store.load_index(now=started)
+        objects = {}
+        with ThreadPoolExecutor(max_workers=self.upload_concurrency) as uploader, \
+                ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self.backup_source, source, uploader): source
+                for source in sources
+            }
+            for future, source in futures.items():
+                objects[source.name] = future.result()
+        if datetime.utcnow() - started > MAX_BACKUP_DURATION:
+            raise RuntimeError(
+                f"Incremental backup took longer than {MAX_BACKUP_DURATION}; reused chunks may have been collected"
+            )
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "backup_id": backup_id,
+            "created_at": datetime.utcnow().isoformat(),
+            "objects": objects,
+        }
+        self.store.put_manifest(f"{prefix}/{MANIFEST_NAME}", manifest)
+        return manifest
+
+    def backup_source(self, source: BackupSource, uploader) -> dict:
+        """对单个数据源分块，缺失块上传、过旧块刷新，均交给上传线程池（在途数量有界）"""
+        started = time.monotonic()
+        process = source.open()
+        digest = hashlib.sha256()
+        chunks = []
+        pending = deque()
+        stats = {"size": 0, "new_chunks": 0, "refreshed_chunks": 0, "uploaded_bytes": 0}
+        try:
+            for data in self.chunker.split(process.stdout):
+                digest.update(data)
+                chunk_id = self.store.chunk_id(data)
+                chunks.append([chunk_id, len(data)])
+                stats["size"] += len(data)
+                if self.store.claim(chunk_id):
+                    stats["new_chunks"] += 1
+                    pending.append(uploader.submit(self.store.put, chunk_id, data))
+                elif self.store.claim_refresh(chunk_id):
+                    stats["refreshed_chunks"] += 1
+                    pending.append(uploader.submit(self.store.refresh, chunk_id))
+                while len(pending) > self.upload_concurrency * 2:
+                    stats["uploaded_bytes"] += pending.popleft().result()
+            while pending:
+                stats["uploaded_bytes"] += pending.popleft().result()
+        except BaseException:
+            if process.poll() is None:
+                process.kill()
+            finish(process)
+            raise
+        returncode, stderr = finish(process)
+        if returncode != 0:
+            raise RuntimeError(f"{source.name}: dump command failed ({returncode}): {stderr}")
+        stats.update(
+            sha256=digest.hexdigest(),
+            chunks=chunks,
+            elapsed=time.monotonic() - started,
+        )
+        return stats
+
+
+def collect_garbage(store: ChunkStore, manifests: list, now: datetime = None) -> dict:
+    """引用计数垃圾回收：删除不被任何存活清单引用、且超过宽限期的块
+
+    manifests 须在列举块之前读取。删除前重新读取块的 LastModified：
+    列举之后被进行中的备份刷新的块不会被删除。
+    """
+    now = now or datetime.utcnow()
+    refcounts = Counter()
+    for manifest in manifests:
+        for obj in manifest["objects"].values():
+            refcounts.update({chunk_id for chunk_id, _ in obj["chunks"]})
+    deleted = []
+    for chunk_id, modified in store.list_chunks().items():
+        if refcounts[chunk_id] or modified.replace(tzinfo=None) >= now - GC_GRACE:
+            continue
+        key = store.key_for(chunk_id)
+        try:
+            current = store.s3_client.head_object(Bucket=store.bucket, Key=key)['LastModified']
+        except store.s3_client.exceptions.ClientError:
+            continue
+        if current.replace(tzinfo=None) >= now - GC_GRACE:
+            continue
+        store.s3_client.delete_object(Bucket=store.bucket, Key=key)
+        deleted.append(chunk_id)
+    return {"referenced": len(refcounts), "deleted": deleted}
@@ -0,0 +1,327 @@
+import os
+import time
+import zlib
+import queue
+import hashlib
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 流水线默认参数
+DEFAULT_WORKERS = 2             # 并发备份的数据源数量
+DEFAULT_QUEUE_DEPTH = 8         # 各阶段之间队列的最大块数
+DEFAULT_READ_SIZE = 1024 * 1024
+DEFAULT_PART_SIZE = 32 * 1024 * 1024  # S3 分段上传最小 5 MiB（末段除外）
+DEFAULT_UPLOAD_CONCURRENCY = 4
+DEFAULT_COMPRESS_LEVEL = 6
+STDERR_TAIL = 64 * 1024         # 错误信息中保留的子进程标准错误末尾字节数
+
+_EOF = object()
+
+
+class PipelineAborted(Exception):
+    """流水线中某一阶段失败，其余阶段随之终止"""
+
+
+def _put(q, item, abort):
+    """带中止检查的阻塞入队"""
+    while True:
+        if abort.is_set():
+            raise PipelineAborted()
+        try:
+            q.put(item, timeout=0.2)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q, abort):
+    """带中止检查的阻塞出队"""
+    while True:
+        if abort.is_set():
+            raise PipelineAborted()
+        try:
+            return q.get(timeout=0.2)
+        except queue.Empty:
+            continue
+
+
+class _QueueWriter:
+    """将 write() 转为有界队列入队的文件对象"""
+    def __init__(self, q, abort):
+        self.q = q
+        self.abort = abort
+        self.wait = 0.0
+
+    def write(self, data) -> int:
+        if data:
+            started = time.monotonic()
+            _put(self.q, bytes(data), self.abort)
+            self.wait += time.monotonic() - started
+        return len(data)
+
+    def close(self):
+        _put(self.q, _EOF, self.abort)
+
+
+class _QueueReader:
+    """从有界队列读取数据的文件对象"""
+    def __init__(self, q, abort):
+        self.q = q
+        self.abort = abort
+        self.buffer = bytearray()
+        self.eof = False
+        self.wait = 0.0
+
+    def read(self, size: int = -1) -> bytes:
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            started = time.monotonic()
+            item = _get(self.q, self.abort)
+            self.wait += time.monotonic() - started
+            if item is _EOF:
+                self.eof = True
+            else:
+                self.buffer += item
+        if size < 0 or size > len(self.buffer):
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def spawn(command: list, env: dict = None, **kwargs) -> subprocess.Popen:
+    """启动外部命令，标准错误写入临时文件而不是管道
+
+    管道缓冲区写满后子进程会阻塞在写标准错误上，而调用方只在标准输出读完后
+    才读标准错误，两者互相等待；写入文件则不受输出量限制。
+    """
+    stderr = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(command, stderr=stderr, env=env, **kwargs)
+    except BaseException:
+        stderr.close()
+        raise
+    process.stderr_file = stderr
+    return process
+
+
+def finish(process) -> tuple:
+    """等待子进程结束并关闭标准错误临时文件，返回 (退出码, 标准错误末尾)"""
+    returncode = process.wait()
+    stderr = process.stderr_file
+    try:
+        stderr.seek(0, os.SEEK_END)
+        stderr.seek(max(0, stderr.tell() - STDERR_TAIL))
+        return returncode, stderr.read().decode(errors='replace').strip()
+    finally:
+        stderr.close()
+
+
+class BackupSource:
+    """备份数据源：一个将数据写到标准输出的外部命令"""
+    def __init__(self, name: str, command: list, env: dict = None):
+        self.name = name
+        self.command = command
+        self.env = env
+
+    def open(self):
+        return spawn(self.command, env=self.env, stdout=subprocess.PIPE)
+
+
+class BackupPipeline:
+    """单次流式备份流水线
+
+    每个数据源经过 读取+压缩 -> 加密 -> SHA-256+分段上传 三个阶段，
+    阶段之间通过有界队列连接，数据只在内存中流动一次，不落盘。
+    多个数据源由线程池并发处理。
+    """
+    def __init__(
+        self,
+        encryption_service,
+        s3_client,
+        bucket: str,
+        workers: int = DEFAULT_WORKERS,
+        queue_depth: int = DEFAULT_QUEUE_DEPTH,
+        part_size: int = DEFAULT_PART_SIZE,
+        upload_concurrency: int = DEFAULT_UPLOAD_CONCURRENCY,
+        compress_level: int = DEFAULT_COMPRESS_LEVEL,
+        upload_args: dict = None
+    ):
+        self.encryption_service = encryption_service
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.part_size = part_size
+        self.upload_concurrency = upload_concurrency
+        self.compress_level = compress_level
+        self.upload_args = upload_args or {}
+
+    def run(self, sources: list, prefix: str) -> dict:
+        """并发备份所有数据源，返回 {对象名: 统计信息}"""
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self.backup_source, source, prefix): source
+                for source in sources
+            }
+            for future, source in futures.items():
+                results[source.name] = future.result()
+        return results
+
+    def backup_source(self, source: BackupSource, prefix: str) -> dict:
+        """对单个数据源执行单次流式备份"""
+        return self.backup_stream(source.name, source.open, prefix)
+
+    def backup_stream(self, name: str, opener, prefix: str) -> dict:
+        """opener() 返回 spawn() 启动的进程；压缩、加密、哈希、上传在同一遍中完成"""
+        key = f"{prefix}/{name}"
+        abort = threading.Event()
+        compressed_q = queue.Queue(maxsize=self.queue_depth)
+        encrypted_q = queue.Queue(maxsize=self.queue_depth)
+        stats = {
+            'key': key,
+            'raw_bytes': 0,
+            'compressed_bytes': 0,
+            'encrypted_bytes': 0,
+            'sha256': None,
+            'timings': {},
+        }
+        errors = []
+        started = time.monotonic()
+
+        def guarded(stage):
+            def runner():
+                try:
+                    stage()
+                except PipelineAborted:
+                    pass
+                except BaseException as e:
+                    errors.append(e)
+                    abort.set()
+            return runner
+
+        process = opener()
+
+        def compress_stage():
+            # gzip 格式（wbits=31），与原先的 .gz 文件兼容
+            busy = 0.0
+            compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, 31)
+            writer = _QueueWriter(compressed_q, abort)
+            while True:
+                chunk = process.stdout.read(DEFAULT_READ_SIZE)
+                if not chunk:
+                    break
+                t = time.monotonic()
+                out = compressor.compress(chunk)
+                busy += time.monotonic() - t
+                stats['raw_bytes'] += len(chunk)
+                stats['compressed_bytes'] += len(out)
+                writer.write(out)
+            out = compressor.flush()
+            stats['compressed_bytes'] += len(out)
+            writer.write(out)
+            returncode, stderr = finish(process)
+            if returncode != 0:
+                raise RuntimeError(f"{name}: dump command failed ({returncode}): {stderr}")
+            writer.close()
+            stats['timings']['compress'] = busy
+
+        def encrypt_stage():
+            reader = _QueueReader(compressed_q, abort)
+            writer = _QueueWriter(encrypted_q, abort)
+            t = time.monotonic()
+            stats['encrypted_bytes'] = self.encryption_service.encrypt_stream(reader, writer)
+            writer.close()
+            stats['timings']['encrypt'] = time.monotonic() - t - reader.wait - writer.wait
+
+        def upload_stage():
+            stats['sha256'], stats['timings']['hash'], stats['timings']['upload'] = \
+                self._multipart_upload(key, encrypted_q, abort)
+
+        threads = [
+            threading.Thread(target=guarded(stage), name=f"backup-{name}-{stage.__name__}")
+            for stage in (compress_stage, encrypt_stage, upload_stage)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            if process.poll() is None:
+                process.kill()
+            if not process.stderr_file.closed:
+                finish(process)
+            raise errors[0]
+
+        stats['timings']['elapsed'] = time.monotonic() - started
+        return stats
+
+    def _multipart_upload(self, key: str, encrypted_q, abort) -> tuple:
+        """消费加密数据：计算 SHA-256 并以分段上传方式写入 S3"""
+        digest = hashlib.sha256()
+        hash_busy = 0.0
+        upload_busy = 0.0
+        upload = self.s3_client.create_multipart_upload(
+            Bucket=self.bucket, Key=key, **self.upload_args
+        )
+        upload_id = upload['UploadId']
+        parts = []
+        pending = deque()
+
+        def send(number, body):
+            t = time.monotonic()
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket, Key=key, UploadId=upload_id,
+                PartNumber=number, Body=body
+            )
+            return {'PartNumber': number, 'ETag': response['ETag']}, time.monotonic() - t
+
+        def drain(limit):
+            nonlocal upload_busy
+            while len(pending) > limit:
+                part, spent = pending.popleft().result()
+                parts.append(part)
+                upload_busy += spent
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.upload_concurrency) as executor:
+                buffer = bytearray()
+                while True:
+                    item = _get(encrypted_q, abort)
+                    if item is _EOF:
+                        break
+                    t = time.monotonic()
+                    digest.update(item)
+                    hash_busy += time.monotonic() - t
+                    buffer += item
+                    if len(buffer) >= self.part_size:
+                        pending.append(executor.submit(send, len(parts) + len(pending) + 1, bytes(buffer)))
+                        buffer = bytearray()
+                        drain(self.upload_concurrency)
+                # 末段（或空对象的唯一分段）
+                if buffer or not (parts or pending):
+                    pending.append(executor.submit(send, len(parts) + len(pending) + 1, bytes(buffer)))
+                drain(0)
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id
+            )
+            raise
+        return digest.hexdigest(), hash_busy, upload_busy
+
+    def upload_checksums(self, results: dict, prefix: str) -> str:
+        """上传 sha256sum 格式的校验文件（使用对象名而非本地路径）"""
+        body = "".join(
+            f"{stats['sha256']}  {name}\n" for name, stats in sorted(results.items())
+        ).encode()
+        key = f"{prefix}/checksum.sha256"
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=body, **self.upload_args)
+        return key
@@ -0,0 +1,414 @@
+import os
+import sys
+import hmac
+import time
+import zlib
+import queue
+import base64
+import hashlib
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.exceptions import InvalidTag
+from .encryption import STREAM_MAGIC
+from .backup_pipeline import PipelineAborted, _QueueReader, _QueueWriter, finish, spawn
+from .backup_chunks import ChunkStore, MANIFEST_NAME
+
+# 恢复默认参数
+DEFAULT_RESTORE_WORKERS = 2        # 并发恢复的对象数
+DEFAULT_RANGE_SIZE = 16 * 1024 * 1024
+DEFAULT_RANGE_CONCURRENCY = 4      # 单个对象并发的分段下载数
+DEFAULT_QUEUE_DEPTH = 8
+CHECKSUM_NAME = "checksum.sha256"
+
+
+class BackupIntegrityError(ValueError):
+    """备份对象校验失败（SHA-256 不匹配或认证标签无效）"""
+
+
+class NullSink:
+    """仅校验不落地的输出（--verify-only）"""
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    """写入本地文件"""
+    def __init__(self, path: str):
+        self.f = open(path, 'wb')
+
+    def write(self, data):
+        return self.f.write(data)
+
+    def close(self):
+        self.f.close()
+
+
+class ProcessSink:
+    """写入外部命令的标准输入（如 mysql）"""
+    def __init__(self, command: list, env: dict = None):
+        self.process = spawn(command, env=env, stdin=subprocess.PIPE)
+
+    def write(self, data):
+        return self.process.stdin.write(data)
+
+    def close(self):
+        self.process.stdin.close()
+        returncode, stderr = finish(self.process)
+        if returncode != 0:
+            raise RuntimeError(f"Restore command failed ({returncode}): {stderr}")
+
+
+class _GunzipWriter:
+    """边解压 gzip 边写入下游"""
+    def __init__(self, sink):
+        self.sink = sink
+        self.decompressor = zlib.decompressobj(31)
+        self.bytes = 0
+
+    def write(self, data):
+        out = self.decompressor.decompress(data)
+        if out:
+            self.bytes += len(out)
+            self.sink.write(out)
+        return len(data)
+
+    def finish(self):
+        out = self.decompressor.flush()
+        if out:
+            self.bytes += len(out)
+            self.sink.write(out)
+        if not self.decompressor.eof:
+            raise ValueError("Truncated gzip stream")
+
+
+def parse_checksums(body: bytes) -> dict:
+    """解析 sha256sum 格式校验文件；兼容旧版记录本地绝对路径的格式（取文件名）"""
+    checksums = {}
+    for line in body.decode().splitlines():
+        if not line.strip():
+            continue
+        digest, path = line.split(None, 1)
+        checksums[os.path.basename(path.lstrip('*').strip())] = digest
+    return checksums
+
+
+class BackupRestorer:
+    """备份恢复与校验
+
+    全量备份：对象分段并发下载（Range GET），同一遍内完成 SHA-256 校验、解密与解压；
+    增量备份：校验清单签名后并发拉取块，逐块校验 ID 并按顺序重组。
+    """
+    def __init__(
+        self,
+        encryption_service,
+        s3_client,
+        bucket: str,
+        workers: int = DEFAULT_RESTORE_WORKERS,
+        range_size: int = DEFAULT_RANGE_SIZE,
+        range_concurrency: int = DEFAULT_RANGE_CONCURRENCY,
+        queue_depth: int = DEFAULT_QUEUE_DEPTH
+    ):
+        self.encryption_service = encryption_service
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.workers = workers
+        self.range_size = range_size
+        self.range_concurrency = range_concurrency
+        self.queue_depth = queue_depth
+
+    def list_backup(self, date: str) -> dict:
+        """列出 backups/<date>/ 下的对象 {名称: 大小}"""
+        prefix = f"backups/{date}"
+        objects = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{prefix}/"):
+            for obj in page.get('Contents', []):
+                objects[obj['Key'][len(prefix) + 1:]] = obj['Size']
+        if not objects:
+            raise FileNotFoundError(f"No backup found under {prefix}/")
+        return {'prefix': prefix, 'objects': objects}
+
+    def restore(self, date: str, sink_factory=None, names: list = None) -> dict:
+        """恢复或校验指定日期的备份
+
+        sink_factory(name) 返回输出对象；为空时只校验（--verify-only）。
+        返回 {对象名: 统计信息} 以及整体吞吐量。
+        """
+        sink_factory = sink_factory or (lambda name: NullSink())
+        listing = self.list_backup(date)
+        started = time.monotonic()
+
+        if MANIFEST_NAME in listing['objects']:
+            jobs = self._incremental_jobs(listing, names)
+        else:
+            jobs = self._full_jobs(listing, names)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                name: executor.submit(self._run_job, job, sink_factory, name)
+                for name, job in jobs.items()
+            }
+            for name, future in futures.items():
+                results[name] = future.result()
+
+        elapsed = time.monotonic() - started
+        downloaded = sum(r['downloaded_bytes'] for r in results.values())
+        return {
+            'prefix': listing['prefix'],
+            'objects': results,
+            'downloaded_bytes': downloaded,
+            'elapsed': elapsed,
+            'throughput_mbps': downloaded / (1024 * 1024) / elapsed if elapsed else 0.0,
+        }
+
+    def _run_job(self, job, sink_factory, name: str) -> dict:
+        started = time.monotonic()
+        sink = sink_factory(name)
+        try:
+            stats = job(sink)
+        except BaseException:
+            try:
+                sink.close()
+            except Exception:
+                pass
+            raise
+        sink.close()
+        stats['elapsed'] = time.monotonic() - started
+        stats['throughput_mbps'] = (
+            stats['downloaded_bytes'] / (1024 * 1024) / stats['elapsed'] if stats['elapsed'] else 0.0
+        )
+        return stats
+
+    def _full_jobs(self, listing: dict, names: list) -> dict:
+        body = self._get(f"{listing['prefix']}/{CHECKSUM_NAME}")
+        checksums = parse_checksums(body)
+        jobs = {}
+        for name, size in listing['objects'].items():
+            if name == CHECKSUM_NAME or (names and name not in names):
+                continue
+            if name not in checksums:
+                raise ValueError(f"No checksum recorded for {name}")
+            key = f"{listing['prefix']}/{name}"
+            jobs[name] = (
+                lambda sink, key=key, size=size, name=name:
+                self._restore_object(key, size, checksums[name], name.endswith('.gz.enc'), sink)
+            )
+        return jobs
+
+    def _incremental_jobs(self, listing: dict, names: list) -> dict:
+        store = ChunkStore(self.s3_client, self.bucket, self.encryption_service.symmetric_key)
+        manifest = store.get_manifest(f"{listing['prefix']}/{MANIFEST_NAME}")
+        return {
+            name: (lambda sink, obj=obj: self._restore_chunks(store, obj, sink))
+            for name, obj in manifest['objects'].items()
+            if not names or name in names
+        }
+
+    def _get(self, key: str, byte_range: tuple = None) -> bytes:
+        kwargs = {}
+        if byte_range:
+            kwargs['Range'] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        return self.s3_client.get_object(Bucket=self.bucket, Key=key, **kwargs)['Body'].read()
+
+    def _download(self, key: str, size: int, writer, stats: dict) -> str:
+        """分段并发下载对象，按顺序写入 writer，返回 SHA-256"""
+        digest = hashlib.sha256()
+        ranges = [
+            (start, min(start + self.range_size, size) - 1)
+            for start in range(0, size, self.range_size)
+        ]
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.range_concurrency) as executor:
+            for byte_range in ranges:
+                pending.append(executor.submit(self._get, key, byte_range))
+                while len(pending) > self.range_concurrency:
+                    self._consume(pending.popleft().result(), digest, writer, stats)
+            while pending:
+                self._consume(pending.popleft().result(), digest, writer, stats)
+        return digest.hexdigest()
+
+    def _restore_object(self, key: str, size: int, expected_sha256: str, gzipped: bool, sink) -> dict:
+        """分段并发下载单个加密对象，同时校验、解密、解压"""
+        if size and self._get(key, (0, len(STREAM_MAGIC) - 1)) != STREAM_MAGIC:
+            return self._restore_legacy_object(key, size, expected_sha256, gzipped, sink)
+        abort = threading.Event()
+        encrypted_q = queue.Queue(maxsize=self.queue_depth)
+        errors = []
+        output = _GunzipWriter(sink) if gzipped else sink
+        stats = {'downloaded_bytes': 0, 'restored_bytes': 0}
+
+        def decrypt_stage():
+            try:
+                written = self.encryption_service.decrypt_stream(
+                    _QueueReader(encrypted_q, abort), output
+                )
+                if gzipped:
+                    output.finish()
+                    written = output.bytes
+                stats['restored_bytes'] = written
+            except PipelineAborted:
+                pass
+            except InvalidTag:
+                errors.append(BackupIntegrityError(f"Authentication failed for {key}"))
+                abort.set()
+            except BaseException as e:
+                errors.append(e)
+                abort.set()
+
+        decryptor = threading.Thread(target=decrypt_stage, name=f"restore-{key}")
+        decryptor.start()
+        writer = _QueueWriter(encrypted_q, abort)
+        try:
+            stats['sha256'] = self._download(key, size, writer, stats)
+            if not hmac.compare_digest(stats['sha256'], expected_sha256):
+                raise BackupIntegrityError(f"Checksum mismatch for {key}")
+            writer.close()
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            abort.set()
+        decryptor.join()
+        if errors:
+            raise errors[0]
+        return stats
+
+    def _restore_legacy_object(self, key: str, size: int, expected_sha256: str, gzipped: bool, sink) -> dict:
+        """旧版 base64(iv:tag:ciphertext) 整体加密的对象：下载到临时文件后由 decrypt_file 解密"""
+        stats = {'downloaded_bytes': 0, 'restored_bytes': 0}
+        output = _GunzipWriter(sink) if gzipped else sink
+        with tempfile.TemporaryDirectory() as tmp:
+            encrypted_path = os.path.join(tmp, 'object.enc')
+            plain_path = os.path.join(tmp, 'object')
+            with open(encrypted_path, 'wb') as f:
+                stats['sha256'] = self._download(key, size, f, stats)
+            if not hmac.compare_digest(stats['sha256'], expected_sha256):
+                raise BackupIntegrityError(f"Checksum mismatch for {key}")
+            try:
+                self.encryption_service.decrypt_file(encrypted_path, plain_path)
+            except InvalidTag:
+                raise BackupIntegrityError(f"Authentication failed for {key}")
+            with open(plain_path, 'rb') as f:
+                shutil.copyfileobj(f, output)
+            stats['restored_bytes'] = os.path.getsize(plain_path)
+        if gzipped:
+            output.finish()
+            stats['restored_bytes'] = output.bytes
+        return stats
+
+    @staticmethod
+    def _consume(body: bytes, digest, writer, stats):
+        digest.update(body)
+        stats['downloaded_bytes'] += len(body)
+        writer.write(body)
+
+    def _restore_chunks(self, store: ChunkStore, obj: dict, sink) -> dict:
+        """并发拉取增量备份的块，按顺序写出并校验整体 SHA-256"""
+        digest = hashlib.sha256()
+        stats = {'downloaded_bytes': 0, 'restored_bytes': 0}
+        pending = deque()
+
+        def fetch(chunk_id):
+            blob = self._get(store.key_for(chunk_id))
+            return len(blob), store.open(chunk_id, blob)
+
+        def consume(future):
+            downloaded, data = future.result()
+            stats['downloaded_bytes'] += downloaded
+            stats['restored_bytes'] += len(data)
+            digest.update(data)
+            sink.write(data)
+
+        with ThreadPoolExecutor(max_workers=self.range_concurrency) as executor:
+            for chunk_id, _ in obj['chunks']:
+                pending.append(executor.submit(fetch, chunk_id))
+                while len(pending) > self.range_concurrency * 2:
+                    consume(pending.popleft())
+            while pending:
+                consume(pending.popleft())
+        if not hmac.compare_digest(digest.hexdigest(), obj['sha256']):
+            raise BackupIntegrityError("Checksum mismatch for reassembled object")
+        stats['sha256'] = digest.hexdigest()
+        return stats
+
+
+def database_name(object_name: str):
+    """从对象名推出数据库名（bank_db.sql.gz.enc / bank_db.sql），非数据库对象返回 None"""
+    base = object_name.split('.', 1)
+    if len(base) == 2 and base[1] in ('sql', 'sql.gz.enc'):
+        return base[0]
+    return None
+
+
+def mysql_sink_factory(user: str, output_dir: str = None):
+    """数据库对象导入 mysql，其他对象写到 output_dir"""
+    def factory(name):
+        db = database_name(name)
+        if db:
+            return ProcessSink(['mysql', '-u', user, db])
+        if output_dir:
+            return FileSink(os.path.join(output_dir, name.replace('.gz.enc', '.gz')))
+        return NullSink()
+    return factory
+
+
+def main(argv=None):
+    """命令行入口：python -m services.backup_restore 2024-01-01 --bucket bank-backups --verify-only"""
+    import boto3
+    from .encryption import EncryptionService
+
+    parser = argparse.ArgumentParser(description="Restore or verify a backup from S3")
+    parser.add_argument('date', help="backup date, e.g. 2024-01-01")
+    parser.add_argument('--bucket', default=os.environ.get('S3_BUCKET'))
+    parser.add_argument('--endpoint-url', default=os.environ.get('BACKUP_S3_ENDPOINT_URL'))
+    parser.add_argument('--verify-only', action='store_true',
+                        help="download, decrypt and check without writing anything")
+    parser.add_argument('--object', action='append', dest='names', help="restore only these objects")
+    parser.add_argument('--mysql-user', default=os.environ.get('DB_USER', 'root'))
+    parser.add_argument('--output-dir', help="where non-database objects are written")
+    parser.add_argument('--workers', type=int, default=DEFAULT_RESTORE_WORKERS)
+    parser.add_argument('--range-concurrency', type=int, default=DEFAULT_RANGE_CONCURRENCY)
+    parser.add_argument('--range-size', type=int, default=DEFAULT_RANGE_SIZE)
+    args = parser.parse_args(argv)
+
+    if not args.bucket:
+        parser.error("--bucket or S3_BUCKET is required")
+    symmetric_key = os.environ.get('SYMMETRIC_KEY')
+    if not symmetric_key:
+        parser.error("SYMMETRIC_KEY must be set")
+
+    encryption_service = EncryptionService()
+    encryption_service.symmetric_key = base64.urlsafe_b64decode(symmetric_key)
+    restorer = BackupRestorer(
+        encryption_service,
+        boto3.client('s3', endpoint_url=args.endpoint_url),
+        args.bucket,
+        workers=args.workers,
+        range_size=args.range_size,
+        range_concurrency=args.range_concurrency
+    )
+    sink_factory = None if args.verify_only else mysql_sink_factory(args.mysql_user, args.output_dir)
+
+    try:
+        report = restorer.restore(args.date, sink_factory=sink_factory, names=args.names)
+    except Exception as e:
+        print(f"FAILED: {e}", file=sys.stderr)
+        return 1
+    for name, stats in sorted(report['objects'].items()):
+        print(f"OK  {name}  {stats['downloaded_bytes']} bytes  {stats['throughput_mbps']:.1f} MB/s")
+    print(f"{report['prefix']}: {report['downloaded_bytes']} bytes in "
+          f"{report['elapsed']:.1f}s ({report['throughput_mbps']:.1f} MB/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import csv
+import io
+import json
+
+# 批量接口接受的请求体格式（Content-Type -> 解析方式）
+BATCH_FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+
+def rejected(row: int, error: str) -> dict:
+    return {'row': row, 'status': 'rejected', 'error': error}
+
+
+def read_batch(text: str, fmt: str, required_fields=()) -> list:
+    """把批次文件解析为 [(行号, 记录)]；NDJSON 中无法解析的行记录为 None，文件格式错误抛出 ValueError"""
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(text))
+        missing = set(required_fields) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"CSV header missing: {', '.join(sorted(missing))}")
+        return [(number, record) for number, record in enumerate(reader, 1)]
+    if fmt == 'ndjson':
+        records = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            records.append((number, record if isinstance(record, dict) else None))
+        return records
+    raise ValueError(f"Unsupported batch format: {fmt}")
+
+
+def missing_fields(record: dict, required_fields) -> bool:
+    return not all(record.get(field) not in (None, '') for field in required_fields)
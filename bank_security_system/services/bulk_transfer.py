@@ -0,0 +1,192 @@
+import logging
+from decimal import Decimal
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from models.account import Account
+from models.transaction import Transaction
+from .ledger import account_balances, post_transfers
+from .transfer import TransferError, begin, is_retryable, parse_account_id, parse_amount
+from .batch_files import read_batch, rejected, missing_fields
+
+logger = logging.getLogger(__name__)
+
+# 批量转账默认参数
+DEFAULT_CHUNK_SIZE = 500       # 每个数据库事务包含的转账笔数
+DEFAULT_MAX_ROWS = 50000       # 单个批次的行数上限
+
+REQUIRED_FIELDS = ('from_account', 'to_account', 'amount')
+
+
+class BulkTransferRow:
+    """校验通过的一行转账"""
+    __slots__ = ('row', 'from_account_id', 'to_account_id', 'amount', 'idempotency_key')
+
+    def __init__(self, row: int, from_account_id: int, to_account_id: int, amount: Decimal, idempotency_key: str):
+        self.row = row
+        self.from_account_id = from_account_id
+        self.to_account_id = to_account_id
+        self.amount = amount
+        self.idempotency_key = idempotency_key
+
+
+def validate_batch(records: list) -> tuple:
+    """在写库之前逐行校验，返回 (有效行, 被拒绝行的结果)"""
+    valid, results = [], []
+    seen_keys = set()
+    for number, record in records:
+        if record is None:
+            results.append(rejected(number, "Malformed row"))
+            continue
+        if missing_fields(record, REQUIRED_FIELDS):
+            results.append(rejected(number, "Missing required fields"))
+            continue
+        key = record.get('idempotency_key') or None
+        try:
+            row = BulkTransferRow(
+                number,
+                parse_account_id(record['from_account']),
+                parse_account_id(record['to_account']),
+                parse_amount(record['amount']),
+                str(key) if key is not None else None
+            )
+            if row.from_account_id == row.to_account_id:
+                raise TransferError("Cannot transfer to the same account")
+            if key is not None:
+                if len(row.idempotency_key) > 64:
+                    raise TransferError("Idempotency key too long")
+                if row.idempotency_key in seen_keys:
+                    raise TransferError("Duplicate idempotency key in batch")
+                seen_keys.add(row.idempotency_key)
+        except TransferError as e:
+            results.append(rejected(number, str(e)))
+            continue
+        valid.append(row)
+    return valid, results
+
+
+class BulkTransferProcessor:
+    """批量转账：按 chunk_size 分组，每组一个数据库事务
+
+    每组在新事务中先按账户 ID 顺序一次性锁定全部借方账户，再查询幂等键与余额
+    （与转账引擎相同，避免 MySQL 一致性快照早于加锁），余额只查询一次并在内存中逐笔扣减；
+    金额批量加密，交易记录与分录批量插入，整组一次提交。业务错误只拒绝对应行，
+    不影响同组其他行；死锁等可重试错误沿用转账引擎的退避参数重试整组。
+    """
+    def __init__(self, engine, chunk_size: int = DEFAULT_CHUNK_SIZE, max_rows: int = DEFAULT_MAX_ROWS):
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.max_rows = max_rows
+
+    def init_app(self, app):
+        self.chunk_size = app.config.get('BULK_TRANSFER_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        self.max_rows = app.config.get('BULK_TRANSFER_MAX_ROWS', DEFAULT_MAX_ROWS)
+
+    @property
+    def session(self):
+        return Transaction.query.session
+
+    def prepare(self, text: str, fmt: str) -> tuple:
+        """解析并校验整个批次，返回 (有效行, 被拒绝行的结果)；批次本身不合法时抛出 ValueError"""
+        records = read_batch(text, fmt, REQUIRED_FIELDS)
+        if not records:
+            raise ValueError("Empty batch")
+        if len(records) > self.max_rows:
+            raise ValueError(f"Batch exceeds {self.max_rows} rows")
+        return validate_batch(records)
+
+    def process(self, rows: list):
+        """逐组执行，每组提交后产出该组各行的结果"""
+        for start in range(0, len(rows), self.chunk_size):
+            yield self._run_chunk(rows[start:start + self.chunk_size])
+
+    def _run_chunk(self, rows: list) -> list:
+        begin(self.session)
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(rows)
+            except DBAPIError as e:
+                self.session.rollback()
+                # 唯一约束冲突说明并发请求已提交相同幂等键，重试时会按重放处理
+                if not (isinstance(e, IntegrityError) or is_retryable(e)) or attempt >= self.engine.max_retries:
+                    logger.exception("Bulk transfer chunk failed")
+                    return [{'row': row.row, 'status': 'failed', 'error': "Database error"} for row in rows]
+                attempt += 1
+                self.engine.backoff(attempt)
+            except Exception:
+                self.session.rollback()
+                raise
+
+    def _attempt(self, rows: list) -> list:
+        session = self.session
+        results = {}
+        source_ids = sorted({row.from_account_id for row in rows})
+        accounts = {account.id: account for account in session.query(Account).filter(
+            Account.id.in_(source_ids)
+        ).order_by(Account.id).with_for_update().populate_existing()}
+        pending = self._replays(rows, results)
+        source_ids = sorted({row.from_account_id for row in pending})
+
+        target_ids = {row.to_account_id for row in pending} - accounts.keys()
+        if target_ids:
+            accounts.update((account.id, account) for account in Account.query.filter(Account.id.in_(target_ids)))
+        balances = account_balances(self.engine.encryption_service, sorted(accounts.keys() & set(source_ids)))
+
+        accepted = []
+        for row in pending:
+            source = accounts.get(row.from_account_id)
+            target = accounts.get(row.to_account_id)
+            if source is None or target is None:
+                missing = row.from_account_id if source is None else row.to_account_id
+                results[row.row] = rejected(row.row, f"Account {missing} not found")
+            elif source.currency != target.currency:
+                results[row.row] = rejected(row.row, "Currency mismatch")
+            elif balances[row.from_account_id] < row.amount:
+                results[row.row] = rejected(row.row, "Insufficient funds")
+            else:
+                balances[row.from_account_id] -= row.amount
+                # 贷方账户若也是本组的借方（已加锁），入账后的余额可供后续行使用
+                if row.to_account_id in balances:
+                    balances[row.to_account_id] += row.amount
+                accepted.append(row)
+
+        if accepted:
+            encrypted = self.engine.encryption_service.encrypt_many([str(row.amount).encode() for row in accepted])
+            transactions = [Transaction(
+                from_account_id=row.from_account_id,
+                to_account_id=row.to_account_id,
+                amount=amount,
+                status='completed',
+                idempotency_key=row.idempotency_key
+            ) for row, amount in zip(accepted, encrypted)]
+            session.add_all(transactions)
+            session.flush()
+            post_transfers(session, self.engine.encryption_service, [(transaction, row.amount) for transaction, row in zip(transactions, accepted)])
+            for transaction, row in zip(transactions, accepted):
+                results[row.row] = {'row': row.row, 'status': 'completed', 'transaction_id': transaction.id}
+        session.commit()
+        self.engine.invalidate_accounts({a for row in accepted for a in (row.from_account_id, row.to_account_id)})
+        return [results[row.row] for row in rows]
+
+    def _replays(self, rows: list, results: dict) -> list:
+        """处理已存在的幂等键：参数一致视为重放，否则拒绝；返回仍需执行的行"""
+        keys = [row.idempotency_key for row in rows if row.idempotency_key]
+        if not keys:
+            return list(rows)
+        existing = {t.idempotency_key: t for t in Transaction.query.filter(Transaction.idempotency_key.in_(keys))}
+        if not existing:
+            return list(rows)
+        transactions = list(existing.values())
+        amounts = self.engine.encryption_service.decrypt_many([t.amount for t in transactions])
+        stored = {t.idempotency_key: (t.from_account_id, t.to_account_id, Decimal(amount.decode()))
+                  for t, amount in zip(transactions, amounts)}
+
+        pending = []
+        for row in rows:
+            transaction = existing.get(row.idempotency_key)
+            if transaction is None:
+                pending.append(row)
+            elif stored[row.idempotency_key] != (row.from_account_id, row.to_account_id, row.amount):
+                results[row.row] = rejected(row.row, "Idempotency key already used for a different transfer")
+            else:
+                results[row.row] = {'row': row.row, 'status': 'replayed', 'transaction_id': transaction.id}
+        return pending
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import logging
+import argparse
+from itertools import chain
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from models.user import User, roles_users
+from models.role import Role
+from .batch_files import read_batch, rejected, missing_fields
+from .password_hashing import password_hasher
+
+logger = logging.getLogger(__name__)
+
+# 批量开户默认参数
+DEFAULT_CHUNK_SIZE = 500        # 每个数据库事务包含的用户数
+DEFAULT_MAX_ROWS = 20000        # 单个批次的行数上限（用户名校验为一条 IN 查询）
+DEFAULT_HASH_WORKERS = None     # 口令哈希进程数，None 表示全部 CPU
+MAX_CHUNK_ATTEMPTS = 3
+USERNAME_MAX_LENGTH = 64
+
+REQUIRED_FIELDS = ('username', 'password', 'roles')
+
+
+class BulkUserRow:
+    """校验通过的一行用户"""
+    __slots__ = ('row', 'username', 'password', 'password_hash', 'role_ids')
+
+    def __init__(self, row: int, username: str, password: str, role_ids: list):
+        self.row = row
+        self.username = username
+        self.password = password
+        self.password_hash = None
+        self.role_ids = role_ids
+
+
+def _role_names(value) -> list:
+    """角色可写为列表（NDJSON）或以分号分隔的字符串（CSV）"""
+    if isinstance(value, list):
+        names = [str(name).strip() for name in value]
+    else:
+        names = [name.strip() for name in str(value).split(';')]
+    return sorted({name for name in names if name})
+
+
+class BulkUserImporter:
+    """批量开户：先整体校验，再按 chunk_size 分组哈希口令并批量插入
+
+    用户名在一次 IN 查询中对照唯一索引校验，角色名一次查询解析为 ID；
+    口令哈希在进程池中并行计算，且在开启数据库事务之前完成，事务只包含
+    users 与 roles_users 两条批量插入。每次导入只启动一个进程池（spawn），
+    各组共用；大批量导入建议走命令行入口，避免长时间占用 Web worker。
+    """
+    def __init__(
+        self,
+        hasher=password_hasher,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_rows: int = DEFAULT_MAX_ROWS,
+        hash_workers: int = DEFAULT_HASH_WORKERS
+    ):
+        self.hasher = hasher
+        self.chunk_size = chunk_size
+        self.max_rows = max_rows
+        self.hash_workers = hash_workers
+
+    def init_app(self, app):
+        self.chunk_size = app.config.get('BULK_USER_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        self.max_rows = app.config.get('BULK_USER_MAX_ROWS', DEFAULT_MAX_ROWS)
+        self.hash_workers = app.config.get('BULK_USER_HASH_WORKERS', DEFAULT_HASH_WORKERS)
+
+    @property
+    def session(self):
+        return User.query.session
+
+    def prepare(self, text: str, fmt: str) -> tuple:
+        """解析并校验整个批次，返回 (有效行, 被拒绝行的结果)；批次本身不合法时抛出 ValueError"""
+        records = read_batch(text, fmt, REQUIRED_FIELDS)
+        if not records:
+            raise ValueError("Empty batch")
+        if len(records) > self.max_rows:
+            raise ValueError(f"Batch exceeds {self.max_rows} rows")
+
+        candidates, results = [], []
+        seen = set()
+        for number, record in records:
+            if record is None:
+                results.append(rejected(number, "Malformed row"))
+            elif missing_fields(record, REQUIRED_FIELDS):
+                results.append(rejected(number, "Missing required fields"))
+            else:
+                username = str(record['username']).strip()
+                names = _role_names(record['roles'])
+                if not username or len(username) > USERNAME_MAX_LENGTH:
+                    results.append(rejected(number, "Invalid username"))
+                elif username in seen:
+                    results.append(rejected(number, "Duplicate username in batch"))
+                elif not names:
+                    results.append(rejected(number, "Missing required fields"))
+                else:
+                    seen.add(username)
+                    candidates.append((number, username, str(record['password']), names))
+
+        role_ids = dict(Role.query.with_entities(Role.name, Role.id).filter(
+            Role.name.in_({name for *_, names in candidates for name in names})
+        ))
+        existing = self._existing_usernames(seen)
+
+        rows = []
+        for number, username, password, names in candidates:
+            unknown = [name for name in names if name not in role_ids]
+            if username in existing:
+                results.append(rejected(number, "Username already exists"))
+            elif unknown:
+                results.append(rejected(number, f"Unknown role: {', '.join(unknown)}"))
+            else:
+                rows.append(BulkUserRow(number, username, password, [role_ids[name] for name in names]))
+        return rows, results
+
+    def _existing_usernames(self, usernames) -> set:
+        if not usernames:
+            return set()
+        return {username for username, in User.query.with_entities(User.username).filter(
+            User.username.in_(list(usernames)))}
+
+    def process(self, rows: list):
+        """逐组哈希并提交，每组提交后产出该组各行的结果
+
+        进程池在生成器结束或被关闭（如流式响应的客户端断开）时释放。
+        """
+        if not rows:
+            return
+        workers = min(self.hash_workers or os.cpu_count() or 1, len(rows))
+        with self.hasher.batch_pool(workers) as pool:
+            for start in range(0, len(rows), self.chunk_size):
+                chunk = rows[start:start + self.chunk_size]
+                hashes = self.hasher.hash_many([row.password for row in chunk], workers=workers, pool=pool)
+                for row, password_hash in zip(chunk, hashes):
+                    row.password_hash = password_hash
+                    row.password = None
+                yield self._run_chunk(chunk)
+
+    def _run_chunk(self, rows: list) -> list:
+        results = {}
+        pending = rows
+        for _ in range(MAX_CHUNK_ATTEMPTS):
+            if not pending:
+                break
+            try:
+                results.update(self._insert(pending))
+                break
+            except IntegrityError:
+                # 并发请求先创建了同名用户：剔除这些行后重试其余行
+                self.session.rollback()
+                existing = self._existing_usernames(row.username for row in pending)
+                for row in pending:
+                    if row.username in existing:
+                        results[row.row] = rejected(row.row, "Username already exists")
+                pending = [row for row in pending if row.username not in existing]
+            except Exception:
+                self.session.rollback()
+                raise
+        else:
+            logger.error("Bulk user chunk kept failing on unique constraint")
+        for row in rows:
+            results.setdefault(row.row, {'row': row.row, 'status': 'failed', 'error': "Database error"})
+        return [results[row.row] for row in rows]
+
+    def _insert(self, rows: list) -> dict:
+        session = self.session
+        session.execute(insert(User), [
+            {'username': row.username, 'password_hash': row.password_hash} for row in rows
+        ])
+        # 不依赖 INSERT ... RETURNING（MySQL 不支持），按用户名取回新 ID
+        user_ids = dict(User.query.with_entities(User.username, User.id).filter(
+            User.username.in_([row.username for row in rows])))
+        session.execute(roles_users.insert(), [
+            {'user_id': user_ids[row.username], 'role_id': role_id}
+            for row in rows for role_id in row.role_ids
+        ])
+        session.commit()
+        return {row.row: {'row': row.row, 'status': 'created', 'user_id': user_ids[row.username]} for row in rows}
+
+
+bulk_user_importer = BulkUserImporter()
+
+
+def main(argv=None):
+    """命令行入口：python -m services.bulk_users users.csv [--url mysql+pymysql://...]"""
+    from flask import Flask
+    from config import Config
+    from models.base_model import db
+
+    parser = argparse.ArgumentParser(description="Provision users in bulk from a CSV or NDJSON file")
+    parser.add_argument('path', help="CSV (username,password,roles) or NDJSON file")
+    parser.add_argument('--url', default=Config.SQLALCHEMY_DATABASE_URI, help="database URL")
+    parser.add_argument('--workers', type=int, help="password hashing processes (default: all CPUs)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.url
+    db.init_app(app)
+    password_hasher.init_app(app)
+    importer = BulkUserImporter(chunk_size=args.chunk_size, hash_workers=args.workers)
+    fmt = 'csv' if args.path.endswith('.csv') else 'ndjson'
+    with open(args.path, encoding='utf-8') as f:
+        text = f.read()
+
+    summary = {'created': 0, 'rejected': 0, 'failed': 0}
+    with app.app_context():
+        rows, results = importer.prepare(text, fmt)
+        for chunk in chain([results], importer.process(rows)):
+            for result in chunk:
+                summary[result['status']] += 1
+                print(json.dumps(result))
+    print(json.dumps({'summary': summary}), file=sys.stderr)
+    return 0 if not summary['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,17 @@
+from functools import wraps
+from models.base_model import db
+
+
+def read_only(f):
+    """只读接口装饰器：本次请求的查询发往只读副本（未配置副本时仍走主库）
+
+    会话在请求结束时随应用上下文销毁，标记不会带到下一个请求；流式响应在
+    stream_with_context 内继续使用同一会话。处理中若发生写入，会话自动固定到主库。
+    副本存在复制延迟，只读接口看到的数据可能落后主库数秒；因此不要用于填充
+    按版本号失效的缓存的接口（如账户视图），否则旧数据会以新版本号写入缓存。
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        db.session().use_replica()
+        return f(*args, **kwargs)
+    return decorated_function
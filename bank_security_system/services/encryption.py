@@ -1,13 +1,26 @@
 import os
 import base64
 import logging
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.backends import default_backend  # 保留但可能不再需要
 from flask import current_app
+from .envelope import (
+    EnvelopeCipher,
+    DataKeyCache,
+    SQLDataKeyStore,
+    DEFAULT_DEK_CACHE_SIZE,
+    DEFAULT_DEK_CACHE_TTL,
+    DEFAULT_DEK_ROTATE_AFTER,
+    DEFAULT_DEK_MAX_MESSAGES,
+)
 import hmac
 
 # 在调用 cryptography 前添加环境路径配置（可能已不再需要）
@@ -16,12 +29,63 @@ import hmac
 # venv_path = os.path.dirname(os.path.dirname(os.__file__))
 # os.environ['PATH'] = os.path.join(venv_path, 'Scripts') + os.pathsep + os.environ['PATH']
 
+# 分段流式文件格式（v1）
+# 头部: MAGIC(4) | 版本(1) | 分段大小(4, 大端) | nonce 前缀(7)
+# 正文: 若干个 [密文 + 16 字节 GCM tag]，除最后一段外明文长度均为分段大小
+# 每段 nonce = 前缀(7) | 段序号(4, 大端) | 末段标志(1)，头部作为 AAD，
+# 因此段的删除、重排、截断或拼接都会导致认证失败
+STREAM_MAGIC = b"\x89BSE"  # 0x89 不属于 base64 字符集，可与旧格式区分
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct(">4sBI7s")
+STREAM_TAG_SIZE = 16
+DEFAULT_SEGMENT_SIZE = 4 * 1024 * 1024  # 4 MiB
+MAX_SEGMENT_SIZE = 64 * 1024 * 1024     # 64 MiB；解密时每个在途段按头部声明的长度读入内存
+DEFAULT_STREAM_WORKERS = 4
+
+# 字段批量加密格式: nonce(12) | 密文 | GCM tag(16)，每个值一段连续字节
+FIELD_NONCE_SIZE = 12
+DEFAULT_BATCH_PARALLEL_THRESHOLD = 4096  # 超过该数量的批次分片交给线程池
+DEFAULT_BATCH_CHUNK_SIZE = 1024
+
+
+def _read_exact(f, size: int) -> bytes:
+    """读取恰好 size 字节（管道可能短读），EOF 时返回已读部分"""
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = f.read(size - len(buf))
+        if not chunk:
+            break
+        buf += chunk
+    return bytes(buf)
+
+
+def _segment_nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    """生成分段 nonce"""
+    if index > 0xFFFFFFFF:
+        raise ValueError("Too many segments in stream")
+    return prefix + struct.pack(">IB", index, 1 if last else 0)
+
+
+def _with_associated_data(values: list, associated_data) -> list:
+    """[(值, AAD)]；associated_data 可为所有值共用的单个值或逐值列表"""
+    if isinstance(associated_data, (list, tuple)):
+        if len(associated_data) != len(values):
+            raise ValueError("associated_data must match the number of values")
+        return list(zip(values, associated_data))
+    return [(value, associated_data) for value in values]
+
+
 class EncryptionService:
     def __init__(self):
         self.symmetric_key = None
         self.private_key = None
         self.public_key = None
         self.signing_key = None
+        self.segment_size = DEFAULT_SEGMENT_SIZE
+        self.stream_workers = DEFAULT_STREAM_WORKERS
+        self.envelope = None
+        self.batch_parallel_threshold = DEFAULT_BATCH_PARALLEL_THRESHOLD
+        self._field_aead = None  # (密钥, AESGCM)，密钥变化时重建
 
     def init_app(self, app):
         """初始化加密服务配置"""
@@ -39,6 +103,27 @@ class EncryptionService:
         # 签名密钥
         self.signing_key = app.config.get('SIGNING_KEY', os.urandom(32))
 
+        # 流式文件加密参数
+        self.segment_size = app.config.get('ENCRYPTION_SEGMENT_SIZE', DEFAULT_SEGMENT_SIZE)
+        self.stream_workers = app.config.get('ENCRYPTION_STREAM_WORKERS', DEFAULT_STREAM_WORKERS)
+        self.batch_parallel_threshold = app.config.get(
+            'ENCRYPTION_BATCH_PARALLEL_THRESHOLD', DEFAULT_BATCH_PARALLEL_THRESHOLD
+        )
+
+        # 信封加密（需要 RSA 密钥对包装数据密钥）
+        if self.public_key:
+            self.envelope = EnvelopeCipher(
+                wrap=self.encrypt_asymmetric,
+                unwrap=self.decrypt_asymmetric,
+                store=SQLDataKeyStore(),
+                cache=DataKeyCache(
+                    max_size=app.config.get('ENVELOPE_DEK_CACHE_SIZE', DEFAULT_DEK_CACHE_SIZE),
+                    ttl=app.config.get('ENVELOPE_DEK_CACHE_TTL', DEFAULT_DEK_CACHE_TTL)
+                ),
+                rotate_after=app.config.get('ENVELOPE_DEK_ROTATE_AFTER', DEFAULT_DEK_ROTATE_AFTER),
+                max_messages=app.config.get('ENVELOPE_DEK_MAX_MESSAGES', DEFAULT_DEK_MAX_MESSAGES)
+            )
+
     def _load_rsa_keys(self, private_key_path: str, public_key_path: str):
         """加载RSA密钥对"""
         if private_key_path:
@@ -82,6 +167,56 @@ class EncryptionService:
         decryptor = cipher.decryptor()
         return decryptor.update(ciphertext) + decryptor.finalize()
 
+    def _aead(self) -> AESGCM:
+        """复用已初始化的 AESGCM 实例（密钥扩展只做一次）"""
+        if not self.symmetric_key:
+            raise ValueError("Symmetric key not initialized")
+        cached = self._field_aead
+        if cached is None or cached[0] is not self.symmetric_key:
+            cached = self._field_aead = (self.symmetric_key, AESGCM(self.symmetric_key))
+        return cached[1]
+
+    def _map_batch(self, fn, values: list, workers: int = None) -> list:
+        """小批次在当前线程处理；大批次分片并行（cryptography 在加解密时释放 GIL）"""
+        if len(values) < self.batch_parallel_threshold:
+            return fn(values)
+        chunks = [values[i:i + DEFAULT_BATCH_CHUNK_SIZE]
+                  for i in range(0, len(values), DEFAULT_BATCH_CHUNK_SIZE)]
+        results = []
+        with ThreadPoolExecutor(max_workers=workers or self.stream_workers) as executor:
+            for chunk in executor.map(fn, chunks):
+                results.extend(chunk)
+        return results
+
+    def encrypt_many(self, plaintexts, associated_data=None, workers: int = None) -> list:
+        """批量 AES-256-GCM 加密，每个值返回 nonce | 密文 | tag 的连续字节
+
+        associated_data 为单个值时所有值共用；为列表时与 plaintexts 一一对应（逐行绑定）。
+        """
+        aead = self._aead()
+        urandom = os.urandom
+
+        def seal(chunk):
+            out = []
+            for plaintext, ad in chunk:
+                nonce = urandom(FIELD_NONCE_SIZE)
+                out.append(nonce + aead.encrypt(nonce, plaintext, ad))
+            return out
+
+        plaintexts = list(plaintexts)
+        return self._map_batch(seal, _with_associated_data(plaintexts, associated_data), workers)
+
+    def decrypt_many(self, ciphertexts, associated_data=None, workers: int = None) -> list:
+        """批量解密 encrypt_many 的输出（associated_data 规则同上）；任一值认证失败即抛出 InvalidTag"""
+        aead = self._aead()
+
+        def open_(chunk):
+            return [aead.decrypt(value[:FIELD_NONCE_SIZE], value[FIELD_NONCE_SIZE:], ad)
+                    for value, ad in chunk]
+
+        ciphertexts = list(ciphertexts)
+        return self._map_batch(open_, _with_associated_data(ciphertexts, associated_data), workers)
+
     def encrypt_asymmetric(self, plaintext: bytes) -> bytes:
         """RSA-OAEP非对称加密"""
         if not self.public_key:
@@ -108,6 +243,18 @@ class EncryptionService:
             )
         )
 
+    def encrypt_envelope(self, plaintext: bytes, associated_data: bytes = b"") -> bytes:
+        """信封加密：AES-GCM 数据密钥加密记录，密文内携带 DEK ID（替代逐条 RSA 加密）"""
+        if not self.envelope:
+            raise ValueError("Envelope encryption not configured")
+        return self.envelope.encrypt(plaintext, associated_data)
+
+    def decrypt_envelope(self, envelope: bytes, associated_data: bytes = b"") -> bytes:
+        """信封解密：DEK 命中缓存时不做 RSA 私钥运算"""
+        if not self.envelope:
+            raise ValueError("Envelope encryption not configured")
+        return self.envelope.decrypt(envelope, associated_data)
+
     def generate_hmac(self, data: bytes) -> bytes:
         """生成HMAC-SHA256签名"""
         hmac_obj = hmac.new(self.signing_key, data, hashes.SHA256())
@@ -128,29 +275,124 @@ class EncryptionService:
         )
         return kdf.derive(password)
 
+    def encrypt_stream(self, src, dst, segment_size: int = None, workers: int = None) -> int:
+        """流式分段加密（AES-256-GCM），内存占用与文件大小无关
+
+        src/dst 为二进制文件对象，返回写入的字节数
+        """
+        if not self.symmetric_key:
+            raise ValueError("Symmetric key not initialized")
+        segment_size = segment_size or self.segment_size
+        if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+            raise ValueError(f"Segment size must be between 1 and {MAX_SEGMENT_SIZE} bytes")
+        workers = workers or self.stream_workers
+
+        aead = AESGCM(self.symmetric_key)
+        header = STREAM_HEADER.pack(
+            STREAM_MAGIC, STREAM_VERSION, segment_size, os.urandom(7)
+        )
+        prefix = header[-7:]
+        dst.write(header)
+        written = len(header)
+
+        def seal(index, last, data):
+            return aead.encrypt(_segment_nonce(prefix, index, last), data, header)
+
+        # 预读一段以判断当前段是否为末段；在途任务数受限，保证内存恒定
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            index = 0
+            current = _read_exact(src, segment_size)
+            while True:
+                following = _read_exact(src, segment_size) if len(current) == segment_size else b""
+                last = not following
+                pending.append(executor.submit(seal, index, last, current))
+                while len(pending) > workers * 2:
+                    sealed = pending.popleft().result()
+                    dst.write(sealed)
+                    written += len(sealed)
+                if last:
+                    break
+                index += 1
+                current = following
+            while pending:
+                sealed = pending.popleft().result()
+                dst.write(sealed)
+                written += len(sealed)
+        return written
+
+    def decrypt_stream(self, src, dst, workers: int = None) -> int:
+        """流式分段解密，校验每段认证标签及段顺序/完整性
+
+        返回写入的明文字节数
+        """
+        if not self.symmetric_key:
+            raise ValueError("Symmetric key not initialized")
+        workers = workers or self.stream_workers
+
+        header = _read_exact(src, STREAM_HEADER.size)
+        if len(header) != STREAM_HEADER.size:
+            raise ValueError("Truncated stream header")
+        magic, version, segment_size, prefix = STREAM_HEADER.unpack(header)
+        if magic != STREAM_MAGIC:
+            raise ValueError("Not an encrypted stream")
+        if version != STREAM_VERSION:
+            raise ValueError(f"Unsupported stream version: {version}")
+        # 头部在首段认证之前即被使用，先限制段长，防止伪造的头部导致巨量内存分配
+        if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+            raise ValueError(f"Invalid stream segment size: {segment_size}")
+
+        aead = AESGCM(self.symmetric_key)
+        frame_size = segment_size + STREAM_TAG_SIZE
+
+        def open_(index, last, data):
+            return aead.decrypt(_segment_nonce(prefix, index, last), data, header)
+
+        pending = deque()
+        written = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            index = 0
+            current = _read_exact(src, frame_size)
+            if len(current) < STREAM_TAG_SIZE:
+                raise ValueError("Truncated stream body")
+            while True:
+                following = _read_exact(src, frame_size) if len(current) == frame_size else b""
+                last = not following
+                pending.append(executor.submit(open_, index, last, current))
+                while len(pending) > workers * 2:
+                    plain = pending.popleft().result()
+                    dst.write(plain)
+                    written += len(plain)
+                if last:
+                    break
+                index += 1
+                current = following
+            while pending:
+                plain = pending.popleft().result()
+                dst.write(plain)
+                written += len(plain)
+        return written
+
     def encrypt_file(self, input_path: str, output_path: str):
-        """加密文件（AES-256-GCM）"""
-        with open(input_path, 'rb') as f:
-            plaintext = f.read()
-        
-        encrypted = self.encrypt_symmetric(plaintext)
-        
-        with open(output_path, 'wb') as f:
-            # 使用更安全的分隔符（避免数据污染）
-            f.write(base64.urlsafe_b64encode(
-                encrypted['iv'] + b":" + 
-                encrypted['tag'] + b":" + 
-                encrypted['ciphertext']
-            ))
+        """加密文件（分段流式 AES-256-GCM，原始二进制输出）"""
+        with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+            self.encrypt_stream(src, dst)
 
     def decrypt_file(self, input_path: str, output_path: str):
-        """解密文件"""
-        with open(input_path, 'rb') as f:
-            encrypted_data = base64.urlsafe_b64decode(f.read())
-        
+        """解密文件（自动识别分段格式与旧版 base64 格式）"""
+        with open(input_path, 'rb') as src:
+            if src.read(len(STREAM_MAGIC)) == STREAM_MAGIC:
+                src.seek(0)
+                with open(output_path, 'wb') as dst:
+                    self.decrypt_stream(src, dst)
+                return
+            src.seek(0)
+            encrypted_data = base64.urlsafe_b64decode(src.read())
+
+        # 旧版格式：base64(iv:tag:ciphertext)
         parts = encrypted_data.split(b":", 2)
         iv, tag, ciphertext = parts
         plaintext = self.decrypt_symmetric(ciphertext, iv, tag)
         
         with open(output_path, 'wb') as f:
-            f.write(plaintext)
\ No newline at end of file
+            f.write(plaintext)
@@ -0,0 +1,181 @@
+import os
+import time
+import struct
+import threading
+from collections import OrderedDict
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# 信封加密格式（v1）
+# MAGIC(4) | 版本(1) | DEK ID(16) | nonce(12) | 密文 + 16 字节 GCM tag
+# 头部与调用方提供的关联数据一起作为 AAD，DEK ID 被篡改即无法解密
+ENVELOPE_MAGIC = b"\x89BEV"
+ENVELOPE_VERSION = 1
+ENVELOPE_HEADER = struct.Struct(">4sB16s12s")
+
+# 数据密钥默认参数
+DEFAULT_DEK_CACHE_SIZE = 1024
+DEFAULT_DEK_CACHE_TTL = 3600            # 秒；解包后的 DEK 在内存中的最长保留时间
+DEFAULT_DEK_ROTATE_AFTER = 86400        # 秒；加密用 DEK 的轮换周期
+DEFAULT_DEK_MAX_MESSAGES = 1 << 24      # 单个 DEK 最多加密的记录数（随机 nonce 的安全余量）
+
+
+class DataKeyCache:
+    """有界、限时的 DEK 缓存（缓存已初始化的 AESGCM 对象）
+
+    同一 DEK 并发未命中时只有一个线程执行解包（RSA 私钥运算），其余线程等待结果。
+    """
+    def __init__(self, max_size: int = DEFAULT_DEK_CACHE_SIZE, ttl: float = DEFAULT_DEK_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.loads = 0
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def put(self, key_id: bytes, key):
+        with self._lock:
+            self._store(key_id, key)
+
+    def _store(self, key_id: bytes, key):
+        self.entries[key_id] = (key, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _lookup(self, key_id: bytes):
+        entry = self.entries.get(key_id)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self.entries[key_id]
+            return None
+        self.entries.move_to_end(key_id)
+        return entry[0]
+
+    def get(self, key_id: bytes, loader):
+        with self._lock:
+            key = self._lookup(key_id)
+            if key is not None:
+                return key
+            loading = self._loading.get(key_id)
+            if loading is None:
+                loading = self._loading[key_id] = threading.Lock()
+                loading.acquire()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            # 等待正在解包的线程；其失败时自行重试
+            with loading:
+                pass
+            return self.get(key_id, loader)
+        try:
+            key = loader(key_id)
+            with self._lock:
+                self.loads += 1
+                self._store(key_id, key)
+            return key
+        finally:
+            with self._lock:
+                del self._loading[key_id]
+            loading.release()
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+class SQLDataKeyStore:
+    """包装后的 DEK 保存在 data_key 表中
+
+    模型延迟导入：加密服务需可脱离数据库单独使用（如备份恢复命令行）。
+    新 DEK 在独立会话中提交：不提交调用方的未完成事务，调用方回滚时 DEK 也不会随之丢失
+    （之后的密文仍会使用该 DEK）。
+    """
+    def put(self, key_id: bytes, wrapped_key: bytes):
+        from sqlalchemy.orm import Session
+        from models.base_model import db
+        from models.data_key import DataKey
+        with Session(db.engine) as session, session.begin():
+            session.add(DataKey(id=key_id.hex(), wrapped_key=wrapped_key))
+
+    def get(self, key_id: bytes) -> bytes:
+        from models.data_key import DataKey
+        row = DataKey.query.get(key_id.hex())
+        if row is None:
+            raise KeyError(f"Unknown data key {key_id.hex()}")
+        return row.wrapped_key
+
+
+class EnvelopeCipher:
+    """信封加密：记录用 AES-256-GCM 数据密钥加密，数据密钥由 RSA 公钥包装后入库
+
+    每个进程持有一个当前 DEK 用于加密（新建时只需一次 RSA 公钥运算），
+    达到轮换周期或加密次数上限后生成新的 DEK。解密时按密文中的 DEK ID
+    从缓存取密钥，未命中才做 RSA 私钥解包，因此每个 DEK 在每个进程中
+    至多解包一次（缓存过期或被淘汰之前）。
+    """
+    def __init__(
+        self,
+        wrap,
+        unwrap,
+        store,
+        cache: DataKeyCache = None,
+        rotate_after: float = DEFAULT_DEK_ROTATE_AFTER,
+        max_messages: int = DEFAULT_DEK_MAX_MESSAGES
+    ):
+        self.wrap = wrap
+        self.unwrap = unwrap
+        self.store = store
+        self.cache = cache or DataKeyCache()
+        self.rotate_after = rotate_after
+        self.max_messages = max_messages
+        self._current = None   # (key_id, AESGCM, 创建时间, 已加密次数)
+        self._lock = threading.Lock()
+
+    def _new_key(self):
+        key_id = os.urandom(16)
+        key = AESGCM.generate_key(bit_length=256)
+        self.store.put(key_id, self.wrap(key))
+        aead = AESGCM(key)
+        self.cache.put(key_id, aead)
+        return [key_id, aead, time.monotonic(), 0]
+
+    def _encryption_key(self):
+        with self._lock:
+            current = self._current
+            if (current is None or current[3] >= self.max_messages
+                    or time.monotonic() - current[2] > self.rotate_after):
+                current = self._current = self._new_key()
+            current[3] += 1
+            return current[0], current[1]
+
+    def rotate(self):
+        """立即弃用当前 DEK，下一次加密时生成新的"""
+        with self._lock:
+            self._current = None
+
+    def encrypt(self, plaintext: bytes, associated_data: bytes = b"") -> bytes:
+        key_id, aead = self._encryption_key()
+        header = ENVELOPE_HEADER.pack(ENVELOPE_MAGIC, ENVELOPE_VERSION, key_id, os.urandom(12))
+        return header + aead.encrypt(header[-12:], plaintext, header + associated_data)
+
+    def decrypt(self, envelope: bytes, associated_data: bytes = b"") -> bytes:
+        magic, version, key_id, nonce = parse_header(envelope)
+        aead = self.cache.get(key_id, lambda kid: AESGCM(self.unwrap(self.store.get(kid))))
+        header = envelope[:ENVELOPE_HEADER.size]
+        return aead.decrypt(nonce, envelope[ENVELOPE_HEADER.size:], header + associated_data)
+
+
+def parse_header(envelope: bytes) -> tuple:
+    if len(envelope) < ENVELOPE_HEADER.size or envelope[:4] != ENVELOPE_MAGIC:
+        raise ValueError("Not an envelope-encrypted record")
+    magic, version, key_id, nonce = ENVELOPE_HEADER.unpack_from(envelope)
+    if version != ENVELOPE_VERSION:
+        raise ValueError(f"Unsupported envelope version {version}")
+    return magic, version, key_id, nonce
+
+
+def envelope_key_id(envelope: bytes) -> str:
+    """返回密文所用 DEK 的 ID（十六进制），用于按密钥统计或重新加密"""
+    return parse_header(envelope)[2].hex()
@@ -0,0 +1,223 @@
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import func, and_, insert
+from sqlalchemy.exc import IntegrityError
+from apscheduler.schedulers.background import BackgroundScheduler
+from models.ledger import LedgerEntry, BalanceSnapshot
+
+logger = logging.getLogger(__name__)
+
+# 快照压缩默认参数。快照之后未压缩的分录覆盖最近 lag + interval 秒（热点收款账户在扣款时
+# 持锁逐条解密这些分录），因此两者都应尽量小；lag 须大于转账事务的最长耗时
+# （含锁等待，InnoDB innodb_lock_wait_timeout 默认 50 秒）
+DEFAULT_COMPACT_INTERVAL = 30     # 秒；压缩任务运行间隔
+DEFAULT_COMPACT_LAG = 60          # 秒；只把早于该时长的分录并入快照
+DEFAULT_COMPACT_MIN_ENTRIES = 100 # 快照之后累计分录达到该数量的账户才生成新快照
+COMPACT_BATCH_SIZE = 500
+
+ZERO = Decimal('0.00')
+
+
+def _session():
+    return LedgerEntry.query.session
+
+
+# 分录金额与快照余额均以字段加密格式保存，AAD 绑定所属账户与位置，
+# 密文被挪到其他账户、交易或快照位置时解密失败
+def entry_aad(account_id: int, transaction_id: int) -> bytes:
+    return f"ledger-entry:{account_id}:{transaction_id}".encode()
+
+
+def snapshot_aad(account_id: int, last_entry_id: int) -> bytes:
+    return f"balance-snapshot:{account_id}:{last_entry_id}".encode()
+
+
+def _seal(encryption_service, values: list, aads: list) -> list:
+    return encryption_service.encrypt_many([str(value).encode() for value in values], associated_data=aads)
+
+
+def _open(encryption_service, ciphertexts: list, aads: list) -> list:
+    return [Decimal(value.decode()) for value in encryption_service.decrypt_many(ciphertexts, associated_data=aads)]
+
+
+def post_transfer(session, encryption_service, transaction, amount: Decimal):
+    """为交易写入一借一贷两条分录（调用方负责提交）"""
+    post_transfers(session, encryption_service, [(transaction, amount)])
+
+
+def post_transfers(session, encryption_service, transfers):
+    """批量写入分录：transfers 为 [(交易, 金额)]，金额批量加密后一次 executemany（调用方负责提交）"""
+    entries = []
+    for transaction, amount in transfers:
+        entries.append({'account_id': transaction.from_account_id, 'transaction_id': transaction.id, 'amount': -amount})
+        entries.append({'account_id': transaction.to_account_id, 'transaction_id': transaction.id, 'amount': amount})
+    if not entries:
+        return
+    sealed = _seal(
+        encryption_service,
+        [entry['amount'] for entry in entries],
+        [entry_aad(entry['account_id'], entry['transaction_id']) for entry in entries]
+    )
+    for entry, amount in zip(entries, sealed):
+        entry['amount'] = amount
+    session.execute(insert(LedgerEntry), entries)
+
+
+def _latest_snapshots(account_ids=None):
+    """每个账户最新快照的子查询：(account_id, last_entry_id)"""
+    query = _session().query(
+        BalanceSnapshot.account_id,
+        func.max(BalanceSnapshot.last_entry_id).label('last_entry_id')
+    )
+    if account_ids is not None:
+        query = query.filter(BalanceSnapshot.account_id.in_(account_ids))
+    return query.group_by(BalanceSnapshot.account_id).subquery()
+
+
+def _snapshots(encryption_service, account_ids) -> dict:
+    """各账户最新快照：{account_id: (balance, last_entry_id)}，无快照的账户不在结果中"""
+    latest = _latest_snapshots(account_ids)
+    rows = _session().query(
+        BalanceSnapshot.account_id, BalanceSnapshot.balance, BalanceSnapshot.last_entry_id
+    ).join(latest, and_(
+        BalanceSnapshot.account_id == latest.c.account_id,
+        BalanceSnapshot.last_entry_id == latest.c.last_entry_id
+    )).all()
+    balances = _open(
+        encryption_service,
+        [balance for _, balance, _ in rows],
+        [snapshot_aad(account_id, last_entry_id) for account_id, _, last_entry_id in rows]
+    )
+    return {
+        account_id: (balance, last_entry_id)
+        for (account_id, _, last_entry_id), balance in zip(rows, balances)
+    }
+
+
+def _entries_sum(encryption_service, account_id: int, after_id: int, upto_id: int = None) -> Decimal:
+    """快照之后的分录之和；金额加密，逐行解密后在应用内累加
+
+    快照压缩使分录数保持在最近 lag + interval 秒的分录（或少于 min_entries 条）以内。
+    """
+    query = _session().query(LedgerEntry.transaction_id, LedgerEntry.amount).filter(
+        LedgerEntry.account_id == account_id,
+        LedgerEntry.id > after_id
+    )
+    if upto_id is not None:
+        query = query.filter(LedgerEntry.id <= upto_id)
+    rows = query.all()
+    amounts = _open(
+        encryption_service,
+        [amount for _, amount in rows],
+        [entry_aad(account_id, transaction_id) for transaction_id, _ in rows]
+    )
+    return sum(amounts, ZERO)
+
+
+def account_balances(encryption_service, account_ids) -> dict:
+    """批量计算余额：最新快照 + 快照之后的分录（均走索引）"""
+    account_ids = list(account_ids)
+    snapshots = _snapshots(encryption_service, account_ids)
+    balances = {}
+    for account_id in account_ids:
+        balance, last_entry_id = snapshots.get(account_id, (ZERO, 0))
+        balances[account_id] = balance + _entries_sum(encryption_service, account_id, last_entry_id)
+    return balances
+
+
+def account_balance(encryption_service, account_id: int) -> Decimal:
+    return account_balances(encryption_service, [account_id])[account_id]
+
+
+def new_snapshot(encryption_service, account_id: int, balance: Decimal, last_entry_id: int) -> BalanceSnapshot:
+    return BalanceSnapshot(
+        account_id=account_id,
+        balance=_seal(encryption_service, [balance], [snapshot_aad(account_id, last_entry_id)])[0],
+        last_entry_id=last_entry_id
+    )
+
+
+def open_balance(session, encryption_service, account_id: int, balance: Decimal):
+    """为新账户写入期初余额快照（调用方负责提交）"""
+    session.add(new_snapshot(encryption_service, account_id, balance, 0))
+
+
+class LedgerCompactor:
+    """后台把各账户的分录滚动并入新的余额快照，使余额查询只需累加少量分录
+
+    分录 ID 在插入时分配、提交顺序可能不同，因此只处理 compact_lag 秒之前的分录，
+    保证小于截止 ID 的分录都已提交（lag 须大于转账事务的最长耗时）。多个进程同时压缩时由 (account_id, last_entry_id)
+    唯一约束去重。快照只追加不修改，历史快照保留用于审计。
+    """
+    def __init__(
+        self,
+        encryption_service=None,
+        interval: int = DEFAULT_COMPACT_INTERVAL,
+        lag: int = DEFAULT_COMPACT_LAG,
+        min_entries: int = DEFAULT_COMPACT_MIN_ENTRIES
+    ):
+        self.encryption_service = encryption_service
+        self.interval = interval
+        self.lag = lag
+        self.min_entries = min_entries
+        self.scheduler = None
+        self.app = None
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('LEDGER_COMPACT_INTERVAL', DEFAULT_COMPACT_INTERVAL)
+        self.lag = app.config.get('LEDGER_COMPACT_LAG', DEFAULT_COMPACT_LAG)
+        self.min_entries = app.config.get('LEDGER_COMPACT_MIN_ENTRIES', DEFAULT_COMPACT_MIN_ENTRIES)
+        if app.config.get('LEDGER_COMPACTOR_ENABLED', True):
+            self.scheduler = BackgroundScheduler()
+            self.scheduler.add_job(self._run, 'interval', seconds=self.interval, max_instances=1)
+            self.scheduler.start()
+
+    def _run(self):
+        with self.app.app_context():
+            try:
+                self.compact()
+            except Exception:
+                logger.exception("Ledger compaction failed")
+
+    def compact(self, now: datetime = None) -> int:
+        """生成新快照，返回新建快照数"""
+        session = _session()
+        cutoff_time = (now or datetime.utcnow()) - timedelta(seconds=self.lag)
+        cutoff_id = session.query(func.max(LedgerEntry.id)).filter(
+            LedgerEntry.created_at < cutoff_time
+        ).scalar()
+        if not cutoff_id:
+            return 0
+
+        latest = _latest_snapshots()
+        candidates = [account_id for account_id, in session.query(LedgerEntry.account_id).outerjoin(
+            latest, LedgerEntry.account_id == latest.c.account_id
+        ).filter(
+            LedgerEntry.id > func.coalesce(latest.c.last_entry_id, 0),
+            LedgerEntry.id <= cutoff_id
+        ).group_by(LedgerEntry.account_id).having(
+            func.count(LedgerEntry.id) >= self.min_entries
+        )]
+
+        created = 0
+        for start in range(0, len(candidates), COMPACT_BATCH_SIZE):
+            batch = candidates[start:start + COMPACT_BATCH_SIZE]
+            snapshots = _snapshots(self.encryption_service, batch)
+            new_snapshots = []
+            for account_id in batch:
+                # 基于刚读到的快照累加 (last_entry_id, cutoff_id] 内的分录；这些分录已提交且不再变化
+                balance, last_entry_id = snapshots.get(account_id, (ZERO, 0))
+                if last_entry_id >= cutoff_id:
+                    continue
+                balance += _entries_sum(self.encryption_service, account_id, last_entry_id, cutoff_id)
+                new_snapshots.append(new_snapshot(self.encryption_service, account_id, balance, cutoff_id))
+            session.add_all(new_snapshots)
+            try:
+                session.commit()
+                created += len(new_snapshots)
+            except IntegrityError:
+                # 其他进程已为同一截止点生成快照
+                session.rollback()
+        return created
@@ -0,0 +1,169 @@
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import threading
+
+# 登录限流默认参数
+DEFAULT_WINDOW = 300                # 秒；滑动窗口长度
+DEFAULT_MAX_USER_FAILURES = 5       # 每个用户名在窗口内允许的失败次数
+DEFAULT_MAX_IP_FAILURES = 50        # 每个客户端 IP 在窗口内允许的失败次数
+DEFAULT_SLOTS = 65536
+PROBE_LIMIT = 8
+
+# 共享内存布局：头部为全局计数器，其后为定长槽位
+STATS_FIELDS = ('evaluated', 'rejected', 'failed', 'succeeded')
+HEADER = struct.Struct('<' + 'Q' * len(STATS_FIELDS))
+SLOT = struct.Struct('<QIII')       # 键哈希、窗口序号、本窗口计数、上一窗口计数
+
+
+class LoginThrottle:
+    """按用户名与客户端 IP 统计登录失败次数的滑动窗口计数器
+
+    计数保存在共享内存（mmap 文件，默认位于 /dev/shm）中，同一主机上的所有
+    worker 共用；path 为 None 时使用匿名共享映射，仅在 fork 出的子进程间共享。
+    滑动窗口用"上一窗口计数按剩余比例加权 + 本窗口计数"近似，每个键只占一个槽位。
+    被限流的请求在查询数据库和计算口令哈希之前即被拒绝。
+    """
+    def __init__(
+        self,
+        path: str = None,
+        window: int = DEFAULT_WINDOW,
+        max_user_failures: int = DEFAULT_MAX_USER_FAILURES,
+        max_ip_failures: int = DEFAULT_MAX_IP_FAILURES,
+        slots: int = DEFAULT_SLOTS
+    ):
+        self.path = path
+        self.window = window
+        self.max_user_failures = max_user_failures
+        self.max_ip_failures = max_ip_failures
+        self.slots = slots
+        size = HEADER.size + SLOT.size * slots
+        self._file = None
+        if path:
+            self._file = open(path, 'a+b')
+            if os.fstat(self._file.fileno()).st_size < size:
+                self._file.truncate(size)
+            self.buffer = mmap.mmap(self._file.fileno(), size)
+        else:
+            self.buffer = mmap.mmap(-1, size)
+        self._lock = threading.Lock()
+
+    def _locked(self):
+        return _SharedLock(self._lock, self._file)
+
+    @staticmethod
+    def _key_hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+    def _find(self, key_hash: int, window_index: int, create: bool):
+        """线性探测定位槽位；create 时复用空槽或过期槽，探测满则淘汰计数最小者"""
+        start = key_hash % self.slots
+        victim = None
+        for i in range(PROBE_LIMIT):
+            index = (start + i) % self.slots
+            slot_hash, slot_window, current, previous = SLOT.unpack_from(
+                self.buffer, HEADER.size + index * SLOT.size)
+            if slot_hash == key_hash:
+                return index, slot_window, current, previous
+            if not create:
+                continue
+            stale = slot_hash == 0 or slot_window < window_index - 1
+            weight = -1 if stale else current + previous
+            if victim is None or weight < victim[1]:
+                victim = (index, weight)
+        if victim is None:
+            return None
+        return victim[0], window_index, 0, 0
+
+    def _estimate(self, slot_window, current, previous, now) -> float:
+        window_index, offset = divmod(now, self.window)
+        if slot_window == window_index:
+            return previous * (1 - offset / self.window) + current
+        if slot_window == window_index - 1:
+            return current * (1 - offset / self.window)
+        return 0.0
+
+    def _count(self, key: str, now: float) -> float:
+        found = self._find(self._key_hash(key), int(now // self.window), create=False)
+        if found is None:
+            return 0.0
+        _, slot_window, current, previous = found
+        return self._estimate(slot_window, current, previous, now)
+
+    def _incr_stat(self, name: str, n: int = 1):
+        offset = STATS_FIELDS.index(name) * 8
+        value, = struct.unpack_from('<Q', self.buffer, offset)
+        struct.pack_into('<Q', self.buffer, offset, value + n)
+
+    def check(self, username: str, client_ip: str = None) -> int:
+        """返回需要等待的秒数，0 表示可以继续校验口令"""
+        now = time.time()
+        with self._locked():
+            self._incr_stat('evaluated')
+            if (self._count(f"u:{username}", now) >= self.max_user_failures or
+                    (client_ip and self._count(f"i:{client_ip}", now) >= self.max_ip_failures)):
+                self._incr_stat('rejected')
+                # 最坏情况下需等待上一窗口的计数完全衰减
+                return int(self.window - now % self.window) + 1
+        return 0
+
+    def record_failure(self, username: str, client_ip: str = None):
+        now = time.time()
+        window_index = int(now // self.window)
+        with self._locked():
+            self._incr_stat('failed')
+            for key in (f"u:{username}", f"i:{client_ip}" if client_ip else None):
+                if key is None:
+                    continue
+                key_hash = self._key_hash(key)
+                index, slot_window, current, previous = self._find(key_hash, window_index, create=True)
+                if slot_window == window_index - 1:
+                    previous, current = current, 0
+                elif slot_window != window_index:
+                    previous, current = 0, 0
+                SLOT.pack_into(self.buffer, HEADER.size + index * SLOT.size,
+                               key_hash, window_index, current + 1, previous)
+
+    def record_success(self, username: str):
+        """登录成功后清零该用户名的失败计数（IP 计数保留）"""
+        with self._locked():
+            self._incr_stat('succeeded')
+            key_hash = self._key_hash(f"u:{username}")
+            found = self._find(key_hash, int(time.time() // self.window), create=False)
+            if found is not None:
+                SLOT.pack_into(self.buffer, HEADER.size + found[0] * SLOT.size, 0, 0, 0, 0)
+
+    def stats(self) -> dict:
+        """累计计数（所有 worker 合计），按采样间隔做差即得每秒评估/拒绝次数"""
+        values = HEADER.unpack_from(self.buffer, 0)
+        return dict(zip(STATS_FIELDS, values), timestamp=time.time())
+
+
+class _SharedLock:
+    """线程锁 + 文件锁（映射文件时跨进程互斥）"""
+    def __init__(self, lock, file):
+        self.lock = lock
+        self.file = file
+
+    def __enter__(self):
+        self.lock.acquire()
+        if self.file:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        if self.file:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.lock.release()
+
+
+def create_login_throttle(config) -> LoginThrottle:
+    return LoginThrottle(
+        path=config.get('LOGIN_THROTTLE_PATH', '/dev/shm/bank_login_throttle'),
+        window=config.get('LOGIN_THROTTLE_WINDOW', DEFAULT_WINDOW),
+        max_user_failures=config.get('LOGIN_MAX_USER_FAILURES', DEFAULT_MAX_USER_FAILURES),
+        max_ip_failures=config.get('LOGIN_MAX_IP_FAILURES', DEFAULT_MAX_IP_FAILURES),
+        slots=config.get('LOGIN_THROTTLE_SLOTS', DEFAULT_SLOTS)
+    )
@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# 口令哈希默认参数
+DEFAULT_METHOD = 'pbkdf2:sha256:600000'
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_MAX_PENDING = 64        # 排队 + 执行中的任务上限，超过即快速拒绝
+DEFAULT_TIMEOUT = 5.0           # 秒
+DEFAULT_TARGET_MS = 250
+CALIBRATION_ITERATIONS = 100000
+
+
+class PasswordHashingBusy(RuntimeError):
+    """哈希进程池已满，调用方应返回 503 并提示稍后重试"""
+
+
+def _hash(password: str, method: str) -> str:
+    return generate_password_hash(password, method=method)
+
+
+def _verify(password_hash: str, password: str) -> bool:
+    return check_password_hash(password_hash, password)
+
+
+def hash_method(password_hash: str) -> str:
+    """哈希串自带参数，如 pbkdf2:sha256:600000$salt$hash -> pbkdf2:sha256:600000"""
+    return password_hash.split('$', 1)[0] if password_hash else ''
+
+
+class PasswordHasher:
+    """在有界进程池中计算口令哈希，避免慢 KDF 阻塞请求线程
+
+    pending 计数包含排队与执行中的任务，达到 max_pending 时立即抛出
+    PasswordHashingBusy，而不是让请求排队等待。workers 为 0 时在当前线程计算。
+    等待超时的任务会被取消；已在执行的任务无法中断，其名额在任务结束时才归还。
+    """
+    def __init__(
+        self,
+        method: str = DEFAULT_METHOD,
+        workers: int = DEFAULT_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        timeout: float = DEFAULT_TIMEOUT
+    ):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._normalized = None     # (配置的 method, 哈希串中的实际参数)
+
+    def init_app(self, app):
+        self.shutdown()
+        self.method = app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', DEFAULT_MAX_PENDING)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', DEFAULT_TIMEOUT)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # 进程池按进程创建：gunicorn fork 出的 worker 不能复用父进程的池
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise PasswordHashingBusy("Password hashing pool is saturated")
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # 名额随任务结束归还：超时后仍在进程池中执行的任务继续计入 pending
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHashingBusy("Password hashing timed out")
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password, self.method)
+
+    @staticmethod
+    @contextmanager
+    def batch_pool(workers: int):
+        """批量哈希用的临时进程池，workers 不超过 1 时为 None（在当前线程计算）
+
+        以 spawn 方式启动：调用方（如 Web worker）已有其他线程，fork 可能复制被占用的锁。
+        """
+        if workers <= 1:
+            yield None
+            return
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            yield pool
+
+    def hash_many(self, passwords: list, workers: int = None, pool: ProcessPoolExecutor = None) -> list:
+        """批量哈希（批量开户）：占满 workers 个核，不占用登录路径的并发名额
+
+        多次调用时由调用方通过 batch_pool() 创建一个进程池并传入 pool，避免每次重新启动进程。
+        """
+        workers = min(workers or os.cpu_count() or 1, len(passwords))
+        if workers <= 1:
+            return [_hash(password, self.method) for password in passwords]
+        if pool is None:
+            with self.batch_pool(workers) as pool:
+                return self.hash_many(passwords, workers, pool)
+        # 每个进程分几段领取任务，兼顾进程间通信开销与负载均衡
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(_hash, passwords, [self.method] * len(passwords), chunksize=chunksize))
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        if not password_hash:
+            return False
+        return self._run(_verify, password_hash, password)
+
+    def current_method(self) -> str:
+        """配置的 method 规范化为哈希串中的形式（如 'pbkdf2' -> 'pbkdf2:sha256:1000000'），只计算一次"""
+        normalized = self._normalized
+        if normalized is None or normalized[0] != self.method:
+            normalized = (self.method, hash_method(generate_password_hash('x', method=self.method)))
+            self._normalized = normalized
+        return normalized[1]
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """哈希参数与当前配置不一致（算法或成本变化）时需要在登录成功后重算"""
+        return hash_method(password_hash) != self.current_method()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+
+def calibrate(target_ms: float = DEFAULT_TARGET_MS, digest: str = 'sha256') -> str:
+    """按本机单次哈希耗时选取 PBKDF2 迭代次数，返回 PASSWORD_HASH_METHOD 取值"""
+    iterations = CALIBRATION_ITERATIONS
+    for _ in range(3):
+        started = time.perf_counter()
+        generate_password_hash('calibration', method=f'pbkdf2:{digest}:{iterations}')
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        iterations = max(1000, int(iterations * target_ms / elapsed_ms))
+    # 取整到千，便于配置与识别
+    return f'pbkdf2:{digest}:{round(iterations, -3)}'
+
+
+def main(argv=None):
+    """命令行入口：python -m services.password_hashing --target-ms 250"""
+    parser = argparse.ArgumentParser(description="Calibrate the password hashing cost for this host")
+    parser.add_argument('--target-ms', type=float, default=DEFAULT_TARGET_MS,
+                        help="desired time for a single hash in milliseconds")
+    parser.add_argument('--digest', default='sha256')
+    args = parser.parse_args(argv)
+
+    method = calibrate(args.target_ms, args.digest)
+    started = time.perf_counter()
+    generate_password_hash('calibration', method=method)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"PASSWORD_HASH_METHOD = '{method}'  # {elapsed_ms:.0f} ms per hash")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
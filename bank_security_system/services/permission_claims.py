@@ -0,0 +1,168 @@
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import event, update, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from flask_jwt_extended import verify_jwt_in_request, get_jwt, get_jwt_identity
+from models.role import Role
+from models.user import User
+from models.permission import Permission, PermissionVersion, ResourceType, Action
+from .permission_matrix import permission_matrix
+
+# 令牌中权限位图的布局：每种资源占 ACTION_WIDTH 位，顺序固定（只可在末尾追加）
+ACTION_WIDTH = 8
+RESOURCE_SHIFT = {resource_type: i * ACTION_WIDTH for i, resource_type in enumerate(ResourceType)}
+ACTION_MASK = (1 << ACTION_WIDTH) - 1
+DEFAULT_VERSION_REFRESH = 2.0   # 秒；进程内全局版本号的刷新间隔
+FALLBACK_CACHE_SIZE = 10000
+
+
+def encode_masks(masks: dict) -> int:
+    """{ResourceType: 位掩码} -> 单个整数位图"""
+    bitmap = 0
+    for resource_type, mask in masks.items():
+        bitmap |= (mask & ACTION_MASK) << RESOURCE_SHIFT[resource_type]
+    return bitmap
+
+
+def mask_from_bitmap(bitmap: int, resource_type: ResourceType) -> int:
+    return (bitmap >> RESOURCE_SHIFT[resource_type]) & ACTION_MASK
+
+
+class GlobalPermissionVersion:
+    """进程内缓存的全局权限版本号，最多每 refresh_interval 秒查询一次数据库
+
+    提交权限变更的进程随即失效本地缓存；其他进程最多延迟 refresh_interval 秒
+    才看到新版本，在此期间仍按旧令牌中的权限放行。
+    """
+    def __init__(self, refresh_interval: float = DEFAULT_VERSION_REFRESH):
+        self.refresh_interval = refresh_interval
+        self._version = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self, force: bool = False) -> int:
+        if force or self._version is None or time.monotonic() - self._fetched_at > self.refresh_interval:
+            version = PermissionVersion.query.with_entities(
+                PermissionVersion.version
+            ).filter_by(id=1).scalar() or 0
+            with self._lock:
+                self._version = version
+                self._fetched_at = time.monotonic()
+        return self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = 0.0
+
+
+permission_version = GlobalPermissionVersion()
+
+
+def build_claims(user) -> dict:
+    """签发令牌时计算角色、有效权限位图与权限版本号"""
+    # 先取版本号再编译：令牌中的版本号不会比其权限数据更新
+    version = permission_version.current(force=True)
+    table = permission_matrix.table(min_version=version)
+    masks = {}
+    for role in user.roles:
+        for resource_type, mask in table.get(role.id, {}).items():
+            masks[resource_type] = masks.get(resource_type, 0) | mask
+    return {
+        "roles": [role.name for role in user.roles],
+        "perm": encode_masks(masks),
+        "pv": version,
+    }
+
+
+class _FallbackCache:
+    """令牌版本过期时按 (用户, 全局版本) 缓存从数据库重算的声明"""
+    def __init__(self, size: int = FALLBACK_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version: int):
+        key = (user_id, version)
+        with self._lock:
+            claims = self.entries.get(key)
+            if claims is not None:
+                self.entries.move_to_end(key)
+                return claims
+        user = User.query.get(user_id)
+        claims = build_claims(user) if user else {"roles": [], "perm": 0, "pv": version}
+        with self._lock:
+            self.entries[key] = claims
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return claims
+
+
+_fallback = _FallbackCache()
+
+
+def current_claims() -> dict:
+    """当前请求的授权声明：令牌版本不落后于全局版本时直接使用令牌，否则回源数据库"""
+    verify_jwt_in_request()
+    claims = get_jwt()
+    version = permission_version.current()
+    if claims.get("pv") is not None and claims["pv"] >= version:
+        return claims
+    return _fallback.get(get_jwt_identity(), version)
+
+
+def token_allows(resource_type, action) -> bool:
+    """仅凭令牌（必要时回源）判断当前用户是否拥有某资源上的操作；未知的资源或操作一律拒绝"""
+    try:
+        resource_type = ResourceType(resource_type)
+        action = Action(action)
+    except ValueError:
+        return False
+    return bool(mask_from_bitmap(current_claims().get("perm", 0), resource_type) & action.bit)
+
+
+def token_has_role(role_names) -> bool:
+    if isinstance(role_names, str):
+        role_names = [role_names]
+    return any(name in role_names for name in current_claims().get("roles", ()))
+
+
+def _roles_changed(session) -> bool:
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+    if any(isinstance(obj, (Role, Permission)) for obj in changed):
+        return True
+    return any(
+        isinstance(obj, User) and get_history(obj, "roles").has_changes()
+        for obj in session.dirty
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_version(session, flush_context):
+    """与业务变更同一事务递增全局版本号，使已签发令牌中的权限失效
+
+    失效并非即时：其他进程在版本号缓存刷新（DEFAULT_VERSION_REFRESH 秒）前仍信任旧令牌。
+    """
+    if not _roles_changed(session):
+        return
+    connection = session.connection()
+    result = connection.execute(
+        update(PermissionVersion)
+        .where(PermissionVersion.id == 1)
+        .values(version=PermissionVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(PermissionVersion).values(id=1, version=1))
+    session.info["permission_version_bumped"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.info.pop("permission_version_bumped", False):
+        permission_version.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("permission_version_bumped", None)
@@ -0,0 +1,130 @@
+import time
+import threading
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from models.role import Role
+from models.permission import Permission, ResourceType, Action
+
+DEFAULT_MAX_AGE = 30  # 秒；兜底其他进程修改角色后本进程缓存的最长陈旧时间
+
+
+class RoleHierarchyCycleError(ValueError):
+    """角色继承关系中出现环"""
+
+
+class PermissionMatrix:
+    """编译后的有效权限表：{role_id: {ResourceType: allowed_actions 位掩码}}
+
+    每个角色的继承权限在编译时展开，授权检查变为一次字典查询加一次按位与。
+    Role/Permission 提交变更后本进程缓存立即失效，下次访问时重新编译。
+    """
+    def __init__(self, max_age: float = DEFAULT_MAX_AGE):
+        self.max_age = max_age
+        self.version = 0
+        self._table = None
+        self._compiled_at = 0.0
+        self._source_version = -1  # 编译时已知的全局权限版本号
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._table = None
+            self.version += 1
+
+    def _stale(self, min_version) -> bool:
+        return (
+            self._table is None
+            or time.monotonic() - self._compiled_at > self.max_age
+            or (min_version is not None and self._source_version < min_version)
+        )
+
+    def table(self, min_version: int = None) -> dict:
+        """返回权限表；min_version 为全局权限版本号，编译版本落后时重新编译"""
+        table = self._table
+        if self._stale(min_version):
+            with self._lock:
+                if self._stale(min_version):
+                    self._table = self.compile()
+                    self._compiled_at = time.monotonic()
+                    self._source_version = min_version if min_version is not None else -1
+                table = self._table
+        return table
+
+    @staticmethod
+    def compile() -> dict:
+        """两次查询载入全部角色与权限，按继承关系展开为位掩码表"""
+        parents = {role_id: parent_id for role_id, parent_id in
+                   Role.query.with_entities(Role.id, Role.parent_id)}
+        own = {}
+        for role_id, resource_type, actions in Permission.query.with_entities(
+            Permission.role_id, Permission.resource_type, Permission.allowed_actions
+        ):
+            masks = own.setdefault(role_id, {})
+            masks[resource_type] = masks.get(resource_type, 0) | (actions or 0)
+
+        table = {}
+
+        def effective(role_id, visiting):
+            if role_id in table:
+                return table[role_id]
+            if role_id in visiting:
+                raise RoleHierarchyCycleError(f"Role hierarchy cycle at role {role_id}")
+            visiting.add(role_id)
+            masks = dict(own.get(role_id, {}))
+            parent_id = parents.get(role_id)
+            if parent_id is not None:
+                for resource_type, mask in effective(parent_id, visiting).items():
+                    masks[resource_type] = masks.get(resource_type, 0) | mask
+            visiting.discard(role_id)
+            table[role_id] = masks
+            return masks
+
+        for role_id in parents:
+            effective(role_id, set())
+        return table
+
+    def role_mask(self, role_id: int, resource_type: ResourceType) -> int:
+        return self.table().get(role_id, {}).get(resource_type, 0)
+
+    def allows(self, role_ids, resource_type: ResourceType, action: Action) -> bool:
+        """任一角色（含继承）拥有该操作即允许"""
+        table = self.table()
+        bit = action.bit
+        return any(table.get(role_id, {}).get(resource_type, 0) & bit for role_id in role_ids)
+
+
+permission_matrix = PermissionMatrix()
+
+
+def check_role_cycles(connection):
+    """写入时拒绝会形成环的继承关系（flush 之后、提交之前按数据库中的 parent_id 检查）"""
+    parents = dict(connection.execute(select(Role.id, Role.parent_id)).all())
+    for start in parents:
+        seen = set()
+        role_id = start
+        while role_id is not None:
+            if role_id in seen:
+                raise RoleHierarchyCycleError(f"Role hierarchy cycle involving role {role_id}")
+            seen.add(role_id)
+            role_id = parents.get(role_id)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+    if any(isinstance(obj, Role) for obj in changed):
+        # 使用底层连接查询，避免在 flush 事件中触发 autoflush
+        check_role_cycles(session.connection())
+    if any(isinstance(obj, (Role, Permission)) for obj in changed):
+        session.info["permissions_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.info.pop("permissions_changed", False):
+        permission_matrix.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("permissions_changed", None)
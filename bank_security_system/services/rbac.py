@@ -23,6 +23,19 @@ from functools import wraps
 from flask import g, abort
 from models.role import Role
 from models.permission import Permission
+from .permission_claims import token_has_role
+
+
+def role_required(role_names):
+    """角色装饰器（基于令牌声明，不查询数据库）；role_names 可为单个角色或角色列表"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not token_has_role(role_names):
+                abort(403)  # Forbidden
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
 
 class RBACService:
     def __init__(self):
@@ -48,16 +61,6 @@ class RBACService:
 
     def role_required(self, role_name):
         """角色装饰器"""
-        def decorator(f):
-            @wraps(f)
-            def decorated_function(*args, **kwargs):
-                if not hasattr(g, 'user'):
-                    abort(401)  # Unauthorized
-                user = g.user
-                if not any(r.name == role_name for r in user.roles):
-                    abort(403)  # Forbidden
-                return f(*args, **kwargs)
-            return decorated_function
-        return decorator
+        return role_required(role_name)
         
 
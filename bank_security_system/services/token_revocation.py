@@ -0,0 +1,238 @@
+import os
+import math
+import time
+import fcntl
+import logging
+import hashlib
+import threading
+from datetime import datetime
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+from models.base_model import db
+from models.revoked_token import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+# 撤销列表默认参数
+DEFAULT_REFRESH_INTERVAL = 5.0     # 秒；增量拉取其他进程新撤销的令牌
+DEFAULT_REBUILD_INTERVAL = 300.0   # 秒；全量重建过滤器并清理过期记录
+DEFAULT_CAPACITY = 100000
+DEFAULT_ERROR_RATE = 0.001
+REFRESH_OVERLAP = 30.0             # 秒；增量拉取时向前多取一段，容忍时钟偏差与提交延迟
+
+
+class BloomFilter:
+    """固定容量的布隆过滤器：不在过滤器中即一定未撤销"""
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = DEFAULT_ERROR_RATE):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class SQLRevocationStore:
+    """基于数据库表的撤销列表，多主机共享
+
+    写入在主库的独立会话中提交，不会顺带提交或回滚当前请求会话中的其他变更。
+    """
+    @staticmethod
+    def _writer() -> Session:
+        return Session(db.engine)
+
+    def add(self, jti: str, expires_at: float):
+        with self._writer() as session, session.begin():
+            session.merge(RevokedToken(
+                jti=jti,
+                expires_at=datetime.utcfromtimestamp(expires_at),
+                revoked_at=datetime.utcnow()
+            ))
+
+    def contains(self, jti: str) -> bool:
+        return RevokedToken.query.with_entities(RevokedToken.jti).filter(
+            RevokedToken.jti == jti,
+            RevokedToken.expires_at > datetime.utcnow()
+        ).first() is not None
+
+    def active_since(self, since: float = None) -> list:
+        """未过期、且撤销时间不早于 since（epoch 秒）的 jti 列表"""
+        query = RevokedToken.query.with_entities(RevokedToken.jti).filter(
+            RevokedToken.expires_at > datetime.utcnow()
+        )
+        if since is not None:
+            query = query.filter(RevokedToken.revoked_at >= datetime.utcfromtimestamp(since))
+        return [jti for jti, in query]
+
+    def purge_expired(self) -> int:
+        with self._writer() as session, session.begin():
+            return session.execute(
+                delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow())
+            ).rowcount
+
+
+class FileRevocationStore:
+    """基于本地文件的撤销列表，同一主机上的多个 worker 共享
+
+    每行一条记录：jti、到期时间、撤销时间（epoch 秒），以追加方式写入，
+    读写通过独立的锁文件互斥，清理过期记录时整体替换文件。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _locked(self, mode):
+        lock = open(self.lock_path, "a")
+        fcntl.flock(lock, mode)
+        return lock
+
+    def _entries(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3:
+                    yield parts[0], float(parts[1]), float(parts[2])
+
+    def add(self, jti: str, expires_at: float):
+        with self._locked(fcntl.LOCK_EX):
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(f"{jti} {expires_at:.0f} {time.time():.3f}\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def contains(self, jti: str) -> bool:
+        now = time.time()
+        with self._locked(fcntl.LOCK_SH):
+            return any(entry_jti == jti and expires_at > now
+                       for entry_jti, expires_at, _ in self._entries())
+
+    def active_since(self, since: float = None) -> list:
+        now = time.time()
+        with self._locked(fcntl.LOCK_SH):
+            return [jti for jti, expires_at, revoked_at in self._entries()
+                    if expires_at > now and (since is None or revoked_at >= since)]
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._locked(fcntl.LOCK_EX):
+            entries = list(self._entries())
+            alive = [e for e in entries if e[1] > now]
+            if len(alive) == len(entries):
+                return 0
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for jti, expires_at, revoked_at in alive:
+                    f.write(f"{jti} {expires_at:.0f} {revoked_at:.3f}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return len(entries) - len(alive)
+
+
+class TokenRevocationList:
+    """进程内布隆过滤器 + 共享存储
+
+    绝大多数令牌未被撤销，检查时只查内存中的过滤器；仅在过滤器命中
+    （已撤销或误判）时才查询存储确认。过滤器每 refresh_interval 秒增量
+    拉取其他进程的新撤销记录，每 rebuild_interval 秒全量重建以剔除过期令牌。
+    """
+    def __init__(
+        self,
+        store,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+        rebuild_interval: float = DEFAULT_REBUILD_INTERVAL,
+        capacity: int = DEFAULT_CAPACITY,
+        error_rate: float = DEFAULT_ERROR_RATE
+    ):
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bloom = None
+        self._refreshed_at = 0.0
+        self._rebuilt_at = 0.0
+        self._watermark = None
+        self._lock = threading.Lock()
+
+    def revoke(self, jti: str, expires_at: float):
+        self.store.add(jti, expires_at)
+        bloom = self.bloom
+        if bloom is not None:
+            bloom.add(jti)
+
+    def is_revoked(self, jti: str) -> bool:
+        self._maybe_refresh()
+        if self.bloom is not None and jti not in self.bloom:
+            return False
+        return self.store.contains(jti)
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if self.bloom is not None and now - self._refreshed_at < self.refresh_interval:
+            return
+        # 只由一个线程刷新，其余线程继续使用当前过滤器
+        blocking = self.bloom is None
+        if not self._lock.acquire(blocking=blocking):
+            return
+        try:
+            if self.bloom is None or now - self._rebuilt_at >= self.rebuild_interval:
+                self._rebuild()
+            elif now - self._refreshed_at >= self.refresh_interval:
+                self._refresh()
+        except Exception:
+            # 存储不可用时保留旧过滤器；首次构建失败时 bloom 仍为 None，检查直接落到存储
+            logger.exception("Failed to refresh token revocation filter")
+            self._refreshed_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def _rebuild(self):
+        started = time.time()
+        self.store.purge_expired()
+        jtis = self.store.active_since()
+        bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        self.bloom = bloom
+        self._watermark = started
+        self._rebuilt_at = self._refreshed_at = time.monotonic()
+
+    def _refresh(self):
+        started = time.time()
+        for jti in self.store.active_since(self._watermark - REFRESH_OVERLAP):
+            self.bloom.add(jti)
+        self._watermark = started
+        self._refreshed_at = time.monotonic()
+
+
+def create_revocation_list(config) -> TokenRevocationList:
+    """按配置 TOKEN_REVOCATION_BACKEND（sql | file）创建撤销列表"""
+    backend = config.get('TOKEN_REVOCATION_BACKEND', 'sql')
+    if backend == 'sql':
+        store = SQLRevocationStore()
+    elif backend == 'file':
+        store = FileRevocationStore(
+            config.get('TOKEN_REVOCATION_FILE', '/var/lib/bank_security/revoked_tokens')
+        )
+    else:
+        raise ValueError(f"Unknown token revocation backend: {backend}")
+    return TokenRevocationList(
+        store,
+        refresh_interval=config.get('TOKEN_REVOCATION_REFRESH', DEFAULT_REFRESH_INTERVAL),
+        rebuild_interval=config.get('TOKEN_REVOCATION_REBUILD', DEFAULT_REBUILD_INTERVAL),
+        capacity=config.get('TOKEN_REVOCATION_CAPACITY', DEFAULT_CAPACITY)
+    )
@@ -0,0 +1,150 @@
+import base64
+from datetime import datetime, timedelta
+from sqlalchemy import select, union_all, and_, or_
+from models.transaction import Transaction
+
+# 分页默认值与上限
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500   # 每批从数据库取出并解密的行数
+
+_EPOCH = datetime(1970, 1, 1)
+_COLUMNS = (
+    Transaction.id,
+    Transaction.from_account_id,
+    Transaction.to_account_id,
+    Transaction.amount,
+    Transaction.status,
+    Transaction.created_at,
+)
+
+
+def _parse_time(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value}")
+
+
+def encode_cursor(created_at: datetime, tx_id: int) -> str:
+    """游标 = 最后一条记录的 (created_at, id)，对客户端不透明"""
+    us = (created_at - _EPOCH) // timedelta(microseconds=1)
+    return base64.urlsafe_b64encode(f"{us}:{tx_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        us, tx_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        return _EPOCH + timedelta(microseconds=int(us)), int(tx_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+class TransactionHistoryQuery:
+    """账户交易历史查询（按 (created_at, id) 降序键集分页）
+
+    转出、转入两个方向分别走 (from_account_id, created_at) 与
+    (to_account_id, created_at) 索引，各取 limit + 1 行后 UNION ALL 归并，
+    避免 OR 条件导致全表扫描。
+    """
+    def __init__(
+        self,
+        account_id: int,
+        start: datetime = None,
+        end: datetime = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: str = None
+    ):
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        self.account_id = account_id
+        self.start = start
+        self.end = end
+        self.limit = limit
+        self.cursor = decode_cursor(cursor) if cursor else None
+        self.next_cursor = None
+
+    @classmethod
+    def from_args(cls, account_id: int, args) -> "TransactionHistoryQuery":
+        """从请求参数构造，非法参数抛出 ValueError"""
+        unknown = set(args) - {"start", "end", "limit", "cursor"}
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        try:
+            limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        return cls(
+            account_id,
+            start=_parse_time(args["start"]) if args.get("start") else None,
+            end=_parse_time(args["end"]) if args.get("end") else None,
+            limit=limit,
+            cursor=args.get("cursor"),
+        )
+
+    def _branch(self, column, exclude_self: bool):
+        conditions = [column == self.account_id]
+        if exclude_self:
+            # 自己转给自己的记录只在转出方向出现一次
+            conditions.append(Transaction.from_account_id != self.account_id)
+        if self.start:
+            conditions.append(Transaction.created_at >= self.start)
+        if self.end:
+            conditions.append(Transaction.created_at < self.end)
+        if self.cursor:
+            created_at, tx_id = self.cursor
+            conditions.append(or_(
+                Transaction.created_at < created_at,
+                and_(Transaction.created_at == created_at, Transaction.id < tx_id),
+            ))
+        branch = (
+            select(*_COLUMNS)
+            .where(*conditions)
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+            .limit(self.limit + 1)
+            .subquery()
+        )
+        return select(branch)
+
+    def statement(self):
+        merged = union_all(
+            self._branch(Transaction.from_account_id, exclude_self=False),
+            self._branch(Transaction.to_account_id, exclude_self=True),
+        ).subquery()
+        return (
+            select(merged)
+            .order_by(merged.c.created_at.desc(), merged.c.id.desc())
+            .limit(self.limit + 1)
+        )
+
+    def iter_batches(self, session, batch_size: int = STREAM_BATCH_SIZE):
+        """流式取出本页记录（服务端游标），逐批产出；结束后 next_cursor 可用"""
+        result = session.execute(self.statement().execution_options(stream_results=True))
+        emitted = 0
+        last = None
+        try:
+            for rows in result.partitions(batch_size):
+                remaining = self.limit - emitted
+                # 多取的第 limit + 1 行说明还有下一页
+                more = len(rows) > remaining
+                rows = rows[:remaining]
+                if rows:
+                    emitted += len(rows)
+                    last = rows[-1]
+                    yield rows
+                if more:
+                    self.next_cursor = encode_cursor(last.created_at, last.id)
+                    break
+        finally:
+            result.close()
+
+
+def serialize(row, amount: bytes) -> dict:
+    return {
+        "id": row.id,
+        "from_account_id": row.from_account_id,
+        "to_account_id": row.to_account_id,
+        "amount": amount.decode(),
+        "status": row.status,
+        "created_at": row.created_at.isoformat(),
+    }
@@ -0,0 +1,203 @@
+import time
+import random
+import logging
+from decimal import Decimal, InvalidOperation
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from models.account import Account
+from models.transaction import Transaction
+from .ledger import account_balance, post_transfer
+
+logger = logging.getLogger(__name__)
+
+# 重试默认参数
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 0.01   # 秒；指数退避的起点
+DEFAULT_MAX_DELAY = 0.5     # 秒；单次等待上限
+
+# 可重试的数据库错误：MySQL 死锁 / 锁等待超时，PostgreSQL 序列化失败 / 死锁
+RETRYABLE_MYSQL_CODES = (1205, 1213)
+RETRYABLE_SQLSTATES = ('40001', '40P01')
+
+AMOUNT_QUANTUM = Decimal('0.01')
+
+
+class TransferError(ValueError):
+    """转账被拒绝（参数错误、账户不存在、余额不足等），不会重试"""
+    status_code = 400
+
+
+class AccountNotFound(TransferError):
+    status_code = 404
+
+
+class InsufficientFunds(TransferError):
+    pass
+
+
+class IdempotencyConflict(TransferError):
+    """同一幂等键已用于参数不同的转账"""
+    status_code = 409
+
+
+def is_retryable(error: DBAPIError) -> bool:
+    orig = getattr(error, 'orig', None)
+    args = getattr(orig, 'args', ())
+    if args and args[0] in RETRYABLE_MYSQL_CODES:
+        return True
+    if getattr(orig, 'pgcode', None) in RETRYABLE_SQLSTATES:
+        return True
+    # SQLite 写锁冲突（本地基准测试）
+    return 'database is locked' in str(orig)
+
+
+def begin(session):
+    """结束调用方已开始的事务（如请求前期的权限查询），使转账事务以加锁读开始
+
+    转账引擎自行提交或回滚会话，调用方未提交的修改在此一并提交。
+    """
+    if session.in_transaction():
+        session.commit()
+
+
+def parse_account_id(value) -> int:
+    """账户 ID 规范化为正整数（JSON 中的 "1" 与 1 视为同一账户）"""
+    try:
+        account_id = int(str(value).strip())
+    except ValueError:
+        raise TransferError("Invalid account id")
+    if account_id <= 0:
+        raise TransferError("Invalid account id")
+    return account_id
+
+
+def parse_amount(value) -> Decimal:
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise TransferError("Invalid amount")
+    if not amount.is_finite() or amount <= 0 or amount != amount.quantize(AMOUNT_QUANTUM):
+        raise TransferError("Amount must be positive with at most two decimal places")
+    return amount
+
+
+class TransferEngine:
+    """并发安全的转账引擎（复式记账）
+
+    只对借方账户行 SELECT ... FOR UPDATE 加锁，在持锁期间由分录计算余额并检查，
+    同一账户的扣款串行执行、不会透支；贷方账户不加锁、不更新任何行，只追加分录，
+    因此热点收款账户只承受插入。外键检查会对贷方账户加共享锁，交叉转账偶尔死锁时
+    回滚并按带抖动的指数退避重试（死锁、锁等待超时与序列化失败同样处理）。
+    客户端可提供幂等键：相同键的重复请求返回首次创建的交易，不会重复扣款。
+
+    每次尝试都在新事务中先锁定借方行，之后才做幂等键查询与余额计算：MySQL
+    REPEATABLE READ 的一致性快照在事务的第一次普通读时建立，若先普通读再加锁，
+    余额会读到加锁前的旧快照，看不到刚提交的扣款。
+    """
+    def __init__(
+        self,
+        encryption_service=None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY
+    ):
+        self.encryption_service = encryption_service
+        self.account_cache = None   # 账户视图缓存，提交后使相关账户失效
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    def init_app(self, app):
+        self.max_retries = app.config.get('TRANSFER_MAX_RETRIES', DEFAULT_MAX_RETRIES)
+        self.base_delay = app.config.get('TRANSFER_RETRY_BASE_DELAY', DEFAULT_BASE_DELAY)
+        self.max_delay = app.config.get('TRANSFER_RETRY_MAX_DELAY', DEFAULT_MAX_DELAY)
+
+    @property
+    def session(self):
+        return Transaction.query.session
+
+    def transfer(self, from_account_id: int, to_account_id: int, amount, idempotency_key: str = None) -> tuple:
+        """执行转账，返回 (交易, 是否新建)；业务错误抛出 TransferError 子类"""
+        from_account_id = parse_account_id(from_account_id)
+        to_account_id = parse_account_id(to_account_id)
+        amount = parse_amount(amount)
+        if from_account_id == to_account_id:
+            raise TransferError("Cannot transfer to the same account")
+        request = (from_account_id, to_account_id, amount)
+        begin(self.session)
+
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(request, idempotency_key)
+            except IntegrityError:
+                self.session.rollback()
+                # 并发的相同幂等键请求已先提交
+                existing = self._existing(idempotency_key, request) if idempotency_key else None
+                if existing is None:
+                    raise
+                return existing, False
+            except DBAPIError as e:
+                self.session.rollback()
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.debug("Retrying transfer after %s (attempt %d)", e.orig, attempt)
+                self.backoff(attempt)
+            except Exception:
+                self.session.rollback()
+                raise
+
+    def backoff(self, attempt: int):
+        """重试前等待；full jitter：等待时间在 [0, min(上限, base * 2^attempt)] 内均匀分布"""
+        self.retries += 1
+        time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def _attempt(self, request: tuple, idempotency_key: str) -> tuple:
+        from_account_id, to_account_id, amount = request
+        session = self.session
+        source = session.get(Account, from_account_id, with_for_update=True, populate_existing=True)
+        if idempotency_key:
+            existing = self._existing(idempotency_key, request)
+            if existing is not None:
+                session.rollback()
+                return existing, False
+        if source is None:
+            raise AccountNotFound(f"Account {from_account_id} not found")
+        target = session.get(Account, to_account_id)
+        if target is None:
+            raise AccountNotFound(f"Account {to_account_id} not found")
+        if source.currency != target.currency:
+            raise TransferError("Currency mismatch")
+        if account_balance(self.encryption_service, from_account_id) < amount:
+            raise InsufficientFunds("Insufficient funds")
+
+        transaction = Transaction(
+            from_account_id=from_account_id,
+            to_account_id=to_account_id,
+            amount=self._encrypt_amount(amount),
+            status='completed',
+            idempotency_key=idempotency_key
+        )
+        session.add(transaction)
+        session.flush()
+        post_transfer(session, self.encryption_service, transaction, amount)
+        session.commit()
+        self.invalidate_accounts((from_account_id, to_account_id))
+        return transaction, True
+
+    def invalidate_accounts(self, account_ids):
+        if self.account_cache is not None:
+            self.account_cache.invalidate(account_ids)
+
+    def _encrypt_amount(self, amount: Decimal) -> bytes:
+        return self.encryption_service.encrypt_many([str(amount).encode()])[0]
+
+    def _existing(self, idempotency_key: str, request: tuple):
+        transaction = Transaction.query.filter_by(idempotency_key=idempotency_key).first()
+        if transaction is None:
+            return None
+        stored_amount = Decimal(self.encryption_service.decrypt_many([transaction.amount])[0].decode())
+        if (transaction.from_account_id, transaction.to_account_id, stored_amount) != request:
+            raise IdempotencyConflict("Idempotency key already used for a different transfer")
+        return transaction
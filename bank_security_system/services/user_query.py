@@ -0,0 +1,129 @@
+import base64
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only, selectinload
+from models.user import User, roles_users
+from models.role import Role
+
+# 分页默认值与上限
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _parse_time(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value}")
+
+
+def encode_cursor(created_at: datetime, user_id: int) -> str:
+    """游标 = 最后一条记录的 (created_at, id)，对客户端不透明"""
+    us = (created_at - _EPOCH) // timedelta(microseconds=1)
+    return base64.urlsafe_b64encode(f"{us}:{user_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        us, user_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        return _EPOCH + timedelta(microseconds=int(us)), int(user_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+class UserListQuery:
+    """管理端用户列表（按 (created_at, id) 降序键集分页）
+
+    只加载 id、username、created_at，不取 password_hash；角色通过 selectinload
+    一次 IN 查询批量加载，避免逐个用户懒加载 roles 的 N+1。
+    """
+    def __init__(
+        self,
+        role: str = None,
+        start: datetime = None,
+        end: datetime = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: str = None
+    ):
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        self.role = role
+        self.start = start
+        self.end = end
+        self.limit = limit
+        self.cursor = decode_cursor(cursor) if cursor else None
+        self.next_cursor = None
+
+    @classmethod
+    def from_args(cls, args) -> "UserListQuery":
+        """从请求参数构造，非法参数抛出 ValueError"""
+        unknown = set(args) - {"role", "start", "end", "limit", "cursor"}
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        try:
+            limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        return cls(
+            role=args.get("role") or None,
+            start=_parse_time(args["start"]) if args.get("start") else None,
+            end=_parse_time(args["end"]) if args.get("end") else None,
+            limit=limit,
+            cursor=args.get("cursor"),
+        )
+
+    def query(self):
+        query = User.query.options(
+            load_only(User.id, User.username, User.created_at),
+            selectinload(User.roles).load_only(Role.id, Role.name),
+        )
+        if self.role:
+            # EXISTS 子查询走 (role_id, user_id) 索引，且不会因多角色产生重复行
+            query = query.filter(
+                roles_users.select()
+                .join(Role, Role.id == roles_users.c.role_id)
+                .where(roles_users.c.user_id == User.id, Role.name == self.role)
+                .exists()
+            )
+        if self.start:
+            query = query.filter(User.created_at >= self.start)
+        if self.end:
+            query = query.filter(User.created_at < self.end)
+        if self.cursor:
+            created_at, user_id = self.cursor
+            query = query.filter(or_(
+                User.created_at < created_at,
+                and_(User.created_at == created_at, User.id < user_id),
+            ))
+        return query.order_by(User.created_at.desc(), User.id.desc())
+
+    def page(self) -> list:
+        """取一页用户；多取一行判断是否有下一页，设置 next_cursor"""
+        users = self.query().limit(self.limit + 1).all()
+        self.next_cursor = None
+        if len(users) > self.limit:
+            users = users[:self.limit]
+            self.next_cursor = encode_cursor(users[-1].created_at, users[-1].id)
+        return users
+
+    def iter_all(self, batch_size: int = EXPORT_BATCH_SIZE):
+        """按游标逐页取出全部匹配用户（导出用），每页一次主查询加一次角色查询"""
+        self.limit = batch_size
+        while True:
+            users = self.page()
+            yield from users
+            if self.next_cursor is None:
+                break
+            self.cursor = decode_cursor(self.next_cursor)
+
+
+def serialize(user) -> dict:
+    return {
+        "id": user.id,
+        "username": user.username,
+        "roles": sorted(role.name for role in user.roles),
+        "created_at": user.created_at.isoformat(),
+    }
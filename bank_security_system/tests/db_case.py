@@ -0,0 +1,30 @@
+import unittest
+from flask import Flask
+from models.transaction import db
+
+class DatabaseTestCase(unittest.TestCase):
+    """内存 SQLite 上的 Flask 应用，setUp 推入应用上下文并建表；子类先调用 super().setUp() 再准备数据"""
+    CONFIG = {}
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', **self.CONFIG)
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+class BatchTestCase(DatabaseTestCase):
+    """批量接口（BulkUserImporter / BulkTransferProcessor）的测试基类，子类在 setUp 中设置 self.processor"""
+    processor = None
+
+    def run_batch(self, text, fmt):
+        rows, results = self.processor.prepare(text, fmt)
+        for chunk in self.processor.process(rows):
+            results.extend(chunk)
+        return {r['row']: r for r in results}
@@ -0,0 +1,76 @@
+import io
+import hashlib
+from types import SimpleNamespace
+from datetime import datetime
+
+
+class _ClientError(Exception):
+    pass
+
+
+class LocalS3:
+    """内存中的 S3 替身（仅实现备份相关接口）"""
+    exceptions = SimpleNamespace(ClientError=_ClientError)
+
+    def __init__(self):
+        self.objects = {}
+        self.modified = {}
+        self.uploads = {}
+
+    def _store(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+        self.modified[(Bucket, Key)] = datetime.utcnow()
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = str(len(self.uploads) + 1)
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': hashlib.md5(Body).hexdigest()}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        numbers = [p['PartNumber'] for p in MultipartUpload['Parts']]
+        assert numbers == sorted(parts), numbers
+        self._store(Bucket, Key, b''.join(parts[n] for n in numbers))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._store(Bucket, Key, Body)
+
+    def copy_object(self, Bucket, Key, CopySource, MetadataDirective='COPY', **kwargs):
+        source = (CopySource['Bucket'], CopySource['Key'])
+        if source == (Bucket, Key) and MetadataDirective != 'REPLACE':
+            raise _ClientError(f"400 InvalidRequest: in-place copy of {Key}")
+        self._store(Bucket, Key, self.objects[source])
+
+    def get_object(self, Bucket, Key, Range=None):
+        body = self.objects[(Bucket, Key)]
+        if Range:
+            start, end = Range[len('bytes='):].split('-')
+            body = body[int(start):int(end) + 1]
+        return {'Body': io.BytesIO(body)}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise _ClientError(f"404 {Key}")
+        return {'LastModified': self.modified[(Bucket, Key)], 'ContentLength': len(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+        self.modified.pop((Bucket, Key), None)
+
+    def get_paginator(self, name):
+        assert name == 'list_objects_v2'
+        return self
+
+    def paginate(self, Bucket, Prefix=''):
+        yield {'Contents': [
+            {'Key': key, 'LastModified': self.modified[(bucket, key)], 'Size': len(body)}
+            for (bucket, key), body in sorted(self.objects.items())
+            if bucket == Bucket and key.startswith(Prefix)
+        ]}
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from services.account_cache import AccountVersions, AccountViewCache
+
+class AccountViewCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'versions')
+        self.loads = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def loader(self, account_id):
+        self.loads.append(account_id)
+        return {'id': account_id, 'balance': str(len(self.loads))} if account_id < 100 else None
+
+    def test_hits_until_invalidated(self):
+        cache = AccountViewCache(AccountVersions(slots=64))
+        self.assertEqual(cache.get(1, self.loader), cache.get(1, self.loader))
+        self.assertIsNone(cache.get(100, self.loader))
+        self.assertIsNone(cache.get(100, self.loader))
+        cache.invalidate([1])
+        self.assertEqual(cache.get(1, self.loader)['balance'], '4')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['loads_saved']), (1, 4, 1))
+        self.assertEqual(stats['hit_ratio'], 0.2)
+
+    def test_invalidation_across_workers(self):
+        # 两个缓存共享同一版本文件，模拟同一主机上的两个 worker
+        worker_a = AccountViewCache(AccountVersions(self.path, slots=64))
+        worker_b = AccountViewCache(AccountVersions(self.path, slots=64))
+        worker_a.get(7, self.loader)
+        worker_b.invalidate([7])
+        worker_a.get(7, self.loader)
+        self.assertEqual(self.loads, [7, 7])
+        self.assertEqual(worker_a.stats()['stale'], 1)
+
+    def test_ttl_and_size_bound(self):
+        cache = AccountViewCache(AccountVersions(slots=64), ttl=5, max_entries=2)
+        with mock.patch('services.account_cache.time.monotonic', return_value=0):
+            for account_id in (1, 2, 3):
+                cache.get(account_id, self.loader)
+            cache.get(1, self.loader)   # 已被 LRU 淘汰
+        with mock.patch('services.account_cache.time.monotonic', return_value=10):
+            cache.get(3, self.loader)   # 已过期
+        self.assertEqual(self.loads, [1, 2, 3, 1, 3])
+        self.assertEqual(cache.stats()['entries'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import os
+import heapq
+import tempfile
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+from flask import Flask
+from bson import ObjectId
+from services.audit import audit_service
+from services.audit_archive import AuditArchiver, ArchiveIntegrityError, SEGMENT_SUFFIX
+from services.audit_query import AuditQuery
+from services import audit_store
+from services.audit_store import TieredAuditStore
+
+class MemoryAuditStore:
+    """热存储替身：行为与 MongoAuditStore 相同的内存实现"""
+    def __init__(self):
+        self.records = []
+        self.checkpoint_records = []
+
+    def create_indexes(self):
+        pass
+
+    def insert(self, record):
+        self.records.append(record)
+
+    def insert_checkpoint(self, checkpoint):
+        self.checkpoint_records.append(checkpoint)
+
+    def get(self, log_id):
+        return next((r for r in self.records if r["_id"] == ObjectId(log_id)), None)
+
+    def find(self, query):
+        return [r for r in self.records if all(r.get(k) == v for k, v in query.items())]
+
+    def delete(self, ids):
+        ids = set(ids)
+        self.records = [r for r in self.records if r["_id"] not in ids]
+
+    def scan(self, start, end):
+        return iter(sorted((r for r in self.records if start <= r["timestamp"] < end),
+                           key=lambda r: (r["timestamp"], r["seq"])))
+
+    def checkpoints(self, start, end):
+        return [c for c in self.checkpoint_records if start <= c["timestamp"] < end]
+
+    def signature_at(self, partition, seq):
+        return next((r["signature"] for r in self.records if (r["partition"], r["seq"]) == (partition, seq)), None)
+
+    def page(self, query, projection=None):
+        records = heapq.nlargest(query.limit + 1, filter(query.matches, self.records),
+                                 key=lambda r: (r["timestamp"], r["_id"]))
+        return [query.project(r) for r in records] if projection is not None else records
+
+    def export(self, query):
+        return iter(sorted(filter(query.matches, self.records), key=lambda r: (r["timestamp"], r["_id"]), reverse=True))
+
+    def close(self):
+        pass
+
+class AuditArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        app = Flask(__name__)
+        app.config.update(AUDIT_SIGNING_KEY='test-key', AUDIT_CHECKPOINT_INTERVAL=25,
+                          AUDIT_ARCHIVE_PATH=self.tmp.name, AUDIT_ARCHIVE_AGE_DAYS=2,
+                          AUDIT_ARCHIVE_SEGMENT_RECORDS=40, AUDIT_ARCHIVER_ENABLED=False)
+        # 以内存热存储代替 MongoDB
+        original, audit_store._create_backend = audit_store._create_backend, lambda app: MemoryAuditStore()
+        self.addCleanup(setattr, audit_store, '_create_backend', original)
+        self.audit = audit_service()
+        self.audit.init_app(app)
+        self.archiver = AuditArchiver()
+        self.archiver.init_app(app, self.audit)
+
+        # 五天的记录，每天 30 条，时间戳改写到过去后重新签名
+        self.now = datetime(2024, 3, 10, 12)
+        for day in range(5):
+            for i in range(30):
+                self.audit.log_activity(str(i % 3), 'transfer_funds', f"transaction:{day}-{i}")
+        hot = self.audit.store.hot
+        for n, record in enumerate(hot.records):
+            record["timestamp"] = self.now - timedelta(days=4 - n // 30, minutes=30 - n % 30)
+            record["_id"] = ObjectId(ObjectId.from_datetime(record["timestamp"]).binary[:4] + os.urandom(8))
+        self.ids = [str(record["_id"]) for record in hot.records]
+        self._resign(hot.records)
+        for checkpoint in hot.checkpoint_records:
+            checkpoint["timestamp"] = hot.records[checkpoint["seq"]]["timestamp"]
+            checkpoint["record_signature"] = hot.records[checkpoint["seq"]]["signature"]
+            checkpoint["signature"] = self.audit._generate_signature(
+                {k: v for k, v in checkpoint.items() if k not in ("_id", "signature")})
+
+    def _resign(self, records):
+        prev = self.audit.chain.genesis(records[0]["partition"])
+        for record in records:
+            record["prev_signature"] = prev
+            record["signature"] = self.audit._generate_signature(
+                {k: v for k, v in record.items() if k not in ("_id", "signature")})
+            prev = record["signature"]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_archive_and_fan_out(self):
+        store = self.audit.store
+        self.assertIsInstance(store, TieredAuditStore)
+        self.assertEqual(self.archiver.archive(self.now), 60)   # 截止到 3 月 8 日 0 点
+        self.assertEqual(len(store.hot.records), 90)
+        self.assertEqual(len(store.archive.segments()), 2)
+        self.assertEqual(self.archiver.archive(self.now), 0)
+
+        # 查询区间不涉及归档时不读取段文件
+        self.assertEqual(store.archive.segments(self.now - timedelta(days=1)), [])
+
+        start, end = self.now - timedelta(days=5), self.now + timedelta(days=1)
+        report = self.audit.verify_range(start, end)
+        self.assertTrue(report['ok'], report)
+        self.assertEqual(report['verified'], 150)
+        self.assertTrue(self.audit.verify_log_integrity(self.ids[5]))
+
+        page = self.audit.query_logs(AuditQuery(user_id='1', limit=30))
+        rest = list(self.audit.export_logs(AuditQuery(user_id='1', cursor=page['next_cursor'])))
+        logs = page['items'] + rest
+        self.assertEqual(len(logs), 50)
+        self.assertEqual(logs, sorted(logs, key=lambda r: (r['timestamp'], r['_id']), reverse=True))
+        self.assertEqual(len(self.audit.search_logs({'action': 'transfer_funds', 'user_id': '0'})), 50)
+
+    def test_interrupted_delete_is_finished_on_rerun(self):
+        store = self.audit.store
+        original, calls = store.hot.delete, []
+
+        def crash_after_first_batch(ids):
+            calls.append(ids)
+            if len(calls) > 1:
+                raise OSError("simulated crash")
+            original(ids)
+
+        store.hot.delete = crash_after_first_batch
+        with mock.patch('services.audit_archive.DELETE_BATCH_SIZE', 10):
+            with self.assertRaises(OSError):
+                self.archiver.archive(self.now)
+        self.assertEqual(len(store.hot.records), 140)          # 第一段已封存，只删掉一批
+        self.assertIsNotNone(store.archive.pending())
+
+        store.hot.delete = original
+        self.assertEqual(self.archiver.archive(self.now), 30)  # 剩余的一天；已归档的记录不再写入新段
+        self.assertIsNone(store.archive.pending())
+        self.assertEqual(len(store.hot.records), 90)
+        self.assertEqual(sum(s.footer["count"] for s in store.archive.segments()), 60)
+        report = self.audit.verify_range(self.now - timedelta(days=5), self.now + timedelta(days=1))
+        self.assertTrue(report['ok'], report)
+        self.assertEqual(report['verified'], 150)
+
+    def test_tampered_segment_is_reported(self):
+        self.archiver.archive(self.now)
+        segment = self.audit.store.archive.segments()[0]
+        with open(segment.path, 'r+b') as f:
+            f.seek(20)
+            byte = f.read(1)
+            f.seek(20)
+            f.write(bytes([byte[0] ^ 1]))
+        report = self.audit.verify_range(self.now - timedelta(days=5), self.now)
+        self.assertFalse(report['ok'])
+        self.assertTrue(report['archive_failures'])
+        self.assertTrue(segment.path.endswith(SEGMENT_SUFFIX))
+        with self.assertRaises(ArchiveIntegrityError):
+            list(self.audit.store.archive.records(segment))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import hmac
+import json
+import hashlib
+import unittest
+from datetime import datetime, timedelta
+from flask import Flask
+from bson import ObjectId
+from services.audit import audit_service
+from services import audit_store
+from services.audit_chain import AuditChain, ChainVerifier
+
+def sign(data):
+    msg = json.dumps(data, sort_keys=True, default=str).encode()
+    return hmac.new(b'test-key', msg, hashlib.sha256).hexdigest()
+
+def verify(record):
+    return record.get("signature") == sign({k: v for k, v in record.items() if k not in ("_id", "signature")})
+
+class ListAuditStore:
+    """审计存储替身：记录与检查点保存在列表中，记下先于其记录写入的检查点"""
+    def __init__(self):
+        self.records = []
+        self.checkpoint_records = []
+        self.early_checkpoints = []
+
+    def create_indexes(self):
+        pass
+
+    def insert(self, record):
+        self.records.append(record)
+
+    def insert_many(self, records, ordered=False):
+        self.records.extend(records)
+
+    def insert_checkpoint(self, checkpoint):
+        if not any(r["partition"] == checkpoint["partition"] and r["seq"] == checkpoint["seq"]
+                   for r in self.records):
+            self.early_checkpoints.append(checkpoint)
+        self.checkpoint_records.append(checkpoint)
+
+    def scan(self, start, end):
+        return iter(sorted((r for r in self.records if start <= r["timestamp"] < end),
+                           key=lambda r: (r["timestamp"], r["seq"])))
+
+    def checkpoints(self, start, end):
+        return [c for c in self.checkpoint_records if start <= c["timestamp"] < end]
+
+    def signature_at(self, partition, seq):
+        return next((r["signature"] for r in self.records if (r["partition"], r["seq"]) == (partition, seq)), None)
+
+    def close(self):
+        pass
+
+class ChainVerifierTestCase(unittest.TestCase):
+    def setUp(self):
+        self.chain = AuditChain(sign, checkpoint_interval=5)
+        self.records, self.checkpoints = [], []
+        for n in range(12):
+            record = {"user_id": str(n % 3), "action": "transfer_funds", "resource": f"transaction:{n}"}
+            checkpoint = self.chain.link(record)
+            record["_id"] = ObjectId()
+            self.records.append(record)
+            if checkpoint:
+                self.checkpoints.append(checkpoint)
+
+    def verify(self, records, checkpoints=None):
+        by_key = {(r["partition"], r["seq"]): r["signature"] for r in records}
+        verifier = ChainVerifier(verify, sign, predecessor=lambda p, s: by_key.get((p, s)),
+                                 checkpoints=self.checkpoints if checkpoints is None else checkpoints)
+        for record in records:
+            verifier.feed(record)
+        return verifier.report()
+
+    def test_intact_chain(self):
+        self.assertEqual([c["seq"] for c in self.checkpoints], [4, 9])
+        report = self.verify(self.records)
+        self.assertTrue(report["ok"], report)
+        self.assertEqual(report["verified"], 12)
+
+    def test_edited_record_is_tampered(self):
+        self.records[3]["resource"] = "transaction:999"
+        report = self.verify(self.records)
+        self.assertFalse(report["ok"])
+        self.assertEqual(report["tampered"], [str(self.records[3]["_id"])])
+        self.assertEqual(report["verified"], 11)
+
+    def test_deleted_record_leaves_gap(self):
+        del self.records[6]
+        report = self.verify(self.records)
+        self.assertFalse(report["ok"])
+        self.assertEqual(report["gaps"], [{"partition": self.chain.partition, "from": 6, "to": 6}])
+        self.assertEqual(report["tampered"], [])
+
+    def test_truncated_tail_fails_checkpoint(self):
+        report = self.verify(self.records[:8])
+        self.assertFalse(report["ok"])
+        self.assertEqual(report["gaps"], [])
+        self.assertEqual(report["checkpoint_failures"],
+                         [{"partition": self.chain.partition, "seq": 9, "reason": "checkpointed record missing"}])
+
+    def test_inserted_record_breaks_chain(self):
+        # 重新签名也无法伪造：没有密钥时签名不符，序号与前驱链接同样不连续
+        forged = dict(self.records[4], _id=ObjectId(), resource="transaction:forged")
+        self.records.insert(5, forged)
+        report = self.verify(self.records)
+        self.assertFalse(report["ok"])
+        self.assertEqual(report["tampered"], [str(forged["_id"])])
+        self.assertTrue(report["gaps"])
+
+    def test_reordered_records_break_links(self):
+        self.records[2], self.records[3] = self.records[3], self.records[2]
+        report = self.verify(self.records)
+        self.assertFalse(report["ok"])
+        self.assertEqual(report["tampered"], [])
+        self.assertEqual(len(report["gaps"]), 3)
+
+        # 交换内容但保留序号：签名覆盖序号与前驱签名，两条记录均不通过
+        self.records[2], self.records[3] = self.records[3], self.records[2]
+        for field in ("resource", "user_id"):
+            self.records[2][field], self.records[3][field] = self.records[3][field], self.records[2][field]
+        report = self.verify(self.records)
+        self.assertEqual(report["tampered"], [str(self.records[2]["_id"]), str(self.records[3]["_id"])])
+
+    def test_forged_checkpoint_is_reported(self):
+        checkpoint = dict(self.checkpoints[0], seq=3)
+        report = self.verify(self.records, [checkpoint, self.checkpoints[1]])
+        self.assertEqual(report["checkpoint_failures"],
+                         [{"partition": self.chain.partition, "seq": 3, "reason": "invalid checkpoint signature"}])
+
+class VerifyRangeTestCase(unittest.TestCase):
+    def _service(self, **config):
+        app = Flask(__name__)
+        app.config.update(AUDIT_SIGNING_KEY='test-key', AUDIT_CHECKPOINT_INTERVAL=4, **config)
+        store = ListAuditStore()
+        original, audit_store._create_backend = audit_store._create_backend, lambda app: store
+        self.addCleanup(setattr, audit_store, '_create_backend', original)
+        audit = audit_service()
+        audit.init_app(app)
+        return audit, store
+
+    def _range(self, audit):
+        now = datetime.utcnow()
+        return audit.verify_range(now - timedelta(hours=1), now + timedelta(hours=1))
+
+    def test_verify_range_reports_tampering(self):
+        audit, store = self._service()
+        for n in range(10):
+            audit.log_activity(str(n), 'login', f"user:{n}")
+        self.assertTrue(self._range(audit)['ok'])
+
+        store.records[2]["action"] = "logout"
+        del store.records[5]
+        report = self._range(audit)
+        self.assertFalse(report['ok'])
+        self.assertEqual(report['tampered'], [str(store.records[2]["_id"])])
+        self.assertEqual(report['gaps'], [{"partition": audit.chain.partition, "from": 5, "to": 5}])
+        self.assertEqual(report['verified'], 8)
+
+        del store.records[-3:]   # 截掉 seq 7 之后的记录：seq 7 的检查点找不到记录
+        report = self._range(audit)
+        self.assertEqual([f["seq"] for f in report['checkpoint_failures']], [7])
+
+    def test_async_checkpoints_follow_their_records(self):
+        audit, store = self._service(AUDIT_ASYNC=True, AUDIT_FLUSH_INTERVAL=0.5)
+        for n in range(10):
+            audit.log_activity(str(n), 'login', f"user:{n}")
+        audit.flush()
+        self.assertEqual([c["seq"] for c in store.checkpoint_records], [3, 7, 9])
+        self.assertEqual(store.early_checkpoints, [])
+        report = self._range(audit)
+        self.assertTrue(report['ok'], report)
+        self.assertEqual(report['verified'], 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import re
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from bson import ObjectId
+from services.audit import audit_service, audit_log
+from services.audit_query import AuditQuery, encode_cursor, decode_cursor, MAX_PAGE_SIZE
+from services.audit_store import MongoAuditStore
+
+class FakeCursor:
+    def __init__(self, records):
+        self.records = records
+        self.calls = []
+        self.closed = False
+
+    def sort(self, keys):
+        self.calls.append(('sort', keys))
+        return self
+
+    def batch_size(self, size):
+        self.calls.append(('batch_size', size))
+        return self
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def close(self):
+        self.closed = True
+
+class FakeCollection:
+    def __init__(self, records):
+        self.cursor = FakeCursor(records)
+        self.found = None
+
+    def find(self, query, projection=None):
+        self.found = (query, projection)
+        return self.cursor
+
+class AuditQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.base = datetime(2024, 3, 10, 12)
+
+    def _log(self, offset_ms, **fields):
+        timestamp = self.base + timedelta(milliseconds=offset_ms)
+        return dict({"_id": ObjectId(), "timestamp": timestamp, "user_id": 1, "action": "login",
+                     "resource": "user:alice"}, **fields)
+
+    def test_cursor_round_trip(self):
+        log = self._log(1234)
+        cursor = encode_cursor(log)
+        self.assertEqual(decode_cursor(cursor), (log["timestamp"], log["_id"]))
+        self.assertRegex(cursor, r'^[A-Za-z0-9_=-]+$')   # URL 安全
+        for invalid in ("", "not-base64!", "MTIz", encode_cursor(log)[:-4] + "AAAA"):
+            with self.assertRaises(ValueError):
+                decode_cursor(invalid)
+        with self.assertRaisesRegex(ValueError, 'Invalid cursor'):
+            AuditQuery(cursor="bm90OmFuOm9pZA==")
+
+    def test_from_args_validation(self):
+        query = AuditQuery.from_args({"user_id": "7", "start": "2024-03-01T00:00:00Z", "end": "2024-03-02",
+                                      "limit": "50", "fields": "action,resource"})
+        self.assertEqual(query.user_id, "7")
+        self.assertEqual(query.start, datetime(2024, 3, 1))
+        self.assertEqual(query.end, datetime(2024, 3, 2))
+        self.assertEqual(query.limit, 50)
+        self.assertEqual(query.projection(), {"action": 1, "resource": 1, "timestamp": 1})
+        self.assertEqual(AuditQuery.from_args({"user_id": "alice"}).user_id, "alice")
+        for args in ({"sort": "asc"}, {"limit": "ten"}, {"limit": str(MAX_PAGE_SIZE + 1)}, {"limit": "0"},
+                     {"fields": "password"}, {"start": "yesterday"}):
+            with self.assertRaises(ValueError, msg=args):
+                AuditQuery.from_args(args)
+
+    def test_filter(self):
+        self.assertEqual(AuditQuery().filter(), {})
+        query = AuditQuery(user_id=1, action="login", resource_prefix="transaction:1.",
+                           start=self.base, end=self.base + timedelta(days=1))
+        self.assertEqual(query.filter(), {
+            "user_id": {"$in": ["1", 1]},
+            "action": "login",
+            "resource": {"$regex": "^" + re.escape("transaction:1.")},
+            "timestamp": {"$gte": self.base, "$lt": self.base + timedelta(days=1)},
+        })
+        # resource 精确匹配优先于前缀
+        self.assertEqual(AuditQuery(resource="user:1", resource_prefix="user:").filter(), {"resource": "user:1"})
+        self.assertEqual(AuditQuery(user_id="alice").filter(), {"user_id": "alice"})
+
+        log = self._log(500)
+        cursor_query = AuditQuery(action="login", cursor=encode_cursor(log))
+        self.assertEqual(cursor_query.filter(), {"$and": [{"action": "login"}, {"$or": [
+            {"timestamp": {"$lt": log["timestamp"]}},
+            {"timestamp": log["timestamp"], "_id": {"$lt": log["_id"]}},
+        ]}]})
+
+    def test_matches_agrees_with_filter(self):
+        anchor = self._log(500)
+        query = AuditQuery(user_id=1, resource_prefix="transaction:", start=self.base,
+                           cursor=encode_cursor(anchor))
+        self.assertTrue(query.matches(self._log(100, resource="transaction:9")))
+        self.assertFalse(query.matches(self._log(100, resource="user:9")))
+        self.assertFalse(query.matches(self._log(100, resource="transaction:9", user_id=2)))
+        self.assertTrue(query.matches(self._log(100, resource="transaction:9", user_id="1")))
+        self.assertFalse(query.matches(self._log(100, resource="transaction:9", user_id=None)))
+        self.assertFalse(query.matches(self._log(-1, resource="transaction:9")))
+        self.assertFalse(query.matches(self._log(600, resource="transaction:9")))      # 游标之后（更新）
+        same_ms = dict(anchor, resource="transaction:9")
+        self.assertFalse(query.matches(same_ms))
+        self.assertTrue(query.matches(dict(same_ms, _id=ObjectId(b"\x00" * 12))))        # 同毫秒内 _id 更小
+
+    def test_mongo_export_uses_index_order_and_closes_cursor(self):
+        records = [self._log(i) for i in range(3)]
+        collection = FakeCollection(records)
+        store = MongoAuditStore({"audit_logs": collection, "audit_checkpoints": None})
+        query = AuditQuery(action="login", fields=["action"])
+        exported = store.export(query)
+        self.assertEqual(next(exported), records[0])
+        exported.close()   # 客户端中断下载
+        self.assertTrue(collection.cursor.closed)
+        self.assertEqual(collection.found, ({"action": "login"}, {"action": 1, "timestamp": 1}))
+        self.assertIn(('sort', [("timestamp", -1), ("_id", -1)]), collection.cursor.calls)
+
+class AuditExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        app = Flask(__name__)
+        app.config.update(AUDIT_SIGNING_KEY='test-key', AUDIT_BACKEND='local',
+                          AUDIT_STORE_PATH=os.path.join(self.tmp.name, 'audit'))
+        self.audit = audit_service()
+        self.audit.init_app(app)
+        self.addCleanup(self.audit.store.close)
+        for n in range(30):
+            self.audit.log_activity(str(n % 3), 'transfer_funds' if n % 2 else 'login', f"transaction:{n}")
+
+    def test_pages_and_export_cover_matches_in_order(self):
+        page = self.audit.query_logs(AuditQuery(user_id='1', limit=4))
+        self.assertEqual(len(page['items']), 4)
+        rest = list(self.audit.export_logs(AuditQuery(user_id='1', cursor=page['next_cursor'])))
+        logs = page['items'] + rest
+        self.assertEqual(len(logs), 10)
+        self.assertEqual(len({log['_id'] for log in logs}), 10)
+        self.assertEqual(logs, sorted(logs, key=lambda r: (r['timestamp'], r['_id']), reverse=True))
+
+        exported = list(self.audit.export_logs(AuditQuery(action='login', fields=['resource'])))
+        self.assertEqual(len(exported), 15)
+        self.assertEqual(set(exported[0]), {'_id', 'timestamp', 'resource'})
+        self.assertEqual(exported[-1]['resource'], 'transaction:0')
+
+    def test_request_identity_and_integer_ids_match_query_args(self):
+        app = Flask(__name__)
+        app.config['JWT_SECRET_KEY'] = 'test-secret'
+        JWTManager(app)
+        app.extensions['services'] = {'audit': self.audit}
+        with app.app_context():
+            token = create_access_token(identity='42')
+        # 路由中经 audit_log() 记录（JWT 身份为字符串），认证服务直接传入整数 user.id
+        with app.test_request_context(headers={'Authorization': f'Bearer {token}'}):
+            audit_log('view_account', 'account:1')
+        self.audit.log_activity(42, 'login_success', 'user:bob')
+
+        logs = self.audit.export_logs(AuditQuery.from_args({'user_id': '42'}))
+        self.assertEqual(sorted(log['action'] for log in logs), ['login_success', 'view_account'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from datetime import datetime, timedelta
+from models.transaction import db
+from models.audit_rollup import AuditRollup
+from services.audit_rollups import AuditRollups, RollupQuery
+from db_case import DatabaseTestCase
+
+class ListStore:
+    def __init__(self, records):
+        self.records = records
+
+    def scan(self, start, end):
+        return (r for r in self.records if start <= r['timestamp'] < end)
+
+class AuditRollupsTestCase(DatabaseTestCase):
+    CONFIG = {'AUDIT_ROLLUP_FLUSHER_ENABLED': False}
+
+    def setUp(self):
+        super().setUp()
+        self.rollups = AuditRollups()
+        self.rollups.init_app(self.app)
+        self.day = datetime(2024, 5, 1)
+
+    def log(self, user_id, action, resource, minutes):
+        return {'user_id': user_id, 'action': action, 'resource': resource,
+                'timestamp': self.day + timedelta(minutes=minutes)}
+
+    def logs(self):
+        return [
+            self.log(None, 'login_failed', 'user:alice', 5),
+            self.log(None, 'login_failed', 'user:alice', 70),
+            self.log(None, 'login_failed', 'user:bob', 75),
+            self.log(7, 'transfer_funds', 'transaction:1', 80),
+            self.log(7, 'transfer_funds', 'transaction:2', 90),
+        ]
+
+    def test_incremental_counts_and_queries(self):
+        for log in self.logs():
+            self.rollups.record(log)
+        self.rollups.flush()
+        # 第二次刷新累加到已有行上
+        for log in self.logs()[:2]:
+            self.rollups.record(log)
+        self.assertEqual(self.rollups.flush(), 4)
+        self.assertEqual(self.rollups.flush(), 0)
+
+        end = self.day + timedelta(days=1)
+        hourly = self.rollups.query(RollupQuery('action_hour', self.day, end, action='login_failed'))
+        self.assertEqual([(i['bucket'], i['count']) for i in hourly['items']],
+                         [('2024-05-01T00:00:00', 2), ('2024-05-01T01:00:00', 3)])
+        per_user = self.rollups.query(RollupQuery('user_day', self.day, end, action='login_failed'))
+        self.assertEqual({i['subject']: i['count'] for i in per_user['items']}, {'user:alice': 4, 'user:bob': 1})
+        teller = self.rollups.query(RollupQuery('user_day', self.day, end, subject='7'))
+        self.assertEqual([(i['action'], i['count']) for i in teller['items']], [('transfer_funds', 2)])
+        resources = self.rollups.query(RollupQuery('resource_day', self.day, end, limit=1))
+        self.assertEqual(resources['items'][0]['subject'], 'transaction')
+        self.assertTrue(resources['truncated'])
+
+    def test_rebuild_replaces_counts(self):
+        for log in self.logs() * 3:
+            self.rollups.record(log)
+        self.rollups.flush()
+        self.assertEqual(self.rollups.rebuild(ListStore(self.logs()), self.day, self.day + timedelta(days=1)), 5)
+        total = db.session.query(db.func.sum(AuditRollup.count)).filter_by(rollup='action_hour').scalar()
+        self.assertEqual(total, 5)
+
+    def test_invalid_queries(self):
+        with self.assertRaises(ValueError):
+            RollupQuery.from_args({'rollup': 'per_minute', 'start': '2024-05-01', 'end': '2024-05-02'})
+        with self.assertRaises(ValueError):
+            RollupQuery.from_args({'rollup': 'action_hour', 'start': '2024-05-02', 'end': '2024-05-01'})
+
+if __name__ == '__main__':
+    unittest.main()
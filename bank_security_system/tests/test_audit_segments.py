@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from flask import Flask
+from bson import ObjectId
+from services.audit import audit_service
+from services.audit_query import AuditQuery
+from services.audit_segments import SegmentedAuditStore, INDEX_INTERVAL
+
+class ListTarget:
+    """转发目标：按 _id 去重，模拟 MongoDB 的唯一索引"""
+    def __init__(self):
+        self.records = {}
+        self.checkpoints = {}
+        self.calls = []
+
+    def insert_many(self, records, ordered=False):
+        self.calls.append(('records', len(records)))
+        for record in records:
+            self.records[record['_id']] = record
+
+    def insert_checkpoint(self, checkpoint):
+        self.calls.append(('checkpoint', checkpoint['seq']))
+        self.checkpoints[checkpoint['_id']] = checkpoint
+
+class SegmentedAuditStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SegmentedAuditStore(self.tmp.name, segment_size=16 * 1024)
+        self.base = datetime(2024, 1, 1)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def record(self, partition, seq, offset_ms):
+        timestamp = self.base + timedelta(milliseconds=offset_ms)
+        # _id 的生成时间与 timestamp 一致，与审计服务写入的记录相同
+        _id = ObjectId(ObjectId.from_datetime(timestamp).binary[:4] + os.urandom(8))
+        return {'_id': _id, 'partition': partition, 'seq': seq, 'signature': f'{partition}-{seq}',
+                'timestamp': timestamp}
+
+    def test_scan_merges_streams_in_order(self):
+        records = [self.record('a', i, i * 2) for i in range(2000)] + \
+                  [self.record('b', i, i * 2 + 1) for i in range(2000)]
+        # 同一流内少量乱序
+        records[10], records[11] = records[11], records[10]
+        self.store.insert_many(records)
+        self.assertGreater(len(os.listdir(os.path.join(self.tmp.name, 'a'))), 4)   # 已滚动多个段
+
+        start, end = self.base + timedelta(milliseconds=1000), self.base + timedelta(milliseconds=3000)
+        scanned = list(self.store.scan(start, end))
+        self.assertEqual(len(scanned), 2000)
+        self.assertEqual([r['timestamp'] for r in scanned], sorted(r['timestamp'] for r in scanned))
+        self.assertEqual(self.store.signature_at('b', 1500), 'b-1500')
+        self.assertIsNone(self.store.signature_at('b', 5000))
+        self.assertEqual(self.store.get(str(records[3000]['_id']))['seq'], 1000)
+
+    def test_forward_resumes_without_duplicates(self):
+        target = ListTarget()
+        self.store.insert_many([self.record('a', i, i) for i in range(INDEX_INTERVAL * 3)])
+        self.store.insert_checkpoint({'partition': 'a', 'seq': 10, 'timestamp': self.base})
+        self.assertEqual(self.store.forward(target, batch_size=100), INDEX_INTERVAL * 3)
+        self.store.insert_many([self.record('a', i, i) for i in range(INDEX_INTERVAL * 3, INDEX_INTERVAL * 4)])
+        self.assertEqual(self.store.forward(target), INDEX_INTERVAL)
+        self.assertEqual(self.store.forward(target), 0)
+        self.assertEqual((len(target.records), len(target.checkpoints)), (INDEX_INTERVAL * 4, 1))
+
+    def test_forward_writes_checkpoint_after_preceding_records(self):
+        target = ListTarget()
+        self.store.insert_many([self.record('a', i, i) for i in range(5)])
+        self.store.insert_checkpoint({'partition': 'a', 'seq': 4, 'timestamp': self.base})
+        self.store.insert_many([self.record('a', i, i) for i in range(5, 8)])
+        self.assertEqual(self.store.forward(target, batch_size=100), 8)
+        self.assertEqual(target.calls, [('records', 5), ('checkpoint', 4), ('records', 3)])
+
+class LocalAuditServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        app = Flask(__name__)
+        app.config.update(AUDIT_BACKEND='local', AUDIT_STORE_PATH=self.tmp.name,
+                          AUDIT_SIGNING_KEY='test-key', AUDIT_CHECKPOINT_INTERVAL=50)
+        self.audit = audit_service()
+        self.audit.init_app(app)
+
+    def tearDown(self):
+        self.audit.store.close()
+        self.tmp.cleanup()
+
+    def test_log_verify_and_query(self):
+        ids = [self.audit.log_activity(str(i % 3), 'transfer_funds', f"transaction:{i}") for i in range(120)]
+        self.assertTrue(self.audit.verify_log_integrity(ids[7]))
+        start, end = datetime.utcnow() - timedelta(minutes=1), datetime.utcnow() + timedelta(minutes=1)
+        report = self.audit.verify_range(start, end)
+        self.assertTrue(report['ok'], report)
+        self.assertEqual(report['verified'], 120)
+
+        page = self.audit.query_logs(AuditQuery(user_id='1', limit=10))
+        self.assertEqual([log['resource'] for log in page['items']][:2], ['transaction:118', 'transaction:115'])
+        rest = list(self.audit.export_logs(AuditQuery(user_id='1', cursor=page['next_cursor'])))
+        self.assertEqual(len(page['items']) + len(rest), 40)
+
+    def test_sensitive_data_is_encrypted_and_signed(self):
+        log_id = self.audit.log_activity('1', 'bulk_transfer', 'transactions:1-5', sensitive_data={'count': 5})
+        log = self.audit.store.get(log_id)
+        self.assertIsInstance(log['encrypted_data'], bytes)
+        self.assertNotIn(b'count', log['encrypted_data'])
+        self.assertEqual(self.audit.decrypt_sensitive_data(log), {'count': 5})
+        self.assertTrue(self.audit.verify_log_integrity(log_id))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import os
+import time
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from bson import ObjectId, json_util
+from services.audit_writer import AuditBatchWriter
+
+class MemoryCollection:
+    """insert_many 替身；gate 未放行时阻塞写入，failures 次数内的写入失败"""
+    def __init__(self):
+        self.records = []
+        self.batches = 0
+        self.checkpoints = []
+        self.failures = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def insert_many(self, records, ordered=True):
+        self.gate.wait()
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("MongoDB unavailable")
+        self.records.extend(records)
+        self.batches += 1
+
+    def insert_checkpoint(self, checkpoint):
+        self.checkpoints.append((len(self.records), checkpoint))
+
+class AuditBatchWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.spill_path = os.path.join(self.tmp.name, 'audit.spill')
+        self.collection = MemoryCollection()
+
+    def _record(self, n):
+        return {"_id": ObjectId(), "seq": n, "timestamp": datetime(2024, 3, 10, 12, 0, n)}
+
+    def _write_lines(self, path, records):
+        with open(path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json_util.dumps(record) + "\n")
+
+    def test_close_flushes_queued_records_in_batches(self):
+        writer = AuditBatchWriter(self.collection, batch_size=10, flush_interval=0.05)
+        writer.start()
+        for n in range(25):
+            self.assertTrue(writer.submit(self._record(n)))
+        writer.close()
+        self.assertEqual([r["seq"] for r in self.collection.records], list(range(25)))
+        self.assertGreaterEqual(self.collection.batches, 3)
+        self.assertEqual(writer.stats()['written'], 25)
+        with self.assertRaises(RuntimeError):
+            writer.submit(self._record(25))
+
+    def test_drop_and_spill_backpressure(self):
+        self.collection.gate.clear()
+        dropping = AuditBatchWriter(self.collection, queue_size=1, backpressure='drop')
+        self.assertTrue(dropping.submit(self._record(0)))
+        self.assertFalse(dropping.submit(self._record(1)))
+        self.assertEqual(dropping.stats()['dropped'], 1)
+
+        spilling = AuditBatchWriter(self.collection, queue_size=1, backpressure='spill',
+                                    spill_path=self.spill_path)
+        records = [self._record(n) for n in range(3)]
+        for record in records:
+            self.assertTrue(spilling.submit(record))
+        self.assertEqual(spilling.stats()['spilled'], 2)
+
+        self.collection.gate.set()
+        self.assertEqual(spilling.replay_spill(), 2)
+        self.assertEqual(self.collection.records, records[1:])   # 类型经扩展 JSON 往返不变
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_replay_keeps_leftover_replay_file(self):
+        leftover = [self._record(n) for n in range(2)]
+        spilled = [self._record(n) for n in range(2, 5)]
+        self._write_lines(self.spill_path + '.replay', leftover)
+        self._write_lines(self.spill_path, spilled)
+        writer = AuditBatchWriter(self.collection, batch_size=2, spill_path=self.spill_path)
+        self.assertEqual(writer.replay_spill(), 5)
+        self.assertEqual(self.collection.records, leftover + spilled)
+        self.assertFalse(os.path.exists(self.spill_path + '.replay'))
+
+        # 只剩 .replay 文件时同样回放
+        self._write_lines(self.spill_path + '.replay', leftover)
+        self.assertEqual(writer.replay_spill(), 2)
+        self.assertEqual(writer.replay_spill(), 0)
+
+    def test_checkpoints_are_written_after_their_records(self):
+        writer = AuditBatchWriter(self.collection, batch_size=100, flush_interval=0.05)
+        writer.start()
+        for n in range(3):
+            writer.submit(self._record(n))
+        writer.submit_checkpoint({"partition": "p", "seq": 2})
+        writer.close()
+        self.assertEqual(self.collection.checkpoints, [(3, {"partition": "p", "seq": 2})])
+
+        # 溢出文件中的检查点回放后仍在记录之后写入
+        self.collection.gate.clear()
+        spilling = AuditBatchWriter(self.collection, queue_size=1, backpressure='spill',
+                                    spill_path=self.spill_path)
+        spilling.submit(self._record(3))
+        spilling.submit(self._record(4))
+        spilling.submit_checkpoint({"partition": "p", "seq": 4})
+        self.collection.gate.set()
+        self.assertEqual(spilling.replay_spill(), 1)
+        self.assertEqual(self.collection.checkpoints[-1], (4, {"partition": "p", "seq": 4}))
+
+    def test_failed_writes_are_retried_before_giving_up(self):
+        writer = AuditBatchWriter(self.collection, batch_size=10, flush_interval=0.05, retry_delay=0.01)
+        writer.start()
+        self.collection.failures = 2
+        for n in range(3):
+            writer.submit(self._record(n))
+        writer.close()
+        self.assertEqual([r["seq"] for r in self.collection.records], [0, 1, 2])
+        self.assertEqual(writer.stats()['failed_batches'], 0)
+
+        # 重试耗尽：未配置溢出文件时计入失败批次
+        self.collection.failures = 4
+        writer = AuditBatchWriter(self.collection, write_retries=3, retry_delay=0.01)
+        writer._flush([self._record(3)])
+        self.assertEqual(writer.stats()['failed_batches'], 1)
+        self.assertEqual(len(self.collection.records), 3)
+
+    def test_start_replays_in_background_and_keeps_records_on_error(self):
+        spilled = [self._record(n) for n in range(3)]
+        self._write_lines(self.spill_path, spilled)
+        self.collection.failures = 10
+        writer = AuditBatchWriter(self.collection, flush_interval=0.05, spill_path=self.spill_path,
+                                  write_retries=1, retry_delay=0.01)
+        writer.start()   # 回放失败不影响启动
+        writer.close()
+        self.assertEqual(self.collection.records, [])
+        self.assertFalse(os.path.exists(self.spill_path + '.replay'))
+
+        self.collection.failures = 0
+        writer = AuditBatchWriter(self.collection, flush_interval=0.05, spill_path=self.spill_path)
+        writer.start()
+        writer.close()
+        self.assertEqual(self.collection.records, spilled)
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_concurrent_replay_runs_once(self):
+        spilled = [self._record(n) for n in range(3)]
+        self._write_lines(self.spill_path, spilled)
+        first = AuditBatchWriter(self.collection, spill_path=self.spill_path)
+        second = AuditBatchWriter(self.collection, spill_path=self.spill_path)
+        self.collection.gate.clear()
+        replaying = threading.Thread(target=first.replay_spill)
+        replaying.start()
+        deadline = time.monotonic() + 5
+        while not os.path.exists(self.spill_path + '.replay') and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # 另一个 worker 此时不回放，新溢出的记录写入新的溢出文件
+        self.assertEqual(second.replay_spill(), 0)
+        late = self._record(3)
+        second._spill([late])
+        self.collection.gate.set()
+        replaying.join()
+        self.assertEqual(self.collection.records, spilled)
+        self.assertEqual(second.replay_spill(), 1)
+        self.assertEqual(self.collection.records, spilled + [late])
+
+    def test_close_does_not_block_on_full_queue(self):
+        self.collection.gate.clear()
+        writer = AuditBatchWriter(self.collection, queue_size=2, batch_size=1, flush_interval=0.05)
+        writer.start()
+        for n in range(3):   # 一条卡在写入中，两条占满队列
+            writer.submit(self._record(n))
+        started = time.monotonic()
+        writer.close(timeout=0.3)
+        self.assertLess(time.monotonic() - started, 2)
+
+        # 写入恢复后后台线程写完剩余记录并退出
+        self.collection.gate.set()
+        deadline = time.monotonic() + 5
+        while len(self.collection.records) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(len(self.collection.records), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from flask import Flask
+from services.audit import audit_service
+from services.audit_query import AuditQuery
+from services.backup import BackupScheduler
+from services.backup_pipeline import BackupSource
+from services.backup_chunks import (
+    ContentChunker,
+    ChunkStore,
+    IncrementalBackup,
+    collect_garbage,
+)
+from local_s3 import LocalS3
+
+def _cat(path):
+    return [sys.executable, '-c', 'import shutil,sys;shutil.copyfileobj(open(sys.argv[1],"rb"),sys.stdout.buffer)', path]
+
+class ContentChunkerTestCase(unittest.TestCase):
+    def test_chunks_reassemble_and_respect_bounds(self):
+        chunker = ContentChunker(min_size=1024, avg_size=4096, max_size=16384)
+        data = os.urandom(200000)
+        chunks = list(chunker.split(io.BytesIO(data), read_size=1000))
+        self.assertEqual(b''.join(chunks), data)
+        self.assertTrue(all(len(c) <= 16384 for c in chunks))
+        self.assertTrue(all(len(c) >= 1024 for c in chunks[:-1]))
+
+    def test_insertion_only_changes_nearby_chunks(self):
+        chunker = ContentChunker(min_size=1024, avg_size=4096, max_size=16384)
+        data = os.urandom(400000)
+        before = list(chunker.split(io.BytesIO(data)))
+        after = list(chunker.split(io.BytesIO(data[:100000] + b'inserted' + data[100000:])))
+        self.assertGreaterEqual(len(set(before) & set(after)), len(before) - 3)
+
+class IncrementalBackupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.s3 = LocalS3()
+        self.store = ChunkStore(self.s3, 'bucket', os.urandom(32))
+        self.chunker = ContentChunker(min_size=1024, avg_size=4096, max_size=16384)
+        fd, self.tmp = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.tmp)
+
+    def _backup(self, data, prefix):
+        with open(self.tmp, 'wb') as f:
+            f.write(data)
+        backup = IncrementalBackup(self.store, self.chunker)
+        return backup.run([BackupSource('bank.sql', _cat(self.tmp))], prefix, prefix)
+
+    def test_second_backup_uploads_only_changed_chunks(self):
+        data = os.urandom(300000)
+        first = self._backup(data, 'backups/day1')['objects']['bank.sql']
+        second = self._backup(data[:150000] + b'changed' + data[150000:], 'backups/day2')['objects']['bank.sql']
+        self.assertEqual(first['new_chunks'], len(first['chunks']))
+        self.assertLessEqual(second['new_chunks'], 3)
+
+        manifest = self.store.get_manifest('backups/day2/manifest.json')
+        restored = b''.join(self.store.get(chunk_id) for chunk_id, _ in manifest['objects']['bank.sql']['chunks'])
+        self.assertEqual(restored, data[:150000] + b'changed' + data[150000:])
+
+    def test_tampered_manifest_rejected(self):
+        self._backup(os.urandom(5000), 'backups/day1')
+        key = ('bucket', 'backups/day1/manifest.json')
+        self.s3.objects[key] = self.s3.objects[key].replace(b'bank.sql', b'bank.sqX')
+        with self.assertRaises(ValueError):
+            self.store.get_manifest('backups/day1/manifest.json')
+
+    def test_gc_deletes_only_unreferenced_chunks(self):
+        day1 = self._backup(os.urandom(100000), 'backups/day1')
+        day2 = self._backup(os.urandom(100000), 'backups/day2')
+        later = datetime.utcnow() + timedelta(days=8)
+        result = collect_garbage(self.store, [day2], now=later)
+        self.assertEqual(
+            set(result['deleted']),
+            {c for c, _ in day1['objects']['bank.sql']['chunks']}
+        )
+        for chunk_id, _ in day2['objects']['bank.sql']['chunks']:
+            self.store.get(chunk_id)
+
+    def test_stale_chunks_are_refreshed_on_reuse(self):
+        data = os.urandom(100000)
+        first = self._backup(data, 'backups/day1')['objects']['bank.sql']
+        # 让已存储的块看起来接近 GC 宽限期
+        for key in self.s3.modified:
+            self.s3.modified[key] -= timedelta(days=6, hours=12)
+        puts = []
+        put_object = self.s3.put_object
+        self.s3.put_object = lambda **kw: (puts.append(kw['Key']), put_object(**kw))
+        second = self._backup(data, 'backups/day2')['objects']['bank.sql']
+        # 过旧的块在服务端复制刷新，不重新上传
+        self.assertEqual(second['new_chunks'], 0)
+        self.assertEqual(second['uploaded_bytes'], 0)
+        self.assertEqual(second['refreshed_chunks'], len({c for c, _ in first['chunks']}))
+        self.assertEqual(puts, ['backups/day2/manifest.json'])
+
+        # 只保留 day2 清单时，在其写入前被列举的块也不会被回收
+        result = collect_garbage(self.store, [], now=datetime.utcnow() + timedelta(days=1))
+        self.assertEqual(result['deleted'], [])
+
+    def test_gc_skips_chunks_refreshed_after_listing(self):
+        day1 = self._backup(os.urandom(50000), 'backups/day1')
+        later = datetime.utcnow() + timedelta(days=8)
+        chunk_ids = [c for c, _ in day1['objects']['bank.sql']['chunks']]
+        list_chunks = self.store.list_chunks
+
+        def listed_then_refreshed():
+            listing = list_chunks()
+            # 列举之后，另一个备份刷新了第一个块
+            self.s3.modified[('bucket', self.store.key_for(chunk_ids[0]))] = later
+            return listing
+
+        self.store.list_chunks = listed_then_refreshed
+        result = collect_garbage(self.store, [], now=later)
+        self.assertEqual(set(result['deleted']), set(chunk_ids[1:]))
+        self.store.get(chunk_ids[0])
+
+class IncrementalBackupAuditTestCase(unittest.TestCase):
+    """使用真实审计服务（本地后端）：成功与回收的审计记录带加密的敏感数据"""
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config.update(
+            S3_BUCKET='bucket', KMS_KEY_ID='key', AUDIT_SIGNING_KEY='test-key',
+            AUDIT_BACKEND='local', AUDIT_STORE_PATH=os.path.join(self.tmp.name, 'audit')
+        )
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.audit = audit_service()
+        self.audit.init_app(self.app)
+        self.scheduler = BackupScheduler()
+        self.scheduler.encryption_service.symmetric_key = os.urandom(32)
+        self.scheduler.s3_client = LocalS3()
+        self.scheduler.audit_service = self.audit
+        self.scheduler.backup_mode = 'incremental'
+        self.scheduler.chunk_options = {'min_size': 1024, 'avg_size': 4096, 'max_size': 16384}
+        dump = os.path.join(self.tmp.name, 'dump')
+        with open(dump, 'wb') as f:
+            f.write(os.urandom(50000))
+        self.scheduler._backup_sources = lambda suffix='': [BackupSource('bank.sql', _cat(dump))]
+
+    def tearDown(self):
+        self.audit.store.close()
+        self.ctx.pop()
+        self.tmp.cleanup()
+
+    def _logs(self, action):
+        return self.audit.query_logs(AuditQuery(action=action))['items']
+
+    def test_backup_and_gc_are_audited(self):
+        manifest = self.scheduler.perform_backup()
+        self.assertEqual(manifest['objects']['bank.sql']['size'], 50000)
+        self.scheduler.cleanup_old_backups()
+
+        success, = self._logs('backup_success')
+        self.assertEqual(self.audit.decrypt_sensitive_data(success)['mode'], 'incremental')
+        gc, = self._logs('backup_chunk_gc')
+        self.assertEqual(self.audit.decrypt_sensitive_data(gc)['deleted_chunks'], 0)
+        self.assertEqual(self._logs('backup_failed'), [])
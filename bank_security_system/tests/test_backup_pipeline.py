@@ -0,0 +1,67 @@
+import io
+import os
+import sys
+import gzip
+import hashlib
+import unittest
+from services.encryption import EncryptionService
+from services.backup_pipeline import BackupPipeline, BackupSource
+from local_s3 import LocalS3
+
+def _emit(size, seed):
+    """生成一个向标准输出写入 size 字节确定性数据的命令"""
+    code = (
+        "import sys,random;r=random.Random(%d);"
+        "sys.stdout.buffer.write(bytes(r.getrandbits(8) for _ in range(%d)))" % (seed, size)
+    )
+    return [sys.executable, '-c', code]
+
+class BackupPipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.encryption = EncryptionService()
+        self.encryption.symmetric_key = os.urandom(32)
+        self.encryption.segment_size = 4096
+        self.s3 = LocalS3()
+        self.pipeline = BackupPipeline(
+            self.encryption, self.s3, 'bucket',
+            workers=2, queue_depth=2, part_size=8192
+        )
+
+    def test_streams_sources_concurrently(self):
+        sources = [
+            BackupSource('a.sql.gz.enc', _emit(50000, 1)),
+            BackupSource('b.sql.gz.enc', _emit(0, 2)),
+        ]
+        results = self.pipeline.run(sources, 'backups/2024-01-01')
+        self.pipeline.upload_checksums(results, 'backups/2024-01-01')
+
+        for name, size in (('a.sql.gz.enc', 50000), ('b.sql.gz.enc', 0)):
+            body = self.s3.objects[('bucket', f'backups/2024-01-01/{name}')]
+            self.assertEqual(results[name]['sha256'], hashlib.sha256(body).hexdigest())
+            self.assertEqual(results[name]['raw_bytes'], size)
+            self.assertIn('encrypt', results[name]['timings'])
+            plain = io.BytesIO()
+            self.encryption.decrypt_stream(io.BytesIO(body), plain)
+            self.assertEqual(len(gzip.decompress(plain.getvalue())), size)
+
+        checksums = self.s3.objects[('bucket', 'backups/2024-01-01/checksum.sha256')].decode()
+        self.assertIn(f"{results['a.sql.gz.enc']['sha256']}  a.sql.gz.enc", checksums)
+
+    def test_failed_dump_aborts_upload(self):
+        source = BackupSource('bad.sql.gz.enc', [sys.executable, '-c', 'import sys; sys.exit(3)'])
+        with self.assertRaises(RuntimeError):
+            self.pipeline.run([source], 'backups/2024-01-01')
+        self.assertEqual(self.s3.uploads, {})
+        self.assertNotIn(('bucket', 'backups/2024-01-01/bad.sql.gz.enc'), self.s3.objects)
+
+    def test_large_stderr_does_not_block_dump(self):
+        # 标准错误远超管道缓冲区，且先于标准输出写出
+        code = ("import sys;sys.stderr.write('w' * 1000000 + 'last warning');sys.stderr.flush();"
+                "sys.stdout.buffer.write(b'x' * 20000);sys.exit(%d)")
+        ok = BackupSource('ok.sql.gz.enc', [sys.executable, '-c', code % 0])
+        results = self.pipeline.run([ok], 'backups/2024-01-01')
+        self.assertEqual(results['ok.sql.gz.enc']['raw_bytes'], 20000)
+
+        bad = BackupSource('bad.sql.gz.enc', [sys.executable, '-c', code % 2])
+        with self.assertRaisesRegex(RuntimeError, r'failed \(2\): w+last warning$'):
+            self.pipeline.run([bad], 'backups/2024-01-02')
@@ -0,0 +1,94 @@
+import os
+import sys
+import gzip
+import base64
+import hashlib
+import tempfile
+import unittest
+from services.encryption import EncryptionService
+from services.backup_pipeline import BackupPipeline, BackupSource
+from services.backup_chunks import ChunkStore, ContentChunker, IncrementalBackup
+from services.backup import BackupScheduler
+from services.backup_restore import BackupIntegrityError, BackupRestorer, FileSink, parse_checksums
+from local_s3 import LocalS3
+
+def _cat(path):
+    return [sys.executable, '-c', 'import shutil,sys;shutil.copyfileobj(open(sys.argv[1],"rb"),sys.stdout.buffer)', path]
+
+class BackupRestoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.encryption = EncryptionService()
+        self.encryption.symmetric_key = os.urandom(32)
+        self.encryption.segment_size = 4096
+        self.s3 = LocalS3()
+        self.restorer = BackupRestorer(self.encryption, self.s3, 'bucket', range_size=5000)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data = os.urandom(60000)
+        self.dump = os.path.join(self.tmp.name, 'dump')
+        with open(self.dump, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _full_backup(self):
+        pipeline = BackupPipeline(self.encryption, self.s3, 'bucket', part_size=8192)
+        results = pipeline.run([BackupSource('bank.sql.gz.enc', _cat(self.dump))], 'backups/2024-01-01')
+        pipeline.upload_checksums(results, 'backups/2024-01-01')
+
+    def test_restore_full_backup(self):
+        self._full_backup()
+        out = os.path.join(self.tmp.name, 'restored.sql')
+        report = self.restorer.restore('2024-01-01', sink_factory=lambda name: FileSink(out))
+        with open(out, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(report['objects']['bank.sql.gz.enc']['restored_bytes'], len(self.data))
+        self.assertGreater(report['throughput_mbps'], 0)
+
+    def test_verify_only_detects_corruption(self):
+        self._full_backup()
+        key = ('bucket', 'backups/2024-01-01/bank.sql.gz.enc')
+        body = bytearray(self.s3.objects[key])
+        body[-100] ^= 1
+        self.s3.objects[key] = bytes(body)
+        with self.assertRaisesRegex(BackupIntegrityError, 'Checksum mismatch'):
+            self.restorer.restore('2024-01-01')
+
+    def test_restore_legacy_base64_object(self):
+        # 旧版备份：gzip 后整体加密为 base64(iv:tag:ciphertext)
+        encrypted = self.encryption.encrypt_symmetric(gzip.compress(self.data))
+        while b':' in encrypted['iv'] + encrypted['tag']:
+            encrypted = self.encryption.encrypt_symmetric(gzip.compress(self.data))
+        body = base64.urlsafe_b64encode(
+            encrypted['iv'] + b":" + encrypted['tag'] + b":" + encrypted['ciphertext']
+        )
+        self.s3.put_object(Bucket='bucket', Key='backups/2023-12-31/bank.sql.gz.enc', Body=body)
+        self.s3.put_object(
+            Bucket='bucket', Key='backups/2023-12-31/checksum.sha256',
+            Body=f"{hashlib.sha256(body).hexdigest()}  /secure_backups/encrypted_1/bank.sql.gz.enc\n".encode()
+        )
+        out = os.path.join(self.tmp.name, 'restored.sql')
+        report = self.restorer.restore('2023-12-31', sink_factory=lambda name: FileSink(out))
+        with open(out, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(report['objects']['bank.sql.gz.enc']['restored_bytes'], len(self.data))
+
+    def test_restore_without_sink_is_rejected(self):
+        scheduler = BackupScheduler()
+        with self.assertRaises(ValueError):
+            scheduler.restore_backup('2024-01-01', verify_only=False)
+
+    def test_restore_incremental_backup(self):
+        store = ChunkStore(self.s3, 'bucket', self.encryption.symmetric_key)
+        chunker = ContentChunker(min_size=1024, avg_size=4096, max_size=16384)
+        IncrementalBackup(store, chunker).run(
+            [BackupSource('bank.sql', _cat(self.dump))], 'backups/2024-01-02', '1'
+        )
+        out = os.path.join(self.tmp.name, 'restored.sql')
+        self.restorer.restore('2024-01-02', sink_factory=lambda name: FileSink(out))
+        with open(out, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_legacy_checksum_paths(self):
+        checksums = parse_checksums(b"abc  /secure_backups/encrypted_1/bank.sql.gz.enc\n")
+        self.assertEqual(checksums, {'bank.sql.gz.enc': 'abc'})
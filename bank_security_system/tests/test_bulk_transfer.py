@@ -0,0 +1,62 @@
+import os
+import unittest
+from decimal import Decimal
+from models.transaction import db, Transaction
+from models.account import Account
+from services.encryption import EncryptionService
+from services.ledger import account_balances, open_balance
+from services.transfer import TransferEngine
+from services.bulk_transfer import BulkTransferProcessor
+from db_case import BatchTestCase
+
+class BulkTransferTestCase(BatchTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in (1, 2, 3):
+            db.session.add(Account(id=i, owner=f'owner{i}', currency='CNY'))
+        db.session.add(Account(id=4, owner='owner4', currency='USD'))
+        db.session.flush()
+        self.encryption = EncryptionService()
+        self.encryption.symmetric_key = os.urandom(32)
+        open_balance(db.session, self.encryption, 1, Decimal('100.00'))
+        db.session.commit()
+        self.engine = TransferEngine(self.encryption)
+        self.processor = BulkTransferProcessor(self.engine, chunk_size=2)
+
+    def test_csv_batch_reports_each_row(self):
+        results = self.run_batch(
+            "from_account,to_account,amount,idempotency_key\n"
+            "1,2,40.00,a\n"
+            "1,3,50.00,\n"
+            "1,2,20.00,\n"       # 余额不足（同组前两笔已扣减）
+            "1,1,1.00,\n"
+            "1,4,1.00,\n"
+            "1,9,1.00,\n"
+            "2,3,0.001,\n", 'csv')
+        self.assertEqual([results[n]['status'] for n in range(1, 8)],
+                         ['completed', 'completed', 'rejected', 'rejected', 'rejected', 'rejected', 'rejected'])
+        self.assertEqual(results[3]['error'], "Insufficient funds")
+        self.assertEqual(results[6]['error'], "Account 9 not found")
+        self.assertEqual(account_balances(self.encryption, [1, 2, 3]),
+                         {1: Decimal('10.00'), 2: Decimal('40.00'), 3: Decimal('50.00')})
+        self.assertEqual(Transaction.query.count(), 2)
+
+    def test_ndjson_replay_and_conflict(self):
+        batch = '{"from_account": 1, "to_account": 2, "amount": "5.00", "idempotency_key": "k1"}\n'
+        first = self.run_batch(batch, 'ndjson')
+        again = self.run_batch(batch + 'not json\n'
+                               '{"from_account": 1, "to_account": 3, "amount": "5.00", "idempotency_key": "k1"}\n',
+                               'ndjson')
+        self.assertEqual(again[1], {'row': 1, 'status': 'replayed', 'transaction_id': first[1]['transaction_id']})
+        self.assertEqual(again[2]['error'], "Malformed row")
+        self.assertEqual(again[3]['error'], "Duplicate idempotency key in batch")
+        self.assertEqual(account_balances(self.encryption, [1]), {1: Decimal('95.00')})
+
+    def test_invalid_batch(self):
+        with self.assertRaises(ValueError):
+            self.processor.prepare("from,to\n1,2\n", 'csv')
+        with self.assertRaises(ValueError):
+            self.processor.prepare("", 'ndjson')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor
+from models.transaction import db
+from models.user import User
+from models.role import Role
+from services.password_hashing import PasswordHasher
+from services.bulk_users import BulkUserImporter
+from db_case import BatchTestCase
+
+class BulkUserImporterTestCase(BatchTestCase):
+    def setUp(self):
+        super().setUp()
+        db.session.add_all([Role(name='teller'), Role(name='auditor')])
+        db.session.add(User(username='taken', password_hash='x'))
+        db.session.commit()
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000')
+        self.processor = BulkUserImporter(hasher, chunk_size=2, hash_workers=2)
+
+    def test_csv_import(self):
+        results = self.run_batch(
+            "username,password,roles\n"
+            "alice,pw-a,teller\n"
+            "bob,pw-b,teller;auditor\n"
+            "taken,pw,teller\n"
+            "alice,pw,teller\n"
+            "carol,pw-c,manager\n"
+            "dave,pw-d,auditor\n", 'csv')
+        self.assertEqual([results[n]['status'] for n in range(1, 7)],
+                         ['created', 'created', 'rejected', 'rejected', 'rejected', 'created'])
+        self.assertEqual(results[3]['error'], "Username already exists")
+        self.assertEqual(results[4]['error'], "Duplicate username in batch")
+        self.assertEqual(results[5]['error'], "Unknown role: manager")
+
+        bob = db.session.get(User, results[2]['user_id'])
+        self.assertEqual(sorted(role.name for role in bob.roles), ['auditor', 'teller'])
+        self.assertTrue(self.processor.hasher.verify(bob.password_hash, 'pw-b'))
+        self.assertEqual(User.query.count(), 4)
+
+    def test_ndjson_import(self):
+        results = self.run_batch(
+            '{"username": "erin", "password": "pw", "roles": ["teller"]}\n'
+            '{"username": "frank", "password": "pw"}\n', 'ndjson')
+        self.assertEqual(results[1]['status'], 'created')
+        self.assertEqual(results[2]['error'], "Missing required fields")
+
+    def test_one_spawned_pool_per_import(self):
+        with mock.patch('services.password_hashing.ProcessPoolExecutor', wraps=ProcessPoolExecutor) as pools:
+            results = self.run_batch("username,password,roles\n" + "".join(
+                f"user{i},pw-{i},teller\n" for i in range(5)), 'csv')
+        self.assertEqual([r['status'] for r in results.values()], ['created'] * 5)
+        self.assertEqual(pools.call_count, 1)   # 三组共用一个进程池
+        self.assertEqual(pools.call_args.kwargs['mp_context'].get_start_method(), 'spawn')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+from flask import Flask, jsonify
+from models.transaction import db
+from models.account import Account
+from services.db_routing import read_only
+
+class ReadReplicaRoutingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'primary.db')}"
+        self.app.config['SQLALCHEMY_BINDS'] = {'replica': {
+            'url': f"sqlite:///{os.path.join(self.tmp.name, 'replica.db')}",
+            'pool_size': 2, 'max_overflow': 1, 'pool_pre_ping': True, 'pool_recycle': 60,
+        }}
+        db.init_app(self.app)
+
+        @self.app.route('/accounts/<int:account_id>')
+        @read_only
+        def owner(account_id):
+            return jsonify(owner=db.session.get(Account, account_id).owner)
+
+        with self.app.app_context():
+            db.create_all()
+            db.metadata.create_all(db.engines['replica'])
+            # 两个库内容不同，以便区分查询落在哪个库
+            db.session.add(Account(id=1, owner='primary', currency='CNY'))
+            db.session.commit()
+            with db.engines['replica'].begin() as conn:
+                conn.execute(Account.__table__.insert(), {'id': 1, 'owner': 'replica', 'currency': 'CNY'})
+
+    def tearDown(self):
+        with self.app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        # init_app 会为副本 bind 注册一个空 metadata，移除以免影响其他测试的 create_all
+        db.metadatas.pop('replica', None)
+        self.tmp.cleanup()
+
+    def test_pool_options_per_bind(self):
+        with self.app.app_context():
+            self.assertEqual(db.engines['replica'].pool.size(), 2)
+            self.assertTrue(db.engines['replica'].pool._pre_ping)
+
+    def test_read_only_handler_uses_replica(self):
+        client = self.app.test_client()
+        self.assertEqual(client.get('/accounts/1').get_json(), {'owner': 'replica'})
+        # 标记只在本次请求内有效
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Account, 1).owner, 'primary')
+
+    def test_write_pins_session_to_primary(self):
+        with self.app.app_context():
+            db.session().use_replica()
+            self.assertEqual(Account.query.filter_by(id=1).one().owner, 'replica')
+            db.session.add(Account(id=2, owner='new', currency='CNY'))
+            db.session.commit()
+            self.assertEqual(Account.query.filter_by(id=2).one().owner, 'new')
+            self.assertEqual(Account.query.filter_by(id=1).one().owner, 'primary')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import io
+import os
+import base64
+import tempfile
+import unittest
+from flask import Flask
+from cryptography.exceptions import InvalidTag
+from services.encryption import EncryptionService, STREAM_HEADER, STREAM_TAG_SIZE, MAX_SEGMENT_SIZE
+from services.envelope import EnvelopeCipher, SQLDataKeyStore, envelope_key_id
+from models.transaction import db
+from models.user import User
+from models.data_key import DataKey
+
+class StreamEncryptionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.service = EncryptionService()
+        self.service.symmetric_key = os.urandom(32)
+
+    def _roundtrip(self, data, segment_size=64):
+        encrypted = io.BytesIO()
+        self.service.encrypt_stream(io.BytesIO(data), encrypted, segment_size=segment_size)
+        decrypted = io.BytesIO()
+        self.service.decrypt_stream(io.BytesIO(encrypted.getvalue()), decrypted)
+        self.assertEqual(decrypted.getvalue(), data)
+        return encrypted.getvalue()
+
+    def test_roundtrip_sizes(self):
+        for size in (0, 1, 63, 64, 65, 640, 1000):
+            self._roundtrip(os.urandom(size))
+
+    def test_truncated_stream_rejected(self):
+        encrypted = self._roundtrip(os.urandom(640))
+        frame = 64 + STREAM_TAG_SIZE
+        truncated = encrypted[:STREAM_HEADER.size + frame * 5]
+        with self.assertRaises(InvalidTag):
+            self.service.decrypt_stream(io.BytesIO(truncated), io.BytesIO())
+
+    def test_reordered_segments_rejected(self):
+        encrypted = self._roundtrip(os.urandom(640))
+        frame = 64 + STREAM_TAG_SIZE
+        header, body = encrypted[:STREAM_HEADER.size], encrypted[STREAM_HEADER.size:]
+        swapped = header + body[frame:2 * frame] + body[:frame] + body[2 * frame:]
+        with self.assertRaises(InvalidTag):
+            self.service.decrypt_stream(io.BytesIO(swapped), io.BytesIO())
+
+    def test_oversized_segment_header_rejected(self):
+        encrypted = self._roundtrip(os.urandom(100))
+        magic, version, _, prefix = STREAM_HEADER.unpack(encrypted[:STREAM_HEADER.size])
+        for segment_size in (0, MAX_SEGMENT_SIZE + 1, 2 ** 32 - 1):
+            forged = STREAM_HEADER.pack(magic, version, segment_size, prefix) + encrypted[STREAM_HEADER.size:]
+            with self.assertRaisesRegex(ValueError, 'segment size'):
+                self.service.decrypt_stream(io.BytesIO(forged), io.BytesIO())
+        with self.assertRaises(ValueError):
+            self.service.encrypt_stream(io.BytesIO(b'x'), io.BytesIO(), segment_size=MAX_SEGMENT_SIZE + 1)
+
+    def test_legacy_format_still_decrypts(self):
+        encrypted = self.service.encrypt_symmetric(b'legacy dump')
+        # 旧格式以 ':' 分隔，iv/tag 中出现 ':' 时无法解析
+        while b':' in encrypted['iv'] + encrypted['tag']:
+            encrypted = self.service.encrypt_symmetric(b'legacy dump')
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, 'dump.enc')
+            dst = os.path.join(tmp, 'dump.sql')
+            with open(src, 'wb') as f:
+                f.write(base64.urlsafe_b64encode(
+                    encrypted['iv'] + b":" + encrypted['tag'] + b":" + encrypted['ciphertext']
+                ))
+            self.service.decrypt_file(src, dst)
+            with open(dst, 'rb') as f:
+                self.assertEqual(f.read(), b'legacy dump')
+
+class BatchEncryptionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.service = EncryptionService()
+        self.service.symmetric_key = os.urandom(32)
+
+    def test_roundtrip_serial_and_parallel(self):
+        values = [os.urandom(i % 50) for i in range(3000)]
+        for threshold in (10 ** 6, 0):
+            self.service.batch_parallel_threshold = threshold
+            sealed = self.service.encrypt_many(values, workers=3)
+            self.assertEqual([len(s) for s in sealed], [len(v) + 28 for v in values])
+            self.assertEqual(self.service.decrypt_many(sealed, workers=3), values)
+
+    def test_tampered_value_rejected(self):
+        sealed = self.service.encrypt_many([b'a', b'b'], associated_data=b'tx')
+        with self.assertRaises(InvalidTag):
+            self.service.decrypt_many(sealed, associated_data=b'other')
+
+class _DictKeyStore:
+    def __init__(self):
+        self.keys = {}
+
+    def put(self, key_id, wrapped_key):
+        self.keys[key_id] = wrapped_key
+
+    def get(self, key_id):
+        return self.keys[key_id]
+
+class EnvelopeEncryptionTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.service = EncryptionService()
+        cls.service.private_key, cls.service.public_key = cls.service.generate_rsa_keypair(2048)
+
+    def setUp(self):
+        self.store = _DictKeyStore()
+        self.unwraps = 0
+
+        def unwrap(wrapped):
+            self.unwraps += 1
+            return self.service.decrypt_asymmetric(wrapped)
+
+        self.cipher = EnvelopeCipher(self.service.encrypt_asymmetric, unwrap, self.store, max_messages=3)
+
+    def test_roundtrip_with_associated_data(self):
+        envelope = self.cipher.encrypt(b'account 42', b'account:42')
+        self.assertEqual(self.cipher.decrypt(envelope, b'account:42'), b'account 42')
+        with self.assertRaises(InvalidTag):
+            self.cipher.decrypt(envelope, b'account:43')
+
+    def test_rotation_and_single_unwrap_per_key(self):
+        envelopes = [self.cipher.encrypt(b'record %d' % i) for i in range(7)]
+        self.assertEqual(len(self.store.keys), 3)
+        self.assertEqual(len({envelope_key_id(e) for e in envelopes}), 3)
+        # 另一进程：缓存为空，每个 DEK 只解包一次
+        reader = EnvelopeCipher(self.service.encrypt_asymmetric, self.cipher.unwrap, self.store)
+        for _ in range(2):
+            for i, envelope in enumerate(envelopes):
+                self.assertEqual(reader.decrypt(envelope), b'record %d' % i)
+        self.assertEqual(self.unwraps, 3)
+
+    def test_sql_key_store_does_not_commit_caller_session(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp.name, 'keys.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            cipher = EnvelopeCipher(self.service.encrypt_asymmetric, self.service.decrypt_asymmetric,
+                                    SQLDataKeyStore())
+            db.session.add(User(username='pending', password_hash='x'))
+            envelope = cipher.encrypt(b'account 42')
+            db.session.rollback()
+            # 调用方回滚：其变更未被提前提交，DEK 仍可用于解密
+            self.assertEqual(User.query.count(), 0)
+            self.assertEqual(DataKey.query.count(), 1)
+            cipher.cache.clear()
+            self.assertEqual(cipher.decrypt(envelope), b'account 42')
+            db.session.remove()
+            db.engine.dispose()
@@ -0,0 +1,201 @@
+import os
+import random
+import tempfile
+import unittest
+import threading
+from decimal import Decimal
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import event
+from models.transaction import db, Transaction
+from models.account import Account
+from cryptography.exceptions import InvalidTag
+from models.ledger import BalanceSnapshot, LedgerEntry
+from services.encryption import EncryptionService
+from services.ledger import LedgerCompactor, account_balance, account_balances, open_balance
+from services.transfer import TransferEngine, TransferError, InsufficientFunds, IdempotencyConflict
+from services.bulk_transfer import BulkTransferProcessor
+from db_case import DatabaseTestCase
+
+class LedgerTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in (1, 2, 3):
+            db.session.add(Account(id=i, owner=f'owner{i}', currency='CNY'))
+        db.session.flush()
+        self.encryption = EncryptionService()
+        self.encryption.symmetric_key = os.urandom(32)
+        open_balance(db.session, self.encryption, 1, Decimal('100.00'))
+        db.session.commit()
+        self.engine = TransferEngine(self.encryption)
+
+    def test_transfers_post_balanced_entries(self):
+        self.engine.transfer(1, 2, '30.00')
+        self.engine.transfer(2, 3, '10.50')
+        self.assertEqual(account_balances(self.encryption, [1, 2, 3]),
+                         {1: Decimal('70.00'), 2: Decimal('19.50'), 3: Decimal('10.50')})
+        with self.assertRaises(InsufficientFunds):
+            self.engine.transfer(3, 1, '10.51')
+        self.assertEqual(Transaction.query.count(), 2)
+
+    def test_idempotency_key(self):
+        first, created = self.engine.transfer(1, 2, '5.00', 'key-1')
+        again, replayed = self.engine.transfer(1, 2, '5.00', 'key-1')
+        self.assertTrue(created)
+        self.assertFalse(replayed)
+        self.assertEqual(first.id, again.id)
+        self.assertEqual(account_balance(self.encryption, 1), Decimal('95.00'))
+        with self.assertRaises(IdempotencyConflict):
+            self.engine.transfer(1, 2, '6.00', 'key-1')
+
+    def test_account_ids_are_normalized(self):
+        with self.assertRaisesRegex(TransferError, 'same account'):
+            self.engine.transfer('1', 1, '1.00')
+        with self.assertRaisesRegex(TransferError, 'Invalid account id'):
+            self.engine.transfer('abc', 2, '1.00')
+        with self.assertRaisesRegex(TransferError, 'Invalid account id'):
+            self.engine.transfer(0, 2, '1.00')
+
+        first, created = self.engine.transfer(1, 2, '5.00', 'key-ids')
+        # 字符串 ID 的重放与首次请求等价，不会被当成参数不同的冲突
+        again, replayed = self.engine.transfer('1', ' 2', '5.00', 'key-ids')
+        self.assertTrue(created)
+        self.assertFalse(replayed)
+        self.assertEqual(first.id, again.id)
+        self.assertEqual(first.from_account_id, 1)
+        self.assertEqual(account_balance(self.encryption, 1), Decimal('95.00'))
+
+    def test_amounts_are_encrypted_and_bound_to_rows(self):
+        self.engine.transfer(1, 2, '30.00')
+        entries = LedgerEntry.query.order_by(LedgerEntry.id).all()
+        snapshot = BalanceSnapshot.query.filter_by(account_id=1).one()
+        for value in [e.amount for e in entries] + [snapshot.balance]:
+            self.assertIsInstance(value, bytes)
+            self.assertNotIn(b'30.00', value)
+            self.assertNotIn(b'100.00', value)
+
+        # 把贷方分录挪到借方账户名下：AAD 不匹配，余额计算失败而不是静默改变
+        debit, credit = entries
+        db.session.delete(debit)
+        credit.account_id = 1
+        db.session.commit()
+        with self.assertRaises(InvalidTag):
+            account_balance(self.encryption, 1)
+
+    def test_compaction_rolls_snapshots_forward(self):
+        for _ in range(5):
+            self.engine.transfer(1, 2, '1.00')
+        before = account_balances(self.encryption, [1, 2])
+        compactor = LedgerCompactor(self.encryption, lag=0, min_entries=3)
+        later = datetime.utcnow() + timedelta(seconds=1)
+        self.assertEqual(compactor.compact(now=later), 2)
+        self.assertEqual(compactor.compact(now=later), 0)
+        self.engine.transfer(2, 1, '2.00')
+        self.assertEqual(account_balances(self.encryption, [1, 2]),
+                         {1: before[1] + 2, 2: before[2] - 2})
+        self.assertEqual(BalanceSnapshot.query.filter_by(account_id=2).count(), 1)
+
+    def test_hot_receiver_tail_is_bounded_by_default_lag(self):
+        # 热点收款账户：按默认参数压缩后，两分钟前的入账都已并入快照，扣款时只解密最近的分录
+        for _ in range(130):
+            self.engine.transfer(1, 2, '0.10')
+        now = datetime.utcnow()
+        entries = LedgerEntry.query.filter_by(account_id=2).order_by(LedgerEntry.id).all()
+        for entry in entries[:120]:
+            entry.created_at = now - timedelta(minutes=2)
+        db.session.commit()
+        self.assertEqual(LedgerCompactor(self.encryption).compact(now=now), 2)
+
+        decrypted = []
+        decrypt_many = self.encryption.decrypt_many
+        self.encryption.decrypt_many = lambda values, **kw: decrypted.extend(values) or decrypt_many(values, **kw)
+        self.assertEqual(account_balance(self.encryption, 2), Decimal('13.00'))
+        self.assertEqual(len(decrypted), 1 + 10)   # 快照 + 尚未压缩的分录
+
+class ConcurrentKeyedTransferTestCase(unittest.TestCase):
+    """多线程以相同幂等键并发转账（单笔与批量）：每个键只扣款一次且不透支
+
+    SQLite 没有行锁，以 BEGIN IMMEDIATE 取得库级写锁代替 FOR UPDATE。
+    """
+    THREADS = 6
+    KEYS = 30
+    AMOUNT = Decimal('5.00')
+
+    def setUp(self):
+        self.encryption = EncryptionService()
+        self.encryption.symmetric_key = os.urandom(32)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'ledger.db')}"
+        self.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30, 'check_same_thread': False}}
+        db.init_app(self.app)
+        with self.app.app_context():
+            @event.listens_for(db.engine, "connect")
+            def _connect(dbapi_connection, connection_record):
+                dbapi_connection.isolation_level = None
+
+            @event.listens_for(db.engine, "begin")
+            def _begin(connection):
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+            db.create_all()
+            db.session.add_all([Account(id=1, owner='owner1', currency='CNY'),
+                                Account(id=2, owner='owner2', currency='CNY')])
+            db.session.flush()
+            open_balance(db.session, self.encryption, 1, Decimal('100.00'))
+            db.session.commit()
+            db.session.remove()
+        self.engine = TransferEngine(self.encryption, max_retries=50)
+        self.processor = BulkTransferProcessor(self.engine, chunk_size=4)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        self.tmp.cleanup()
+
+    def _single(self, keys, outcomes):
+        with self.app.app_context():
+            for key in keys:
+                try:
+                    transaction, _ = self.engine.transfer(1, 2, self.AMOUNT, key)
+                    outcomes.append((key, transaction.id))
+                except InsufficientFunds:
+                    pass
+            db.session.remove()
+
+    def _bulk(self, keys, outcomes):
+        text = "from_account,to_account,amount,idempotency_key\n" + "".join(
+            f"1,2,{self.AMOUNT},{key}\n" for key in keys)
+        with self.app.app_context():
+            rows, _ = self.processor.prepare(text, 'csv')
+            for chunk in self.processor.process(rows):
+                for result in chunk:
+                    if result['status'] in ('completed', 'replayed'):
+                        outcomes.append((keys[result['row'] - 1], result['transaction_id']))
+            db.session.remove()
+
+    def test_each_key_debits_once_without_overdraft(self):
+        keys = [f'key-{i}' for i in range(self.KEYS)]
+        outcomes = []
+        threads = []
+        for i in range(self.THREADS):
+            shuffled = random.sample(keys, len(keys))
+            target = self._bulk if i % 3 == 0 else self._single
+            threads.append(threading.Thread(target=target, args=(shuffled, outcomes)))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        with self.app.app_context():
+            transactions = {t.idempotency_key: t.id for t in Transaction.query.all()}
+            balance = account_balance(self.encryption, 1)
+        self.assertEqual(len(transactions), 20)
+        self.assertEqual(balance, Decimal('100.00') - self.AMOUNT * len(transactions))
+        # 同一键的所有成功响应都指向同一笔交易
+        for key, transaction_id in outcomes:
+            self.assertEqual(transactions[key], transaction_id)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+from services.login_throttle import LoginThrottle
+
+class LoginThrottleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'throttle')
+        self.throttle = LoginThrottle(self.path, window=60, max_user_failures=3,
+                                      max_ip_failures=5, slots=64)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_user_is_throttled_after_failures(self):
+        for _ in range(3):
+            self.assertEqual(self.throttle.check('alice', '10.0.0.1'), 0)
+            self.throttle.record_failure('alice', '10.0.0.1')
+        self.assertGreater(self.throttle.check('alice', '10.0.0.2'), 0)
+        self.assertEqual(self.throttle.check('bob', '10.0.0.2'), 0)
+        stats = self.throttle.stats()
+        self.assertEqual(stats['evaluated'], 5)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['failed'], 3)
+
+    def test_ip_is_throttled_across_usernames(self):
+        for i in range(5):
+            self.throttle.record_failure(f'user{i}', '10.0.0.9')
+        self.assertGreater(self.throttle.check('someone', '10.0.0.9'), 0)
+        self.assertEqual(self.throttle.check('someone', '10.0.0.8'), 0)
+
+    def test_success_resets_user_and_counters_are_shared(self):
+        other_worker = LoginThrottle(self.path, window=60, max_user_failures=3,
+                                     max_ip_failures=5, slots=64)
+        for _ in range(3):
+            other_worker.record_failure('carol')
+        self.assertGreater(self.throttle.check('carol'), 0)
+        self.throttle.record_success('carol')
+        self.assertEqual(other_worker.check('carol'), 0)
+
+if __name__ == '__main__':
+    unittest.main()
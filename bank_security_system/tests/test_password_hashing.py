@@ -0,0 +1,45 @@
+import time
+import unittest
+from services.password_hashing import PasswordHasher, PasswordHashingBusy
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def test_needs_rehash_normalizes_configured_method(self):
+        hasher = PasswordHasher(method='scrypt', workers=0)
+        password_hash = hasher.hash('secret')
+        self.assertTrue(password_hash.startswith('scrypt:32768:8:1$'))
+        self.assertFalse(hasher.needs_rehash(password_hash))
+        self.assertTrue(hasher.needs_rehash(PasswordHasher(method='scrypt:16384:8:1', workers=0).hash('secret')))
+        self.assertTrue(hasher.needs_rehash('pbkdf2:sha256:1000$salt$hash'))
+
+    def test_timed_out_task_keeps_its_slot_until_it_finishes(self):
+        hasher = PasswordHasher(workers=1, max_pending=1, timeout=0.2)
+        self.addCleanup(hasher.shutdown)
+        self.assertEqual(hasher._run(abs, -1), 1)   # 预先启动工作进程
+        with self.assertRaisesRegex(PasswordHashingBusy, 'timed out'):
+            hasher._run(time.sleep, 1.0)
+        # 超时的任务仍在执行，名额尚未归还
+        with self.assertRaisesRegex(PasswordHashingBusy, 'saturated'):
+            hasher._run(abs, -2)
+        time.sleep(1.5)
+        self.assertEqual(hasher._run(abs, -3), 3)
+
+    def test_timed_out_queued_task_is_cancelled(self):
+        hasher = PasswordHasher(workers=1, max_pending=4, timeout=0.2)
+        self.addCleanup(hasher.shutdown)
+        self.assertEqual(hasher._run(abs, -1), 1)
+        pool = hasher._pool()
+        busy = pool.submit(time.sleep, 1.0)
+        # 进程池会把少量任务预先放入调用队列（无法取消），先用占位任务填满
+        filler = [pool.submit(abs, -i) for i in range(2)]
+        with self.assertRaisesRegex(PasswordHashingBusy, 'timed out'):
+            hasher._run(time.sleep, 5.0)
+        busy.result()
+        for future in filler:
+            future.result()
+        # 被取消的任务不会执行，名额随取消立即归还
+        started = time.monotonic()
+        self.assertEqual(hasher._run(abs, -4), 4)
+        self.assertLess(time.monotonic() - started, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import time
+import unittest
+from flask_jwt_extended import JWTManager, create_access_token
+from sqlalchemy import update
+from models.transaction import db
+from models.user import User
+from models.role import Role
+from models.permission import PermissionVersion, ResourceType, Action
+from services import permission_claims
+from services.permission_claims import (
+    GlobalPermissionVersion, build_claims, mask_from_bitmap, permission_version, token_allows, token_has_role
+)
+from services.permission_matrix import permission_matrix
+from db_case import DatabaseTestCase
+
+class PermissionClaimsTestCase(DatabaseTestCase):
+    CONFIG = {'JWT_SECRET_KEY': 'test-secret-key-of-32-bytes-long!'}
+
+    def setUp(self):
+        super().setUp()
+        JWTManager(self.app)
+        # 模块级缓存在各测试之间共享
+        permission_version.invalidate()
+        permission_matrix.invalidate()
+        permission_claims._fallback.entries.clear()
+
+        self.teller = Role(name='teller')
+        self.teller.add_permission(ResourceType.TRANSACTION, Action.READ.bit | Action.CREATE.bit)
+        self.auditor = Role(name='auditor', parent=self.teller)
+        self.auditor.add_permission(ResourceType.AUDIT_LOG, Action.READ.bit)
+        self.user = User(username='alice', password_hash='x', roles=[self.auditor])
+        db.session.add(self.user)
+        db.session.commit()
+
+    def _version(self):
+        return db.session.query(PermissionVersion.version).filter_by(id=1).scalar()
+
+    def _request(self, claims=None):
+        token = create_access_token(identity=str(self.user.id), additional_claims=claims or build_claims(self.user))
+        return self.app.test_request_context(headers={'Authorization': f'Bearer {token}'})
+
+    def test_build_claims_includes_inherited_permissions(self):
+        claims = build_claims(self.user)
+        self.assertEqual(claims['roles'], ['auditor'])
+        self.assertEqual(claims['pv'], self._version())
+        self.assertEqual(mask_from_bitmap(claims['perm'], ResourceType.TRANSACTION), Action.READ.bit | Action.CREATE.bit)
+        self.assertEqual(mask_from_bitmap(claims['perm'], ResourceType.AUDIT_LOG), Action.READ.bit)
+        self.assertEqual(mask_from_bitmap(claims['perm'], ResourceType.ACCOUNT), 0)
+
+    def test_token_allows(self):
+        with self._request():
+            self.assertTrue(token_allows('transaction', 'create'))
+            self.assertTrue(token_allows(ResourceType.AUDIT_LOG, Action.READ))
+            self.assertFalse(token_allows('transaction', 'delete'))
+            self.assertFalse(token_allows('no_such_resource', 'read'))
+            self.assertFalse(token_allows('transaction', 'no_such_action'))
+            self.assertTrue(token_has_role('auditor'))
+            self.assertFalse(token_has_role(['teller', 'admin']))
+
+    def test_role_changes_bump_version_in_same_transaction(self):
+        version = self._version()
+        self.teller.add_permission(ResourceType.ACCOUNT, Action.READ.bit)
+        db.session.commit()
+        self.assertEqual(self._version(), version + 1)
+        self.assertEqual(permission_version.current(), version + 1)   # 提交后本进程缓存随即失效
+
+        self.user.roles.append(self.teller)
+        db.session.commit()
+        self.assertEqual(self._version(), version + 2)
+
+        # 回滚的变更不递增版本号
+        self.teller.description = 'changed'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self._version(), version + 2)
+
+        # 与角色无关的变更不递增
+        self.user.username = 'alice2'
+        db.session.commit()
+        self.assertEqual(self._version(), version + 2)
+
+    def test_stale_token_falls_back_to_database(self):
+        stale = build_claims(self.user)
+        self.auditor.permissions[0].allowed_actions = 0   # 撤销审计日志读取
+        db.session.commit()
+        with self._request(stale):
+            self.assertFalse(token_allows('audit_log', 'read'))
+            self.assertTrue(token_allows('transaction', 'read'))
+        key = (str(self.user.id), self._version())
+        self.assertIn(key, permission_claims._fallback.entries)
+
+        # 同一 (用户, 版本) 的回源结果来自缓存，不再查询数据库
+        permission_claims._fallback.entries[key] = dict(permission_claims._fallback.entries[key], perm=0)
+        with self._request(stale):
+            self.assertFalse(token_allows('transaction', 'read'))
+
+        # 新签发的令牌版本不落后，直接使用令牌
+        with self._request():
+            self.assertTrue(token_allows('transaction', 'read'))
+
+    def test_version_cache_refresh_interval(self):
+        version = GlobalPermissionVersion(refresh_interval=0.2)
+        current = version.current()
+        # 其他进程提交的变更：本进程未收到提交事件，缓存到期前仍返回旧版本
+        db.session.execute(update(PermissionVersion).where(PermissionVersion.id == 1)
+                           .values(version=PermissionVersion.version + 1))
+        db.session.commit()
+        self.assertEqual(version.current(), current)
+        time.sleep(0.3)
+        self.assertEqual(version.current(), current + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from models.transaction import db
+from models.role import Role
+from models.permission import ResourceType, Action
+from services.permission_matrix import PermissionMatrix, RoleHierarchyCycleError, permission_matrix
+from db_case import DatabaseTestCase
+
+READ, UPDATE, APPROVE = Action.READ.bit, Action.UPDATE.bit, Action.APPROVE.bit
+
+class PermissionMatrixTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        permission_matrix.invalidate()
+
+        # teller <- supervisor <- manager 三级继承
+        self.teller = Role(name='teller')
+        self.teller.add_permission(ResourceType.TRANSACTION, READ)
+        self.supervisor = Role(name='supervisor', parent=self.teller)
+        self.supervisor.add_permission(ResourceType.TRANSACTION, APPROVE)
+        self.manager = Role(name='manager', parent=self.supervisor)
+        self.manager.add_permission(ResourceType.ACCOUNT, UPDATE)
+        db.session.add(self.manager)
+        db.session.commit()
+
+    def test_compile_expands_inherited_permissions(self):
+        table = PermissionMatrix.compile()
+        self.assertEqual(table[self.teller.id], {ResourceType.TRANSACTION: READ})
+        self.assertEqual(table[self.supervisor.id], {ResourceType.TRANSACTION: READ | APPROVE})
+        self.assertEqual(table[self.manager.id], {ResourceType.TRANSACTION: READ | APPROVE, ResourceType.ACCOUNT: UPDATE})
+
+        self.assertTrue(permission_matrix.allows((self.manager.id,), ResourceType.TRANSACTION, Action.READ))
+        self.assertFalse(permission_matrix.allows((self.teller.id,), ResourceType.TRANSACTION, Action.APPROVE))
+        self.assertTrue(permission_matrix.allows((self.teller.id, self.supervisor.id), ResourceType.TRANSACTION, Action.APPROVE))
+        self.assertEqual(permission_matrix.role_mask(self.manager.id, ResourceType.ACCOUNT), UPDATE)
+        self.assertTrue(self.manager.has_permission(ResourceType.ACCOUNT, Action.UPDATE))
+
+    def test_cycle_is_rejected_on_flush(self):
+        self.teller.parent = self.manager
+        with self.assertRaises(RoleHierarchyCycleError):
+            db.session.flush()
+        db.session.rollback()
+        self.assertIsNone(db.session.get(Role, self.teller.id).parent_id)
+
+        self.teller.parent_id = self.teller.id
+        with self.assertRaises(RoleHierarchyCycleError):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_commit_invalidates_compiled_table(self):
+        table = permission_matrix.table()
+        self.assertIs(permission_matrix.table(), table)   # 未变更时复用已编译的表
+        version = permission_matrix.version
+
+        self.teller.add_permission(ResourceType.AUDIT_LOG, READ)
+        db.session.flush()
+        self.assertIs(permission_matrix.table(), table)   # flush 之后、提交之前不失效
+        db.session.commit()
+        self.assertEqual(permission_matrix.version, version + 1)
+        self.assertTrue(permission_matrix.allows((self.manager.id,), ResourceType.AUDIT_LOG, Action.READ))
+
+        # 回滚的变更不使缓存失效
+        table = permission_matrix.table()
+        self.teller.permissions[0].allowed_actions = 0
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(permission_matrix.version, version + 1)
+        self.assertIs(permission_matrix.table(), table)
+
+    def test_stale_table_recompiled_for_newer_version(self):
+        matrix = PermissionMatrix(max_age=3600)
+        table = matrix.table(min_version=1)
+        self.assertIs(matrix.table(min_version=1), table)
+        self.assertIsNot(matrix.table(min_version=2), table)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import time
+import tempfile
+import unittest
+from flask import Flask
+from models.transaction import db
+from models.user import User
+from models.revoked_token import RevokedToken
+from services.token_revocation import BloomFilter, FileRevocationStore, SQLRevocationStore, TokenRevocationList
+
+class TokenRevocationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = FileRevocationStore(os.path.join(self.tmp.name, 'revoked'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"jti-{i}")
+        self.assertTrue(all(f"jti-{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_revocation_shared_between_workers(self):
+        exp = time.time() + 60
+        worker_a = TokenRevocationList(self.store, refresh_interval=0)
+        worker_b = TokenRevocationList(self.store, refresh_interval=0)
+        self.assertFalse(worker_b.is_revoked("token-1"))
+        worker_a.revoke("token-1", exp)
+        self.assertTrue(worker_a.is_revoked("token-1"))
+        self.assertTrue(worker_b.is_revoked("token-1"))
+        self.assertFalse(worker_b.is_revoked("token-2"))
+
+    def test_expired_entries_are_ignored_and_purged(self):
+        self.store.add("old", time.time() - 1)
+        self.store.add("live", time.time() + 60)
+        self.assertFalse(self.store.contains("old"))
+        self.assertEqual(self.store.active_since(), ["live"])
+        self.assertEqual(self.store.purge_expired(), 1)
+        self.assertTrue(self.store.contains("live"))
+
+    def test_sql_store_leaves_caller_session_alone(self):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmp.name, 'tokens.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            store = SQLRevocationStore()
+            db.session.add(User(username='pending', password_hash='x'))
+            store.add("old", time.time() - 1)
+            store.add("live", time.time() + 60)
+            self.assertEqual(store.purge_expired(), 1)
+            db.session.rollback()
+            # 撤销记录已独立提交，请求会话中的变更未被提前提交
+            self.assertEqual(User.query.count(), 0)
+            self.assertEqual([t.jti for t in RevokedToken.query], ["live"])
+            self.assertTrue(store.contains("live"))
+            db.session.remove()
+            db.engine.dispose()
+
+if __name__ == '__main__':
+    unittest.main()
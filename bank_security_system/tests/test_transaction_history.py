@@ -0,0 +1,54 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+from models.transaction import db, Transaction
+from models.account import Account
+from services.transaction_history import TransactionHistoryQuery
+from db_case import DatabaseTestCase
+
+class TransactionHistoryTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(1, 4):
+            db.session.add(Account(id=i, owner=f'owner{i}', currency='CNY'))
+        base = datetime(2024, 1, 1)
+        rng = random.Random(7)
+        self.rows = []
+        for i in range(1, 301):
+            from_id, to_id = rng.choice([(1, 2), (2, 1), (1, 3), (2, 3), (1, 1)])
+            self.rows.append(Transaction(
+                id=i, from_account_id=from_id, to_account_id=to_id, amount=b'x', status='completed',
+                created_at=base + timedelta(minutes=rng.randint(0, 60))
+            ))
+        db.session.add_all(self.rows)
+        db.session.commit()
+
+    def _pages(self, **kwargs):
+        ids, cursor = [], None
+        while True:
+            query = TransactionHistoryQuery(1, cursor=cursor, **kwargs)
+            for rows in query.iter_batches(db.session, batch_size=10):
+                ids += [row.id for row in rows]
+            cursor = query.next_cursor
+            if not cursor:
+                return ids
+
+    def test_pages_cover_both_directions_in_order(self):
+        expected = sorted(
+            (r for r in self.rows if 1 in (r.from_account_id, r.to_account_id)),
+            key=lambda r: (r.created_at, r.id), reverse=True
+        )
+        self.assertEqual(self._pages(limit=37), [r.id for r in expected])
+
+    def test_date_range_and_limit_cap(self):
+        start, end = datetime(2024, 1, 1, 0, 20), datetime(2024, 1, 1, 0, 40)
+        expected = {r.id for r in self.rows
+                    if 1 in (r.from_account_id, r.to_account_id) and start <= r.created_at < end}
+        self.assertEqual(set(self._pages(limit=25, start=start, end=end)), expected)
+        with self.assertRaises(ValueError):
+            TransactionHistoryQuery(1, limit=100000)
+        with self.assertRaises(ValueError):
+            TransactionHistoryQuery(1, cursor='not-a-cursor')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from models.transaction import db
+from models.user import User
+from models.role import Role
+from services.user_query import UserListQuery, serialize
+from db_case import DatabaseTestCase
+
+class UserListQueryTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        teller, admin = Role(name='teller'), Role(name='admin')
+        base = datetime(2024, 1, 1)
+        for i in range(1, 51):
+            roles = [teller] if i % 2 else [teller, admin]
+            # 每 5 个用户共用一个创建时间，验证游标的 id 决胜
+            db.session.add(User(id=i, username=f'user{i}', password_hash='x',
+                                created_at=base + timedelta(days=i // 5), roles=roles))
+        db.session.commit()
+        db.session.expire_all()
+
+    def _all(self, **kwargs):
+        ids, cursor = [], None
+        while True:
+            query = UserListQuery(limit=7, cursor=cursor, **kwargs)
+            ids += [user.id for user in query.page()]
+            cursor = query.next_cursor
+            if cursor is None:
+                return ids
+
+    def test_keyset_pages_cover_all_users(self):
+        self.assertEqual(self._all(), list(range(50, 0, -1)))
+        self.assertEqual(self._all(role='admin'), list(range(50, 0, -2)))
+        self.assertEqual(self._all(start=datetime(2024, 1, 3), end=datetime(2024, 1, 5)),
+                         list(range(19, 9, -1)))
+
+    def test_roles_loaded_without_n_plus_one(self):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            users = [serialize(user) for user in UserListQuery(limit=20).page()]
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(len(statements), 2)
+        self.assertNotIn('password_hash', statements[0])
+        self.assertEqual(users[0]['roles'], ['admin', 'teller'])
+
+    def test_export_iterates_in_batches(self):
+        ids = [user.id for user in UserListQuery(role='teller').iter_all(batch_size=8)]
+        self.assertEqual(ids, list(range(50, 0, -1)))
+
+if __name__ == '__main__':
+    unittest.main()